@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+统一命令行入口: bandit <子命令>
+
+    run     全量实验（等同 run_fixed.py）
+    plan    干跑规划：预测剩余调用、token、费用与完成时间
+    status  查看进度
+    report  重新生成 final_summary.md
+    plot    生成 quick start 实验图
+    compare 由 results/ 下的JSONL增量生成多模型对比图
+    ingest  把 results/ 下的JSONL增量导入 SQLite (results/results.db)
+    query   在 results.db 上按条件分组汇总或执行SQL
+    batch   策略B代码生成的离线批量推理（prepare / local / ingest）
+    bench   对比各入口的启动耗时
+    replay  离线回放 cassette 重算实验
+
+模块顶层只导入标准库；openai / yaml / numpy / matplotlib 在子命令内部按需导入，
+status 等轻量命令无需承担完整的导入开销。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+
+def _use_root(args):
+    """把 run_fixed 的根目录/结果目录指向 --root（默认当前目录）"""
+    import run_fixed
+    root = Path(args.root).resolve()
+    run_fixed.SCRIPT_DIR = root
+    run_fixed.RESULTS_DIR = root / "results"
+    return run_fixed
+
+
+def cmd_run(args, extra):
+    run_fixed = _use_root(args)
+    run_fixed.main(extra)
+
+
+def cmd_plan(args, extra):
+    run_fixed = _use_root(args)
+    run_fixed.main(["--plan"] + extra)
+
+
+def cmd_replay(args, extra):
+    run_fixed = _use_root(args)
+    run_fixed.main(["--cassette", "replay"] + extra)
+
+
+def cmd_report(args, extra):
+    import yaml
+    run_fixed = _use_root(args)
+    root = Path(args.root).resolve()
+    with open(root / "config.yaml", "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    models = [m for m in config['models'] if m.get('enabled', True)]
+    run_fixed.generate_final_report(config, models, run_fixed.TASKS, time.time())
+
+
+def cmd_plot(args, extra):
+    import runpy
+    script = Path(args.root).resolve() / "quick start" / "generate_plots.py"
+    sys.argv = [str(script)] + extra
+    runpy.run_path(str(script), run_name="__main__")
+
+
+def cmd_compare(args, extra):
+    import plot_results
+    results_dir = Path(args.root).resolve() / "results"
+    plot_results.main(["--results_dir", str(results_dir)] + extra)
+
+
+def _db_path(args):
+    root = Path(args.root).resolve()
+    return Path(args.db) if args.db else root / "results" / "results.db"
+
+
+def cmd_ingest(args, extra):
+    from utils.results_db import ResultsDB
+    results_dir = Path(args.root).resolve() / "results"
+    t0 = time.perf_counter()
+    with ResultsDB(_db_path(args)) as db:
+        added, changed = db.ingest(results_dir)
+        total = db.sql("SELECT COUNT(*) FROM records")[1][0][0]
+    print(f"新增记录 {added} 条（{changed} 个文件有变化）| 共 {total} 条 | "
+          f"{(time.perf_counter() - t0) * 1000:.0f} ms | {_db_path(args)}")
+
+
+def cmd_query(args, extra):
+    from utils.results_db import ResultsDB, format_table
+    if not args.no_ingest:
+        # 查询前先补导新增行，保证结果是最新的
+        with ResultsDB(_db_path(args)) as db:
+            db.ingest(Path(args.root).resolve() / "results")
+    with ResultsDB(_db_path(args), readonly=True) as db:
+        if args.sql:
+            columns, rows = db.sql(args.sql)
+        else:
+            by = [c.strip() for c in args.by.split(",") if c.strip()]
+            columns, rows = db.summary(where=args.where, by=by)
+    print(format_table(columns, rows))
+
+
+def cmd_batch(args, extra):
+    """prepare 写批量输入；local 用本地替身处理器生成输出；ingest 把输出导入策略库（复用模式）"""
+    import yaml
+    from utils.param_generator import ParamGenerator
+    from strategy_b_with_interpreter import batch_codegen
+    from strategy_b_with_interpreter.policy_store import PolicyStore
+
+    root = Path(args.root).resolve()
+    with open(root / "config.yaml", "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    exp_cfg = config['experiment']
+    policy_cfg = exp_cfg.get('policy_store', {})
+    if policy_cfg.get('mode') != 'reuse':
+        print("提示: 批量生成的代码只在 policy_store.enabled=true、mode=reuse 时被实验复用")
+    store_dir = root / "results" / policy_cfg.get('path', 'policies')
+    if args.allow_reference:
+        # 参考策略不是模型生成的代码，只导入单独的策略库，实验不会复用
+        store_dir = store_dir.with_name(store_dir.name + "_reference")
+    store = PolicyStore(store_dir, mode='reuse', dry_rounds=policy_cfg.get('dry_rounds', 20))
+    batch_dir = root / "results" / "batch"
+    input_path = Path(args.input) if args.input else batch_dir / "codegen_input.jsonl"
+    output_path = Path(args.output) if args.output else batch_dir / "codegen_output.jsonl"
+
+    if args.action == "prepare":
+        all_params = ParamGenerator(exp_cfg, seed=exp_cfg['seed']).generate_all_params(exp_cfg['n_param_groups'])
+        model_ids = [m['model_id'] for m in config['models'] if m.get('enabled', True)]
+        variants = {(p['n_arms'], 'sleep_prob' in p) for params in all_params.values() for p in params}
+        pending = batch_codegen.pending_codegen(store, model_ids, variants)
+        n = batch_codegen.write_batch_input(input_path, pending, candidates=args.candidates)
+        print(f"待生成 (模型, 臂数, 是否休眠) {len(pending)} 个 | 写入请求 {n} 条 -> {input_path}")
+    elif args.action == "local":
+        client = None
+        if args.online:
+            from openai import OpenAI
+            client = OpenAI(api_key=config['volcengine']['api_key'], base_url=config['volcengine']['base_url'])
+        n = batch_codegen.process_locally(input_path, output_path, client=client)
+        print(f"本地处理 {n} 条（{'交互接口' if client else '参考策略'}）-> {output_path}")
+    else:
+        stats = batch_codegen.ingest_batch_output(output_path, store, allow_reference=args.allow_reference)
+        print(f"导入: 通过验证 {stats['valid']} | 未通过 {stats['invalid']} | "
+              f"请求失败 {stats['errors']} | 提示词已过期 {stats['stale']} | 策略库 {store.base_dir}")
+        if stats['reference']:
+            print(f"跳过参考策略输出 {stats['reference']} 条（非模型生成；测试时用 --allow_reference 导入单独的策略库）")
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+
+
+def _model_dir(model_name):
+    """模型结果目录名，与 run_fixed.task_jsonl_file 一致"""
+    return model_name.replace('/', '_').replace('\\', '_')
+
+
+def cmd_status(args, extra):
+    """只读 progress*.json、租约完成标记和JSONL行数，不导入任何第三方库"""
+    from utils.lease import done_units
+    results_dir = Path(args.root).resolve() / "results"
+    completed, parked = set(), {}
+    for progress_file in sorted(results_dir.glob("progress*.json")):
+        with open(progress_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        completed.update(data.get("completed", []))
+        parked.update(data.get("parked", {}))
+    lease_dir = results_dir / "leases"
+    if lease_dir.exists():
+        completed |= done_units(lease_dir)
+
+    # 单元ID为 模型|任务|参数组[|内容键]；按模型目录名归并，与JSONL记录对齐，
+    # 旧版完成标记还原出的模型名也是目录名形式，归并后不重复计数
+    units = set()
+    for uid in completed:
+        model, rest = uid.split("|", 1)
+        units.add(f"{_model_dir(model)}|{rest}")
+    groups = defaultdict(int)
+    for uid in units:
+        model, task = uid.split("|")[:2]
+        groups[(model, task)] += 1
+
+    records = defaultdict(int)
+    for jsonl_file in results_dir.glob("*/*.jsonl"):
+        task = jsonl_file.name.split(".")[0]
+        records[(jsonl_file.parent.name, task)] += _count_lines(jsonl_file)
+
+    keys = sorted(set(groups) | set(records))
+    print(f"结果目录: {results_dir}")
+    print(f"{'模型':<24} {'任务':<22} {'完成组':>6} {'记录数':>6}")
+    for model, task in keys:
+        print(f"{model:<24} {task:<22} {groups[(model, task)]:>6} {records[(model, task)]:>6}")
+    print(f"合计: 完成组 {len(units)} | 记录 {sum(records.values())} | 暂存待补跑 {len(parked)}")
+
+
+def cmd_bench(args, extra):
+    """多次启动子进程，取中位耗时，对比 bandit status 与旧脚本的导入开销"""
+    root = str(Path(args.root).resolve())
+    cases = [
+        ("bandit status", [sys.executable, "-m", "cli", "--root", root, "status"]),
+        ("import run_fixed", [sys.executable, "-c", "import run_fixed"]),
+        ("run_experiment.py --help", [sys.executable, os.path.join(root, "quick start", "run_experiment.py"), "--help"]),
+        ("import generate_plots", [sys.executable, "-c", "import runpy; runpy.run_path('quick start/generate_plots.py')"]),
+    ]
+    cli_dir = str(Path(__file__).resolve().parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [cli_dir, os.environ.get("PYTHONPATH")])))
+    print(f"{'命令':<28} {'中位耗时(ms)':>12}")
+    for name, cmd in cases:
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            proc = subprocess.run(cmd, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append(time.perf_counter() - t0)
+        status = "" if proc.returncode == 0 else f"  (退出码 {proc.returncode})"
+        print(f"{name:<28} {statistics.median(times) * 1000:>12.1f}{status}")
+
+
+COMMANDS = {
+    "run": (cmd_run, "全量实验，其余参数透传给 run_fixed"),
+    "plan": (cmd_plan, "干跑规划，其余参数透传给 run_fixed（如 --workers 100）"),
+    "status": (cmd_status, "查看进度"),
+    "report": (cmd_report, "重新生成 final_summary.md"),
+    "plot": (cmd_plot, "生成 quick start 实验图"),
+    "compare": (cmd_compare, "多模型对比图，其余参数透传给 plot_results"),
+    "ingest": (cmd_ingest, "增量导入结果到 SQLite"),
+    "query": (cmd_query, "查询结果库"),
+    "batch": (cmd_batch, "策略B代码生成的离线批量推理"),
+    "bench": (cmd_bench, "对比各入口启动耗时"),
+    "replay": (cmd_replay, "离线回放 cassette，其余参数透传给 run_fixed"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bandit", description="LLM Bandit 评测基准命令行")
+    parser.add_argument("--root", type=str, default=".",
+                        help="项目根目录（含 config.yaml 与 results/，默认: 当前目录）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        p = sub.add_parser(name, help=help_text)
+        if name == "bench":
+            p.add_argument("--repeat", type=int, default=5, help="每个命令启动次数 (默认: 5)")
+        if name in ("ingest", "query"):
+            p.add_argument("--db", type=str, default=None,
+                           help="数据库路径 (默认: results/results.db)")
+        if name == "batch":
+            p.add_argument("action", choices=["prepare", "local", "ingest"],
+                           help="prepare 写输入文件 / local 本地替身处理 / ingest 导入输出文件")
+            p.add_argument("--input", type=str, default=None,
+                           help="批量输入文件 (默认: results/batch/codegen_input.jsonl)")
+            p.add_argument("--output", type=str, default=None,
+                           help="批量输出文件 (默认: results/batch/codegen_output.jsonl)")
+            p.add_argument("--candidates", type=int, default=1,
+                           help="每个 (模型, 臂数) 的候选代码数 (默认: 1)")
+            p.add_argument("--online", action="store_true",
+                           help="local 时逐条调用 config.yaml 中的交互接口，而非返回参考策略")
+            p.add_argument("--allow_reference", action="store_true",
+                           help="仅供测试：ingest 时导入参考策略输出，写入单独的 <策略库>_reference 目录")
+        if name == "query":
+            p.add_argument("--where", type=str, default=None,
+                           help='SQL条件，如 "n_arms >= 8 AND sigma > 1.5"')
+            p.add_argument("--by", type=str, default="model",
+                           help="分组列，逗号分隔 (默认: model；可选 model,task,grp,rep,n_arms,mean_low,mean_high,sigma)")
+            p.add_argument("--sql", type=str, default=None,
+                           help="直接执行SQL（表: records），忽略 --where/--by")
+            p.add_argument("--no_ingest", action="store_true",
+                           help="查询前不补导新增记录")
+    args, extra = parser.parse_known_args(argv)
+    COMMANDS[args.command][0](args, extra)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+多模型对比图：直接读取 results/<模型>/<任务>.jsonl（含分片文件）
+
+    compare_<任务>.png   各模型策略A/B平均累积奖励 + 各参数组平均提升的分布
+    heatmap_<模型>.png   参数组 × 任务的平均提升热力图
+
+与 final_summary.md 统计同一批记录：只取当前配置内容键下的记录（旧版无键记录保留），
+同一 (参数组, 重复) 只保留最后一条。
+JSONL只追加写入，按文件大小与mtime缓存每个 (参数组, 重复, 内容键) 的最后一条记录（规模以网格为上限，
+不随重写次数增长）：文件变大时从上次读到的偏移继续读，变小或被替换时整体重读；
+每个面板记录其输入聚合量的摘要，只重画输入有变化的面板。
+"""
+import argparse
+import hashlib
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.absolute()
+RESULTS_DIR = SCRIPT_DIR / "results"
+CACHE_VERSION = 2
+
+
+def _fold(entry, record, pos):
+    """记下该 (参数组, 重复, 内容键) 的最新一条记录；pos 为该行在文件中的偏移，用于跨键比较先后"""
+    slot = f"{record['group']}|{record['repeat']}|{record.get('key', '')}"
+    entry['records'][slot] = [pos, record['a_reward'], record['b_reward'], record['improvement']]
+
+
+def _select(entries, current):
+    """
+    按文件顺序合并多个文件的记录：丢弃内容键不是当前键的记录，同一 (参数组, 重复) 保留最后一条
+
+    Args:
+        entries: 同一 (模型, 任务) 的文件缓存，顺序同 iter_task_records（主文件在前，分片按名排序）
+        current: 参数组 -> 当前内容键；None 表示不按键筛选
+
+    Returns:
+        {(参数组, 重复): (a_reward, b_reward, improvement)}
+    """
+    latest = {}
+    for file_idx, entry in enumerate(entries):
+        for slot, (pos, a, b, imp) in entry['records'].items():
+            group, repeat, key = slot.split('|', 2)
+            if key and current is not None and key != current.get(group):
+                continue
+            order = (file_idx, pos)
+            if (group, repeat) not in latest or latest[(group, repeat)][0] < order:
+                latest[(group, repeat)] = (order, (a, b, imp))
+    return {k: v for k, (_, v) in latest.items()}
+
+
+def _aggregate(records):
+    """固定大小的面板输入：A/B奖励的矩，及每个参数组的提升均值"""
+    agg = {'n': len(records), 'a_sum': 0.0, 'a_sumsq': 0.0, 'b_sum': 0.0, 'b_sumsq': 0.0}
+    groups = defaultdict(list)
+    for (group, _), (a, b, imp) in sorted(records.items()):
+        agg['a_sum'] += a
+        agg['a_sumsq'] += a * a
+        agg['b_sum'] += b
+        agg['b_sumsq'] += b * b
+        groups[group].append(imp)
+    agg['group_means'] = {g: sum(v) / len(v) for g, v in groups.items()}
+    return agg
+
+
+def _digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {'version': CACHE_VERSION, 'files': {}, 'panels': {}}
+
+
+def save_cache(path, cache):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def update_file(entry, path):
+    """
+    增量更新单个JSONL文件的记录表
+
+    Returns:
+        (新entry, 是否有变化)
+    """
+    st = os.stat(path)
+    if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+        return entry, False
+    if not entry or st.st_size <= entry['size']:
+        # 新文件，或没有变大（被截断/改写）：从头读
+        entry = {'offset': 0, 'records': {}}
+    with open(path, 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read()
+    # 只消费完整的行，写入中的半行留到下次
+    end = data.rfind(b'\n') + 1
+    pos = entry['offset']
+    for line in data[:end].splitlines(keepends=True):
+        if line.strip():
+            try:
+                _fold(entry, json.loads(line), pos)
+            except (ValueError, KeyError):
+                pass
+        pos += len(line)
+    entry['offset'] += end
+    entry['size'] = st.st_size
+    entry['mtime_ns'] = st.st_mtime_ns
+    return entry, True
+
+
+def current_keys(config):
+    """
+    当前配置下各 (模型目录, 任务) 的 参数组 -> 内容键，与 generate_final_report 的筛选一致
+    """
+    from run_fixed import TASKS, task_jsonl_file, unit_key_for
+    from utils.param_generator import ParamGenerator
+
+    exp_cfg = config['experiment']
+    all_params = ParamGenerator(exp_cfg, seed=exp_cfg['seed']).generate_all_params(exp_cfg['n_param_groups'])
+    keys = {}
+    for model_info in config['models']:
+        if not model_info.get('enabled', True):
+            continue
+        for task_id, task_key in TASKS:
+            model_dir = task_jsonl_file(model_info['name'], task_id).parent.name
+            keys[(model_dir, task_id)] = {
+                str(group_idx): unit_key_for(model_info, task_id, params, exp_cfg)
+                for group_idx, params in enumerate(all_params[task_key])
+            }
+    return keys
+
+
+def scan(results_dir, cache, current=None):
+    """
+    扫描结果目录，返回 {(模型, 任务): 聚合量}
+
+    Args:
+        current: current_keys 的结果；给出时只统计其中的 (模型, 任务) 且只取当前内容键下的记录
+    """
+    seen = set()
+    per_unit = defaultdict(list)
+    changed = 0
+    # 主文件 <任务>.jsonl 排在其分片 <任务>.shard-*.jsonl 之前，与报告的合并顺序一致
+    paths = sorted(Path(results_dir).glob('*/*.jsonl'),
+                   key=lambda p: (p.parent.name, p.name.split('.')[0], p.name.count('.') > 1, p.name))
+    for path in paths:
+        key = str(path.relative_to(results_dir))
+        entry, dirty = update_file(cache['files'].get(key), path)
+        cache['files'][key] = entry
+        changed += dirty
+        seen.add(key)
+        task = path.name.split('.')[0]
+        per_unit[(path.parent.name, task)].append(entry)
+    for key in set(cache['files']) - seen:
+        del cache['files'][key]
+    units = {}
+    for unit, entries in per_unit.items():
+        if current is not None and unit not in current:
+            continue
+        units[unit] = _aggregate(_select(entries, current[unit] if current is not None else None))
+    return units, changed
+
+
+def _mean_std(s, sq, n):
+    mean = s / n
+    return mean, max(sq / n - mean * mean, 0.0) ** 0.5
+
+
+def render_task(task, by_model, output_path):
+    """单个任务：各模型A/B平均奖励柱状图 + 提升百分比箱线图"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    models = sorted(by_model)
+    x = np.arange(len(models))
+    a_stats = [_mean_std(by_model[m]['a_sum'], by_model[m]['a_sumsq'], by_model[m]['n']) for m in models]
+    b_stats = [_mean_std(by_model[m]['b_sum'], by_model[m]['b_sumsq'], by_model[m]['n']) for m in models]
+
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+    width = 0.38
+    ax1.bar(x - width / 2, [s[0] for s in a_stats], width, yerr=[s[1] for s in a_stats],
+            color="#ff6666", capsize=4, label='Strategy A: No Code')
+    ax1.bar(x + width / 2, [s[0] for s in b_stats], width, yerr=[s[1] for s in b_stats],
+            color="#66cc66", capsize=4, label='Strategy B: Interpreter')
+    ax1.set_xticks(x)
+    ax1.set_xticklabels(models, rotation=30, ha='right', fontsize=9)
+    ax1.set_title("Final Cumulative Reward", fontsize=12, fontweight='bold')
+    ax1.set_ylabel("Cumulative Reward", fontsize=11)
+    ax1.legend(fontsize=10)
+    ax1.grid(axis='y', alpha=0.3)
+
+    ax2.boxplot([list(by_model[m]['group_means'].values()) for m in models], showfliers=False)
+    ax2.axhline(0, color='gray', linewidth=1, linestyle='--')
+    ax2.set_xticks(x + 1)
+    ax2.set_xticklabels(models, rotation=30, ha='right', fontsize=9)
+    ax2.set_title("Improvement of B over A (%), per param group", fontsize=12, fontweight='bold')
+    ax2.set_ylabel("Improvement (%)", fontsize=11)
+    ax2.grid(axis='y', alpha=0.3)
+
+    fig.suptitle(task, fontsize=14, fontweight='bold')
+    fig.tight_layout()
+    _save(fig, output_path)
+
+
+def render_model(model, by_task, output_path):
+    """单个模型：参数组 × 任务的平均提升热力图"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    tasks = sorted(by_task)
+    groups = sorted({int(g) for agg in by_task.values() for g in agg['group_means']})
+    grid = np.full((len(groups), len(tasks)), np.nan)
+    for j, task in enumerate(tasks):
+        for i, g in enumerate(groups):
+            if str(g) in by_task[task]['group_means']:
+                grid[i, j] = by_task[task]['group_means'][str(g)]
+
+    fig, ax = plt.subplots(figsize=(2 + 1.6 * len(tasks), 1.5 + 0.45 * len(groups)))
+    limit = np.nanmax(np.abs(grid)) if np.isfinite(grid).any() else 1.0
+    im = ax.imshow(grid, cmap='RdYlGn', vmin=-limit, vmax=limit, aspect='auto')
+    ax.set_xticks(range(len(tasks)))
+    ax.set_xticklabels(tasks, rotation=30, ha='right', fontsize=9)
+    ax.set_yticks(range(len(groups)))
+    ax.set_yticklabels([f"group {g}" for g in groups], fontsize=9)
+    for i in range(len(groups)):
+        for j in range(len(tasks)):
+            if np.isfinite(grid[i, j]):
+                ax.text(j, i, f"{grid[i, j]:.0f}", ha='center', va='center', fontsize=8)
+    fig.colorbar(im, ax=ax, label="Mean improvement (%)")
+    ax.set_title(f"{model}: Improvement by Param Group", fontsize=12, fontweight='bold')
+    fig.tight_layout()
+    _save(fig, output_path)
+
+
+def _save(fig, output_path):
+    import matplotlib.pyplot as plt
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.png"
+    fig.savefig(tmp_path, dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    os.replace(tmp_path, output_path)
+
+
+def build(results_dir, out_dir, force=False, config=None):
+    """
+    增量构建全部对比图；给出 config 时只统计当前配置内容键下的记录
+
+    Returns:
+        (重画的面板数, 面板总数, 有变化的JSONL文件数)
+    """
+    results_dir, out_dir = Path(results_dir), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = out_dir / ".cache.json"
+    cache = load_cache(cache_path)
+    units, changed = scan(results_dir, cache, current_keys(config) if config is not None else None)
+
+    by_task, by_model = defaultdict(dict), defaultdict(dict)
+    for (model, task), agg in units.items():
+        if agg['n']:
+            by_task[task][model] = agg
+            by_model[model][task] = agg
+
+    panels = []
+    for task, data in by_task.items():
+        panels.append((f"compare_{task}.png", render_task, task, data))
+    for model, data in by_model.items():
+        panels.append((f"heatmap_{model}.png", render_model, model, data))
+
+    rebuilt = 0
+    for name, render, label, data in panels:
+        output_path = out_dir / name
+        digest = _digest(data)
+        if not force and output_path.exists() and cache['panels'].get(name) == digest:
+            continue
+        render(label, data, output_path)
+        cache['panels'][name] = digest
+        rebuilt += 1
+        print(f"✅ 已生成: {output_path}")
+
+    save_cache(cache_path, cache)
+    return rebuilt, len(panels), changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多模型对比图（读取 results/ 下的JSONL）")
+    parser.add_argument("--results_dir", type=str, default=None,
+                        help="结果目录 (默认: 脚本目录下的 results/)")
+    parser.add_argument("--out_dir", type=str, default=None,
+                        help="图片输出目录 (默认: <结果目录>/plots)")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略缓存，全部重画")
+    parser.add_argument("--config", type=str, default=None,
+                        help="计算当前内容键的配置文件 (默认: 结果目录上一级的 config.yaml，不存在时不按键筛选)")
+    args = parser.parse_args(argv)
+
+    results_dir = Path(args.results_dir) if args.results_dir else RESULTS_DIR
+    out_dir = Path(args.out_dir) if args.out_dir else results_dir / "plots"
+    config_path = Path(args.config) if args.config else results_dir.parent / "config.yaml"
+    config = None
+    if config_path.exists():
+        import yaml
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+    rebuilt, total, changed = build(results_dir, out_dir, force=args.force, config=config)
+    print(f"JSONL有变化: {changed} 个 | 重画面板: {rebuilt}/{total} | 输出目录: {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
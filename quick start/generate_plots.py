@@ -1,54 +1,104 @@
 #!/usr/bin/env python3
 """
 生成所有实验的可视化图片
+各实验在进程池中并行绘制（Agg后端）；曲线均值/标准差按块流式聚合，不整体载入 results.json；
+输入与画图代码都未变化的实验直接跳过
 """
 import os
 import sys
-import json
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT = os.path.dirname(SCRIPT_DIR)  # 上一级目录是项目根目录
+sys.path.insert(0, ROOT)
 
+from utils import plotting
+from utils.plotting import CurveStats, iter_json_arrays, file_signature, source_digest, is_fresh, write_stamp
 
-def plot_experiment(exp_dir, title):
-    """为单个实验生成可视化图片"""
+# 新旧两种结果格式的键名
+KEYS = {"A": "A", "A_no_code": "A", "B": "B", "B_with_interpreter": "B"}
+STAMP_NAME = ".plot_stamp.json"
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def aggregate_results(results_path):
+    """
+    流式聚合累积奖励/后悔曲线
+
+    Returns:
+        {"A": {"reward": (mean, std), "regret": (mean, std)}, "B": {...}}；缺少某一策略时为None
+    """
+    stats = {}
+    for key, trial in iter_json_arrays(results_path, KEYS):
+        if key not in stats:
+            stats[key] = {"reward": CurveStats(), "regret": CurveStats()}
+        stats[key]["reward"].add(trial["cum_reward"])
+        stats[key]["regret"].add(trial["cum_regret"])
+    
+    out = {}
+    for side in ("A", "B"):
+        # 与旧逻辑一致：新键名优先
+        keys = [k for k in KEYS if KEYS[k] == side and k in stats]
+        if not keys:
+            return None
+        out[side] = {name: s.result() for name, s in stats[keys[0]].items()}
+    return out
+
+
+def plot_experiment(exp_dir, title, force=False):
+    """
+    为单个实验生成可视化图片
+
+    Returns:
+        (状态, 信息)，状态为 "ok" / "cached" / "skip"
+    """
+    name = os.path.basename(exp_dir)
     results_path = os.path.join(exp_dir, "results.json")
+    output_path = os.path.join(exp_dir, "plot.png")
+    stamp_path = os.path.join(exp_dir, STAMP_NAME)
     
     if not os.path.exists(results_path):
-        print(f"⚠️  跳过 {os.path.basename(exp_dir)}: results.json 不存在")
-        return False
+        return "skip", f"⚠️  跳过 {name}: results.json 不存在"
+    
+    signature = {
+        "input": file_signature(results_path),
+        "code": source_digest(__file__, plotting.__file__),
+        "title": title,
+    }
+    if not force and is_fresh(stamp_path, output_path, signature):
+        return "cached", f"⏭️  未变化: {output_path}"
     
     try:
-        with open(results_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        stats = aggregate_results(results_path)
     except Exception as e:
-        print(f"⚠️  跳过 {os.path.basename(exp_dir)}: JSON解析失败 - {e}")
-        return False
-    
-    # 提取数据
-    A = data.get("A", data.get("A_no_code", []))
-    B = data.get("B", data.get("B_with_interpreter", []))
+        return "skip", f"⚠️  跳过 {name}: JSON解析失败 - {e}"
     
-    if len(A) == 0 or len(B) == 0:
-        print(f"⚠️  跳过 {os.path.basename(exp_dir)}: 数据为空")
-        return False
+    if stats is None:
+        return "skip", f"⚠️  跳过 {name}: 数据为空"
     
-    # 提取累积奖励和后悔
-    A_reward = np.array([x["cum_reward"] for x in A], dtype=float)
-    B_reward = np.array([x["cum_reward"] for x in B], dtype=float)
-    A_regret = np.array([x["cum_regret"] for x in A], dtype=float)
-    B_regret = np.array([x["cum_regret"] for x in B], dtype=float)
+    render(stats, title, output_path)
+    write_stamp(stamp_path, signature)
+    return "ok", f"✅ 已生成: {output_path}"
+
+
+def render(stats, title, output_path):
+    """按聚合结果绘制2x2图"""
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
     
-    t = np.arange(A_reward.shape[1])
+    a_mr, a_sr = stats["A"]["reward"]
+    b_mr, b_sr = stats["B"]["reward"]
+    a_mg, a_sg = stats["A"]["regret"]
+    b_mg, b_sg = stats["B"]["regret"]
     
-    a_mr, a_sr = A_reward.mean(axis=0), A_reward.std(axis=0)
-    b_mr, b_sr = B_reward.mean(axis=0), B_reward.std(axis=0)
-    a_mg, a_sg = A_regret.mean(axis=0), A_regret.std(axis=0)
-    b_mg, b_sg = B_regret.mean(axis=0), B_regret.std(axis=0)
+    t = np.arange(a_mr.shape[0])
     
     # 创建2x2子图
     plt.figure(figsize=(14, 10))
@@ -89,13 +139,14 @@ def plot_experiment(exp_dir, title):
     
     # 4. 最终累积奖励对比
     ax4 = plt.subplot(2, 2, 4)
-    a_final = A_reward[:, -1]
-    b_final = B_reward[:, -1]
-    improvement = ((b_final.mean() - a_final.mean()) / a_final.mean()) * 100
+    # 最终累积奖励的均值/标准差即曲线末点
+    a_final_mean, a_final_std = a_mr[-1], a_sr[-1]
+    b_final_mean, b_final_std = b_mr[-1], b_sr[-1]
+    improvement = ((b_final_mean - a_final_mean) / a_final_mean) * 100
     
     bars = ax4.bar(["Strategy A\nNo Code", "Strategy B\nInterpreter"], 
-                   [a_final.mean(), b_final.mean()],
-                   yerr=[a_final.std(), b_final.std()], 
+                   [a_final_mean, b_final_mean],
+                   yerr=[a_final_std, b_final_std], 
                    color=["#ff6666", "#66cc66"],
                    capsize=8, width=0.6)
     ax4.set_title(f"Final Cumulative Reward (Improvement: {improvement:.1f}%)", 
@@ -113,15 +164,21 @@ def plot_experiment(exp_dir, title):
     plt.suptitle(title, fontsize=14, fontweight='bold', y=0.995)
     plt.tight_layout()
     
-    # 保存图片
-    output_path = os.path.join(exp_dir, "plot.png")
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    print(f"✅ 已生成: {output_path}")
+    # 保存图片（先写临时文件，避免中断留下半张图）
+    tmp_path = f"{output_path}.{os.getpid()}.tmp.png"
+    plt.savefig(tmp_path, dpi=150, bbox_inches='tight')
     plt.close()
-    return True
+    os.replace(tmp_path, output_path)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="生成所有实验的可视化图片")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="并行绘图进程数 (默认: min(实验数, CPU数))")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略缓存，全部重画")
+    args = parser.parse_args()
+    
     experiments_dir = os.path.join(ROOT, "experiments")
     
     experiments = [
@@ -136,14 +193,23 @@ def main():
     print("开始生成所有可视化图片")
     print("="*60 + "\n")
     
-    success_count = 0
-    for exp_name, title in experiments:
-        exp_dir = os.path.join(experiments_dir, exp_name)
-        if plot_experiment(exp_dir, title):
-            success_count += 1
+    jobs = [(os.path.join(experiments_dir, exp_name), title, args.force) for exp_name, title in experiments]
+    workers = args.workers or min(len(jobs), os.cpu_count() or 1)
+    
+    if workers <= 1:
+        _init_worker()
+        outcomes = [plot_experiment(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            outcomes = list(pool.map(plot_experiment, *zip(*jobs)))
+    
+    counts = {"ok": 0, "cached": 0, "skip": 0}
+    for status, message in outcomes:
+        counts[status] += 1
+        print(message)
     
     print(f"\n{'='*60}")
-    print(f"✅ 成功生成 {success_count}/{len(experiments)} 个图片")
+    print(f"✅ 成功生成 {counts['ok']}/{len(experiments)} 个图片（未变化跳过 {counts['cached']} 个）")
     print("="*60)
 
 
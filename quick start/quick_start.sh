@@ -30,7 +30,8 @@ echo "  - 类3: 上下文老虎机"
 echo "  - 类4: 对抗性老虎机"
 echo "  - 类5: 休眠老虎机"
 echo ""
-echo "预计耗时: 10-20分钟"
+echo "所有类别的 trial × 策略共用一个线程池并发执行（--workers，默认16）"
+echo "预计耗时: 2-5分钟"
 echo ""
 
 python3 run_experiment.py --class all --arms 3 --rounds 120 --trials 10
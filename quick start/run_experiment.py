@@ -7,6 +7,8 @@ import os
 import sys
 import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
 
 # 添加项目根目录到路径
@@ -14,7 +16,9 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT = os.path.dirname(SCRIPT_DIR)  # 上一级目录是项目根目录
 sys.path.insert(0, ROOT)
 
-from utils.shared import get_client_and_model, make_trials
+from utils.param_generator import create_trial_from_params
+from utils.rng import unit_rng
+from utils.shared import calc_curves_batch, get_client_and_model, trial_oracle
 from strategy_a_no_code.policy import run_trial_no_code
 from strategy_b_with_interpreter.policy import run_trial_with_interpreter
 
@@ -34,161 +38,85 @@ def convert_numpy_types(obj):
     return obj
 
 
-def run_basic_bandit(client, model_id, args):
-    """类1: 基础多臂老虎机"""
-    print("\n" + "="*60)
-    print("运行实验类1: 基础多臂老虎机 (Basic MAB)")
-    print("="*60)
-    
-    trials_data = make_trials(
-        n_trials=args.trials,
-        n_arms=args.arms,
-        n_rounds=args.rounds,
-        mean_low=2.0,
-        mean_high=9.0,
-        sigma=1.0,
-        seed=args.seed
-    )
-    
-    res_a, res_b = [], []
-    for i, tr in enumerate(trials_data, start=1):
-        print(f"\nTrial {i}/{args.trials} | means={np.round(tr['means'],2).tolist()}")
-        a = run_trial_no_code(client, model_id, tr, n_rounds=args.rounds)
-        b = run_trial_with_interpreter(client, model_id, tr, n_rounds=args.rounds, verbose_tool=args.verbose)
-        res_a.append(a)
-        res_b.append(b)
-        print(f"  A累积奖励: {a['cum_reward'][-1]:.2f} | B累积奖励: {b['cum_reward'][-1]:.2f}")
-    
-    return res_a, res_b
-
-
-def run_restless_bandit(client, model_id, args):
-    """类2: 非平稳老虎机"""
-    print("\n" + "="*60)
-    print("运行实验类2: 非平稳老虎机 (Restless Bandit)")
-    print("="*60)
-    
-    trials_data = make_trials(
-        n_trials=args.trials,
-        n_arms=args.arms,
-        n_rounds=args.rounds,
-        mean_low=2.0,
-        mean_high=9.0,
-        sigma=1.0,
-        seed=args.seed
-    )
-    
-    # 添加漂移参数
-    for tr in trials_data:
-        tr['drift_rate'] = 0.05
-    
-    res_a, res_b = [], []
-    for i, tr in enumerate(trials_data, start=1):
-        print(f"\nTrial {i}/{args.trials} | 初始means={np.round(tr['means'],2).tolist()}")
-        a = run_trial_no_code(client, model_id, tr, n_rounds=args.rounds)
-        b = run_trial_with_interpreter(client, model_id, tr, n_rounds=args.rounds, verbose_tool=args.verbose)
-        res_a.append(a)
-        res_b.append(b)
-        print(f"  A累积奖励: {a['cum_reward'][-1]:.2f} | B累积奖励: {b['cum_reward'][-1]:.2f}")
-    
-    return res_a, res_b
-
-
-def run_contextual_bandit(client, model_id, args):
-    """类3: 上下文老虎机"""
-    print("\n" + "="*60)
-    print("运行实验类3: 上下文老虎机 (Contextual Bandit)")
-    print("="*60)
-    
-    trials_data = make_trials(
-        n_trials=args.trials,
-        n_arms=args.arms,
-        n_rounds=args.rounds,
-        mean_low=2.0,
-        mean_high=9.0,
-        sigma=1.0,
-        seed=args.seed
-    )
-    
-    # 添加上下文信息
-    for tr in trials_data:
-        tr['contexts'] = [f"context_{i%3}" for i in range(args.rounds)]
-    
-    res_a, res_b = [], []
-    for i, tr in enumerate(trials_data, start=1):
-        print(f"\nTrial {i}/{args.trials} | means={np.round(tr['means'],2).tolist()}")
-        a = run_trial_no_code(client, model_id, tr, n_rounds=args.rounds)
-        b = run_trial_with_interpreter(client, model_id, tr, n_rounds=args.rounds, verbose_tool=args.verbose)
-        res_a.append(a)
-        res_b.append(b)
-        print(f"  A累积奖励: {a['cum_reward'][-1]:.2f} | B累积奖励: {b['cum_reward'][-1]:.2f}")
-    
-    return res_a, res_b
-
-
-def run_adversarial_bandit(client, model_id, args):
-    """类4: 对抗性老虎机"""
-    print("\n" + "="*60)
-    print("运行实验类4: 对抗性老虎机 (Adversarial Bandit)")
-    print("="*60)
-    
-    trials_data = make_trials(
-        n_trials=args.trials,
-        n_arms=args.arms,
-        n_rounds=args.rounds,
-        mean_low=2.0,
-        mean_high=9.0,
-        sigma=1.0,
-        seed=args.seed
-    )
-    
-    # 添加对抗性参数
-    for tr in trials_data:
-        tr['adversarial'] = True
-        tr['switch_interval'] = 30
-    
-    res_a, res_b = [], []
-    for i, tr in enumerate(trials_data, start=1):
-        print(f"\nTrial {i}/{args.trials} | 初始means={np.round(tr['means'],2).tolist()}")
-        a = run_trial_no_code(client, model_id, tr, n_rounds=args.rounds)
-        b = run_trial_with_interpreter(client, model_id, tr, n_rounds=args.rounds, verbose_tool=args.verbose)
-        res_a.append(a)
-        res_b.append(b)
-        print(f"  A累积奖励: {a['cum_reward'][-1]:.2f} | B累积奖励: {b['cum_reward'][-1]:.2f}")
-    
-    return res_a, res_b
-
-
-def run_sleeping_bandit(client, model_id, args):
-    """类5: 休眠老虎机"""
-    print("\n" + "="*60)
-    print("运行实验类5: 休眠老虎机 (Sleeping Bandit)")
-    print("="*60)
-    
-    trials_data = make_trials(
-        n_trials=args.trials,
-        n_arms=args.arms,
-        n_rounds=args.rounds,
-        mean_low=2.0,
-        mean_high=9.0,
-        sigma=1.0,
-        seed=args.seed
-    )
-    
-    # 添加休眠参数
-    for tr in trials_data:
-        tr['sleep_prob'] = 0.3
-    
-    res_a, res_b = [], []
-    for i, tr in enumerate(trials_data, start=1):
-        print(f"\nTrial {i}/{args.trials} | means={np.round(tr['means'],2).tolist()}")
-        a = run_trial_no_code(client, model_id, tr, n_rounds=args.rounds)
-        b = run_trial_with_interpreter(client, model_id, tr, n_rounds=args.rounds, verbose_tool=args.verbose)
-        res_a.append(a)
-        res_b.append(b)
-        print(f"  A累积奖励: {a['cum_reward'][-1]:.2f} | B累积奖励: {b['cum_reward'][-1]:.2f}")
-    
-    return res_a, res_b
+# 实验类别 -> (结果目录, 名称, 在基础参数上附加的任务参数)；trial 按 create_trial_from_params 语义生成
+EXPERIMENTS = {
+    "1": ("1_basic_bandit", "基础多臂老虎机 (Basic MAB)", {}),
+    "2": ("2_restless_bandit", "非平稳老虎机 (Restless Bandit)", {"drift_rate": 0.05}),
+    "3": ("3_contextual_bandit", "上下文老虎机 (Contextual Bandit)", {"n_contexts": 3}),
+    "4": ("4_adversarial_bandit", "对抗性老虎机 (Adversarial Bandit)", {"adversarial": True, "switch_interval": 30}),
+    "5": ("5_sleeping_bandit", "休眠老虎机 (Sleeping Bandit)", {"sleep_prob": 0.3}),
+}
+
+
+def make_class_trials(extra, args):
+    """一个实验类别的全部trial；各类别共用同一组种子，只在任务参数上不同"""
+    trials = []
+    for i in range(args.trials):
+        params = {
+            "n_arms": args.arms,
+            "mean_low": 2.0,
+            "mean_high": 9.0,
+            "sigma": 1.0,
+            "seed": args.seed + i,
+            **extra,
+        }
+        trials.append(create_trial_from_params(params, n_rounds=args.rounds))
+    return trials
+
+
+def run_strategy(client, model_id, trial, strategy, rng, args):
+    """单个 (trial, 策略) 任务"""
+    if strategy == "A":
+        return run_trial_no_code(client, model_id, trial, n_rounds=args.rounds, rng=rng)
+    return run_trial_with_interpreter(client, model_id, trial, n_rounds=args.rounds,
+                                      verbose_tool=args.verbose, rng=rng)
+
+
+def score_class(trials, results, n_rounds):
+    """整个类别的trial一次批量计算累积奖励/遗憾曲线，写回各策略的结果"""
+    oracle = np.stack([trial_oracle(tr, n_rounds) for tr in trials])
+    for side in results.values():
+        curves = calc_curves_batch([r["rewards"] for r in side], oracle)
+        for r, reward, regret in zip(side, curves["cum_reward"], curves["cum_regret"]):
+            r["cum_reward"], r["cum_regret"] = reward.tolist(), regret.tolist()
+
+
+def run_experiments(client, model_id, to_run, args):
+    """
+    把 所选类别 × trial × 策略 全部提交到同一个线程池，共用一个客户端
+    每个任务的随机数流由 (根种子, 模型, 类别, trial, 策略) 派生，结果与调度顺序无关；
+    某一类别的任务全部完成后按整类批量打分，立即写出它的 results.json
+    """
+    results = {}
+    class_trials = {}
+    pending = {}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for exp_num in to_run:
+            exp_name, _, extra = EXPERIMENTS[exp_num]
+            trials = class_trials[exp_num] = make_class_trials(extra, args)
+            results[exp_num] = {"A": [None] * len(trials), "B": [None] * len(trials)}
+            pending[exp_num] = 2 * len(trials)
+            for i, tr in enumerate(trials):
+                for strategy in ("A", "B"):
+                    rng = unit_rng(args.seed, model_id, exp_name, 0, i, strategy)
+                    fut = pool.submit(run_strategy, client, model_id, tr, strategy, rng, args)
+                    futures[fut] = (exp_num, i, strategy)
+        print(f"已提交 {len(futures)} 个任务（{len(to_run)} 类 × {args.trials} trial × 2 策略），"
+              f"并发数 {args.workers}")
+
+        for fut in as_completed(futures):
+            exp_num, i, strategy = futures[fut]
+            res = fut.result()
+            results[exp_num][strategy][i] = res
+            exp_name, title, _ = EXPERIMENTS[exp_num]
+            print(f"  [{exp_name}] Trial {i + 1}/{args.trials} 策略{strategy} 累积奖励: {res['cum_reward'][-1]:.2f}")
+            pending[exp_num] -= 1
+            if pending[exp_num] == 0:
+                print(f"\n实验类{exp_num} 完成: {title}")
+                score_class(class_trials.pop(exp_num), results[exp_num], args.rounds)
+                save_results(exp_name, results[exp_num]["A"], results[exp_num]["B"], args, model_id)
+    return results
 
 
 def save_results(exp_name, res_a, res_b, args, model_id):
@@ -250,6 +178,8 @@ def main():
                         help="trial数量 (默认: 10)")
     parser.add_argument("--seed", type=int, default=42,
                         help="随机种子 (默认: 42)")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="并发任务数，所有类别共用 (默认: 16)")
     parser.add_argument("--verbose", action="store_true",
                         help="显示详细工具调用信息")
     args = parser.parse_args()
@@ -262,26 +192,13 @@ def main():
     )
     print(f"使用模型: {model_id}")
     
-    # 实验映射
-    experiments = {
-        "1": ("1_basic_bandit", run_basic_bandit),
-        "2": ("2_restless_bandit", run_restless_bandit),
-        "3": ("3_contextual_bandit", run_contextual_bandit),
-        "4": ("4_adversarial_bandit", run_adversarial_bandit),
-        "5": ("5_sleeping_bandit", run_sleeping_bandit)
-    }
-    
     # 确定要运行的实验
     if args.exp_class == "all":
-        to_run = list(experiments.keys())
+        to_run = list(EXPERIMENTS.keys())
     else:
         to_run = [args.exp_class]
     
-    # 运行实验
-    for exp_num in to_run:
-        exp_name, exp_func = experiments[exp_num]
-        res_a, res_b = exp_func(client, model_id, args)
-        save_results(exp_name, res_a, res_b, args, model_id)
+    run_experiments(client, model_id, to_run, args)
     
     print("\n" + "="*60)
     print("✅ 所有实验完成！")
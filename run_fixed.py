@@ -7,31 +7,65 @@
 4. 先1%验证，再全量运行
 """
 import os
-import sys
 import json
+import argparse
 import yaml
 import numpy as np
 import time
 from datetime import datetime
 from pathlib import Path
 from openai import OpenAI
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import defaultdict
 import threading
+from contextlib import nullcontext
 
 # 固定路径
 SCRIPT_DIR = Path(__file__).parent
 RESULTS_DIR = SCRIPT_DIR / "results"
 
-sys.path.insert(0, str(SCRIPT_DIR))
-
 from utils.param_generator import ParamGenerator, create_trial_from_params
+from utils.cassette import Cassette, CassetteMiss
+from utils.lease import LeaseLost, LeaseManager
+from utils.scheduler import estimate_trial_seconds, iter_schedule
+from utils.planner import feature_rates, token_profile, plan_run, format_plan
+from utils.sequential import RepeatBudget, is_resolved
+from utils.stats import summarize_cells
+from utils.trial_store import open_or_materialise
+from utils.rng import unit_rng
+from utils.job_key import unit_key, is_legacy_id
+from utils.hedging import Hedger
+from utils.api_client import UnifiedAPIClient
+from utils.circuit_breaker import (
+    BreakerRegistry, GuardedClient, CircuitOpenError, JobParked, probe_endpoint
+)
 from strategy_a_no_code.policy import run_trial_no_code
 from strategy_b_with_interpreter.policy import run_trial_with_interpreter
+from strategy_b_with_interpreter.sandbox import SandboxPool
+from strategy_b_with_interpreter.policy_store import PolicyStore
 
 # 全局配置
 MAX_WORKERS = 350
 API_TIMEOUT = 60
 MAX_RETRIES = 3
+# 已提交未完成的作业上限（背压）与LPT排序的前瞻窗口；二者都与网格规模无关
+MAX_IN_FLIGHT = MAX_WORKERS * 2
+SCHEDULE_LOOKAHEAD = 2000
+
+# 任务列表: (结果文件名, 参数生成键)
+TASKS = [
+    ('1_basic_bandit', 'basic'),
+    ('2_restless_bandit', 'restless'),
+    ('3_contextual_bandit', 'contextual'),
+    ('4_adversarial_bandit', 'adversarial'),
+    ('5_sleeping_bandit', 'sleeping')
+]
+
+# 熔断配置
+BREAKER_FAILURE_THRESHOLD = 5   # 连续失败多少次熔断
+BREAKER_COOLDOWN = 30           # 熔断后多久探测一次（秒）
+MAX_FAILED_PROBES = 20          # 连续探测失败多少次后放弃本次运行中的暂存作业
+MAX_REQUEUES = 2                # 失败重复在endpoint正常时最多重新排队几次
 
 print_lock = threading.Lock()
 progress_lock = threading.Lock()
@@ -54,59 +88,216 @@ def load_progress(progress_file):
             data = json.load(f)
             data['completed'] = set(data.get('completed', []))
             data['failed'] = set(data.get('failed', []))
+            data['parked'] = data.get('parked', {})
             return data
-    return {'completed': set(), 'failed': set(), 'start_time': datetime.now().isoformat()}
+    return {'completed': set(), 'failed': set(), 'parked': {}, 'start_time': datetime.now().isoformat()}
 
 def save_progress(progress_file, progress):
     """保存进度"""
     progress_copy = {
         'completed': list(progress['completed']),
         'failed': list(progress['failed']),
+        # 未完成的参数组 -> 尚未成功的重复编号，下次运行只补跑这些重复
+        'parked': progress.get('parked', {}),
         'start_time': progress['start_time'],
         'last_update': datetime.now().isoformat()
     }
     with open(progress_file, 'w', encoding='utf-8') as f:
         json.dump(progress_copy, f, ensure_ascii=False, indent=2)
 
-def make_task_id(model_name, task_id, group_idx):
-    """生成任务唯一ID"""
-    return f"{model_name}|{task_id}|{group_idx}"
+def make_task_id(model_name, task_id, group_idx, key=None):
+    """生成任务唯一ID；key 为 unit_key 计算的内容键，不给时为旧式ID"""
+    if key is None:
+        return f"{model_name}|{task_id}|{group_idx}"
+    return f"{model_name}|{task_id}|{group_idx}|{key}"
+
+def unit_key_for(model_info, task_id, params, exp_cfg):
+    """单元的内容键：输入（model_id、参数、轮数、种子、两种策略的提示词版本、影响结果的执行设置）任一变化即不同"""
+    return unit_key(model_info['model_id'], task_id, params, exp_cfg['n_rounds'], exp_cfg['seed'],
+                    large_k=exp_cfg.get('large_k'), strategy_a=exp_cfg.get('strategy_a'),
+                    sandbox=exp_cfg.get('sandbox'), policy_store=exp_cfg.get('policy_store'))
+
+def make_unit_id(model_info, task_id, group_idx, params, exp_cfg):
+    """带内容键的单元ID，用于进度、租约与暂存"""
+    return make_task_id(model_info['name'], task_id, group_idx,
+                        unit_key_for(model_info, task_id, params, exp_cfg))
+
+def adopt_legacy_progress(progress, models, tasks, all_params, exp_cfg):
+    """
+    旧版进度文件只按 模型|任务|参数组 记录，无法得知当时的输入；
+    视其为当前配置下完成，换成带键ID，避免升级后整网格重跑。返回迁移的条目数
+    """
+    legacy = {uid for uid in progress['completed'] | progress['failed'] | set(progress['parked'])
+              if is_legacy_id(uid)}
+    if not legacy:
+        return 0
+    mapping = {}
+    for task_id, task_key in tasks:
+        for model_info in models:
+            for group_idx, params in enumerate(all_params[task_key]):
+                old = make_task_id(model_info['name'], task_id, group_idx)
+                if old in legacy:
+                    mapping[old] = make_unit_id(model_info, task_id, group_idx, params, exp_cfg)
+    progress['completed'] = {mapping.get(u, u) for u in progress['completed']}
+    progress['failed'] = {mapping.get(u, u) for u in progress['failed']}
+    progress['parked'] = {mapping.get(u, u): r for u, r in progress['parked'].items()}
+    return len(legacy)
+
+def task_jsonl_file(model_name, task_id, shard_id=None):
+    """模型×任务的JSONL路径；分片模式下每个分片写独立文件"""
+    model_dir = RESULTS_DIR / model_name.replace('/', '_').replace('\\', '_')
+    if shard_id is not None:
+        return model_dir / f"{task_id}.shard-{shard_id}.jsonl"
+    return model_dir / f"{task_id}.jsonl"
 
-def run_single_param_group(model_info, task_id, params, config, group_idx, progress, progress_file):
-    """运行单个参数组（5次重复）"""
+def iter_task_records(model_name, task_id):
+    """读取模型×任务的全部记录（主文件 + 各分片文件），在报告阶段合并"""
+    main_file = task_jsonl_file(model_name, task_id)
+    files = [main_file] + sorted(main_file.parent.glob(f"{task_id}.shard-*.jsonl"))
+    for path in files:
+        if not path.exists():
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def run_single_param_group(model_info, task_id, params, config, group_idx, progress, progress_file,
+                           cassette=None, leases=None, breakers=None, repeats=None, sandbox=None,
+                           trial_store=None, policy_store=None, hedger=None, api=None, budget=None,
+                           prior_diffs=None):
+    """
+    运行单个参数组（默认5次重复）
+    传入cassette时录制或回放LLM交互，传入leases时先认领租约；
+    传入breakers时endpoint熔断或重复失败会抛 JobParked，由调度循环在恢复后重新排队；
+    传入sandbox时策略B代码在沙箱子进程池中执行；传入trial_store时直接读取预生成的trial；
+    传入policy_store时策略B代码经由策略库生成或复用；传入hedger时调用慢于p95即对冲（trial计时）；
+    传入api（UnifiedAPIClient）时请求经该模型的多endpoint路由器发出，对冲由api在各endpoint内完成；
+    传入budget（RepeatBudget）时提前停止省下的重复存入池中，跑满仍未解决则登记等待追加；
+    prior_diffs 不为None表示追加作业：单元已完成，repeats 为池中分来的追加重复，prior_diffs 为已有配对差值
+    """
     model_name = model_info['name']
     model_id = model_info['model_id']
     exp_cfg = config['experiment']
     
-    # 检查是否已完成
-    task_uid = make_task_id(model_name, task_id, group_idx)
+    # 检查是否已完成（按内容键：配置或提示词变化后旧的完成记录不再匹配）
+    unit_key_hex = unit_key_for(model_info, task_id, params, exp_cfg)
+    task_uid = make_task_id(model_name, task_id, group_idx, unit_key_hex)
+    extending = prior_diffs is not None
     with progress_lock:
-        if task_uid in progress['completed']:
+        if task_uid in progress['completed'] and not extending:
             return None
     
-    # 创建客户端
-    client = OpenAI(
-        api_key=config['volcengine']['api_key'],
-        base_url=config['volcengine']['base_url']
-    )
+    # 分片模式：认领失败说明已完成或正由其他分片运行；追加作业只由跑完该单元的分片发起，无需再认领
+    if leases is not None and not extending and not leases.claim(task_uid):
+        return None
     
-    # 模型专属目录和文件
-    model_dir = RESULTS_DIR / model_name.replace('/', '_').replace('\\', '_')
-    jsonl_file = model_dir / f"{task_id}.jsonl"
+    # 创建客户端（回放模式不访问网络）
+    client = None
+    if cassette is None or cassette.mode == 'record':
+        if api is not None:
+            client = api.model_client(model_info)
+        else:
+            client = OpenAI(
+                api_key=config['volcengine']['api_key'],
+                base_url=config['volcengine']['base_url'],
+                timeout=API_TIMEOUT
+            )
+            if hedger is not None:
+                # 单endpoint：模型即endpoint
+                client = hedger.wrap(client, model_id)
+    
+    breaker = breakers.get(model_id) if breakers is not None else None
+    if client is not None and breaker is not None:
+        client = GuardedClient(client, breaker)
     
+    # 模型专属目录和文件
+    jsonl_file = task_jsonl_file(model_name, task_id, leases.shard_id if leases is not None else None)
+    
+    # 本单元成功的重复先暂存，单元结束（或暂存）时核对租约后再写入JSONL
+    unit_records = []
+    
+    def write_unit_records():
+        """写出暂存的结果；分片模式下租约已被其他分片接管时整体丢弃，避免与新持有者重复"""
+        if leases is not None and leases.lost(task_uid):
+            unit_records.clear()
+            raise LeaseLost(f"{model_name} | {task_id} | 组{group_idx+1} 的租约已被其他分片接管，丢弃本分片结果")
+        for record in unit_records:
+            append_to_jsonl(jsonl_file, record)
+        unit_records.clear()
+    
+    if repeats is None:
+        repeats = progress.get('parked', {}).get(task_uid, list(range(exp_cfg['n_repeats'])))
     success_count = 0
+    failed_repeats = []
+    
+    # 策略A流式决策配置
+    a_cfg = exp_cfg.get('strategy_a', {})
+    
+    # 序贯早停：记录每次重复的配对差值 b_reward - a_reward
+    adaptive_cfg = exp_cfg.get('adaptive', {})
+    diffs = list(prior_diffs or [])
+    stopped_early = False
     
     # 5次重复
-    for r_idx in range(exp_cfg['n_repeats']):
-        trial_params = params.copy()
-        trial_params['seed'] = params['seed'] + r_idx
-        trial = create_trial_from_params(trial_params, exp_cfg['n_rounds'])
+    for i, r_idx in enumerate(repeats):
+        # 租约已被接管（本分片心跳中断过久）：不再为该单元花费调用
+        if leases is not None and leases.lost(task_uid):
+            write_unit_records()
+        
+        # A/B差异已估计得足够精确，不再为该单元花费调用，把工作线程让给仍不确定的单元
+        if adaptive_cfg.get('enabled', False) and not failed_repeats and is_resolved(diffs, adaptive_cfg):
+            stopped_early = True
+            if budget is not None:
+                budget.credit(len(repeats) - i)
+            break
+        
+        # 熔断中：剩余重复暂存，把工作线程让给健康模型
+        if breaker is not None and breaker.is_open():
+            write_unit_records()
+            if leases is not None and not extending:
+                leases.release(task_uid, done=False)
+            raise JobParked(model_id, failed_repeats + repeats[i:], "熔断")
+        
+        if trial_store is not None and (task_id, group_idx, r_idx) in trial_store:
+            trial = trial_store.get(task_id, group_idx, r_idx)
+        else:
+            trial_params = params.copy()
+            trial_params['seed'] = params['seed'] + r_idx
+            trial = create_trial_from_params(trial_params, exp_cfg['n_rounds'])
         
         for retry in range(MAX_RETRIES):
             try:
+                client_a = client_b = client
+                if cassette is not None:
+                    client_a = cassette.session(client, model_name, task_id, group_idx, r_idx, 'A', unit_key_hex)
+                    client_b = cassette.session(client, model_name, task_id, group_idx, r_idx, 'B', unit_key_hex)
+                
+                # 每次尝试都从单元种子重新派生，重试与首次运行取到同一随机数流
+                rng_a = unit_rng(exp_cfg['seed'], model_name, task_id, group_idx, r_idx, 'A')
+                rng_b = unit_rng(exp_cfg['seed'], model_name, task_id, group_idx, r_idx, 'B')
+                
                 # 运行策略A和B
-                result_a = run_trial_no_code(client, model_id, trial, n_rounds=exp_cfg['n_rounds'])
-                result_b = run_trial_with_interpreter(client, model_id, trial, n_rounds=exp_cfg['n_rounds'], verbose_tool=False)
+                with hedger.trial() if hedger is not None else nullcontext():
+                    result_a = run_trial_no_code(client_a, model_id, trial, n_rounds=exp_cfg['n_rounds'],
+                                                 stream=a_cfg.get('stream', False),
+                                                 max_tokens=a_cfg.get('max_tokens'),
+                                                 large_k=exp_cfg.get('large_k'), rng=rng_a,
+                                                 gate=a_cfg.get('gate'))
+                    result_b = run_trial_with_interpreter(client_b, model_id, trial, n_rounds=exp_cfg['n_rounds'],
+                                                          verbose_tool=False, sandbox=sandbox,
+                                                          policy_store=policy_store, rng=rng_b)
+                
+                # 策略A会吞掉API异常走随机兜底，期间熔断则结果不可信
+                if breaker is not None and breaker.is_open():
+                    raise CircuitOpenError(f"{model_name} endpoint在trial期间熔断")
+                
+                if cassette is not None:
+                    # 策略A会吞掉异常，这里统一检查回放缺失
+                    if client_a.misses or client_b.misses:
+                        raise CassetteMiss(f"cassette不完整: {model_name}|{task_id}|{group_idx}|{r_idx}")
+                    client_a.flush()
+                    client_b.flush()
                 
                 # 保存结果
                 result_data = {
@@ -123,18 +314,36 @@ def run_single_param_group(model_info, task_id, params, config, group_idx, progr
                     'a_reward': float(result_a['cum_reward'][-1]),
                     'b_reward': float(result_b['cum_reward'][-1]),
                     'improvement': float((result_b['cum_reward'][-1] - result_a['cum_reward'][-1]) / max(result_a['cum_reward'][-1], 1e-9) * 100),
-                    'timestamp': datetime.now().isoformat()
+                    # 相对逐轮oracle的动态遗憾
+                    'a_regret': float(result_a['cum_regret'][-1]),
+                    'b_regret': float(result_b['cum_regret'][-1]),
+                    'timestamp': datetime.now().isoformat(),
+                    # 单元内容键，配置变化后旧记录仍可按键查询
+                    'key': unit_key_hex
                 }
                 
-                # 立即追加到JSONL
-                append_to_jsonl(jsonl_file, result_data)
+                if 'skipped' in result_a:
+                    # 策略A置信门控跳过的LLM调用数
+                    result_data['a_skipped'] = result_a['skipped']
+                
+                if 'policy_sha' in result_b:
+                    # 策略B所用代码的制品哈希，可在策略库 objects/ 下查到代码与验证结果
+                    result_data['b_policy'] = result_b['policy_sha']
+                
+                unit_records.append(result_data)
                 success_count += 1
+                diffs.append(result_data['b_reward'] - result_data['a_reward'])
                 break
                 
             except Exception as e:
+                if breaker is not None and breaker.is_open():
+                    # 熔断后不再空等重试，交给调度循环恢复后重新排队
+                    failed_repeats.append(r_idx)
+                    break
                 if retry < MAX_RETRIES - 1:
                     time.sleep(2)
                 else:
+                    failed_repeats.append(r_idx)
                     # 记录失败
                     failed_data = {
                         'model': model_name,
@@ -147,12 +356,32 @@ def run_single_param_group(model_info, task_id, params, config, group_idx, progr
                     failed_file = RESULTS_DIR / "failed.jsonl"
                     append_to_jsonl(failed_file, failed_data)
     
+    write_unit_records()
+    
+    if failed_repeats and breakers is not None:
+        if leases is not None and not extending:
+            leases.release(task_uid, done=False)
+        raise JobParked(model_id, failed_repeats, "失败")
+    
+    # 跑满仍未解决：登记等待池中余额，由调度循环优先于新作业追加重复
+    if (budget is not None and adaptive_cfg.get('enabled', False) and not stopped_early and not failed_repeats
+            and not is_resolved(diffs, adaptive_cfg)):
+        budget.wait({'uid': task_uid, 'model_info': model_info, 'task_id': task_id, 'params': params,
+                     'group_idx': group_idx}, diffs, max(repeats, default=-1) + 1)
+    
     # 标记完成
     with progress_lock:
         progress['completed'].add(task_uid)
+        progress['parked'].pop(task_uid, None)
+        progress['failed'].discard(task_uid)
         save_progress(progress_file, progress)
+    if leases is not None and not extending:
+        leases.release(task_uid, done=True)
     
-    safe_print(f"[完成] {model_name} | {task_id} | 组{group_idx+1} ({success_count}/5成功)")
+    early_note = "，提前停止" if stopped_early else ""
+    if extending:
+        early_note += f"，追加重复（累计 {len(diffs)} 次）"
+    safe_print(f"[完成] {model_name} | {task_id} | 组{group_idx+1} ({success_count}/{len(repeats)}成功{early_note})")
     
     return task_uid
 
@@ -168,10 +397,7 @@ def validate_setup(config):
     safe_print(f"测试模型: {test_model['name']}")
     safe_print(f"结果目录: {RESULTS_DIR}")
     
-    client = OpenAI(
-        api_key=config['volcengine']['api_key'],
-        base_url=config['volcengine']['base_url']
-    )
+    client = UnifiedAPIClient(config=config, timeout=API_TIMEOUT).model_client(test_model)
     
     test_params = {
         'n_arms': 3,
@@ -212,8 +438,8 @@ def validate_setup(config):
         traceback.print_exc()
         return False
 
-def run_full_experiment(config):
-    """阶段2: 全量运行"""
+def run_full_experiment(config, cassette=None, shard_id=None):
+    """阶段2: 全量运行；指定shard_id时与其他分片通过共享结果目录协作"""
     start_time = time.time()
     
     safe_print("\n" + "="*70)
@@ -236,78 +462,368 @@ def run_full_experiment(config):
     param_gen = ParamGenerator(exp_cfg, seed=exp_cfg['seed'])
     all_params = param_gen.generate_all_params(exp_cfg['n_param_groups'])
     
-    # 任务列表
-    tasks = [
-        ('1_basic_bandit', 'basic'),
-        ('2_restless_bandit', 'restless'),
-        ('3_contextual_bandit', 'contextual'),
-        ('4_adversarial_bandit', 'adversarial'),
-        ('5_sleeping_bandit', 'sleeping')
-    ]
+    tasks = TASKS
     
     # 创建输出目录
     RESULTS_DIR.mkdir(parents=True, exist_ok=True)
     
-    # 加载进度
-    progress_file = RESULTS_DIR / "progress.json"
+    # 加载进度（分片模式下各分片维护自己的进度文件，跨分片完成状态以租约目录为准）
+    leases = None
+    if shard_id is not None:
+        leases = LeaseManager(RESULTS_DIR / "leases", shard_id)
+        leases.start()
+        progress_file = RESULTS_DIR / f"progress.shard-{shard_id}.json"
+        safe_print(f"分片模式: {leases.owner}")
+    else:
+        progress_file = RESULTS_DIR / "progress.json"
     progress = load_progress(progress_file)
-    
-    # 生成所有任务
-    all_jobs = []
-    for task_id, task_key in tasks:
-        params_list = all_params[task_key]
-        for model_info in models:
-            for group_idx, params in enumerate(params_list):
-                task_uid = make_task_id(model_info['name'], task_id, group_idx)
-                if task_uid not in progress['completed']:
-                    all_jobs.append({
+    adopted = adopt_legacy_progress(progress, models, tasks, all_params, exp_cfg)
+    if adopted:
+        save_progress(progress_file, progress)
+        safe_print(f"进度迁移: {adopted} 条旧式单元ID按当前配置换成内容键")
+    
+    def iter_units():
+        """按 (任务, 模型, 参数组) 惰性生成全部单元及其带键ID"""
+        for task_id, task_key in tasks:
+            for model_info in models:
+                for group_idx, params in enumerate(all_params[task_key]):
+                    yield make_unit_id(model_info, task_id, group_idx, params, exp_cfg), {
                         'model_info': model_info,
                         'task_id': task_id,
                         'params': params,
                         'group_idx': group_idx
-                    })
-    
-    total_jobs = len(all_jobs)
-    safe_print(f"总任务数: {total_jobs} (已完成: {len(progress['completed'])})")
+                    }
     
-    if total_jobs == 0:
+    def iter_jobs(skip=(), counter=None):
+        """
+        只生成过期（内容键不在已完成集合中）的作业，不在内存中展开整个网格
+        传入 counter 时顺带统计跳过的单元数（counter['skipped']），用于边派发边收紧进度分母
+        """
+        for task_uid, job in iter_units():
+            if (task_uid in progress['completed'] or task_uid in skip
+                    or (leases is not None and leases.is_done(task_uid))):
+                if counter is not None:
+                    counter['skipped'] += 1
+                continue
+            job['uid'] = task_uid
+            yield job
+    
+    # 进度分母 = 网格总量 - 当前键下已跳过的单元；跳过数在作业流遍历中累计，不在开工前遍历整个网格
+    grid_size = len(models) * sum(len(all_params[task_key]) for _, task_key in tasks)
+    stream_stats = {'skipped': 0}
+    safe_print(f"网格单元: {grid_size}（进度记录 {len(progress['completed'])} 条，"
+               f"当前键下已完成数随派发统计）")
+    
+    first_job = next(iter_jobs(), None)
+    if first_job is None:
         safe_print("所有任务已完成！")
+        if leases is not None:
+            leases.stop()
         generate_final_report(config, models, tasks, start_time)
         return
     
-    safe_print("开始并发执行...\n")
+    # 按历史耗时在前瞻窗口内做LPT + 模型公平排序（线程池按提交顺序派发），预测随派发更新
+    latency = estimate_trial_seconds(RESULTS_DIR)
+    schedule = {}
+    
+    def scheduled(jobs):
+        return iter_schedule(jobs, latency, exp_cfg['n_repeats'], MAX_WORKERS,
+                             lookahead=SCHEDULE_LOOKAHEAD, schedule=schedule)
+    
+    safe_print(f"开始并发执行（在途作业上限 {MAX_IN_FLIGHT}）...\n")
     
     # 并发执行
     completed_count = 0
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {
-            executor.submit(
-                run_single_param_group,
-                job['model_info'],
-                job['task_id'],
-                job['params'],
-                config,
-                job['group_idx'],
-                progress,
-                progress_file
-            ): job
-            for job in all_jobs
-        }
+    actual_finish = {}
+    
+    # 对冲请求：调用超过该endpoint近期延迟分位数仍未返回时再发一份，取先返回者（回放模式不访问网络）
+    hedger = None
+    hedge_cfg = exp_cfg.get('hedging', {})
+    if hedge_cfg.get('enabled', False) and (cassette is None or cassette.mode == 'record'):
+        hedger = Hedger(
+            deadline=API_TIMEOUT,
+            quantile=hedge_cfg.get('quantile', 0.95),
+            budget=hedge_cfg.get('budget', 0.05),
+            min_samples=hedge_cfg.get('min_samples', 20),
+            max_workers=MAX_WORKERS * 2,
+            # 每个工作线程同时至多一个原始请求，另留一倍给尚未返回的落选原始请求
+            primary_workers=MAX_WORKERS * 2
+        )
+        safe_print(f"对冲请求: p{hedger.quantile * 100:.0f} 触发，预算 {hedger.budget:.0%}")
+    
+    # 回放模式不访问网络，无需熔断
+    breakers = None
+    api = None
+    models_by_id = {m['model_id']: m for m in models}
+    if cassette is None or cassette.mode == 'record':
+        breakers = BreakerRegistry(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+        # 各模型的多endpoint路由器在全部工作线程间共享；对冲包在各endpoint之内
+        api = UnifiedAPIClient(config=config, timeout=API_TIMEOUT, hedger=hedger)
+    parked = defaultdict(list)  # model_id -> 暂存作业
+    
+    # 预生成trial库：所有模型共享同一份内存映射
+    trial_store = None
+    store_cfg = exp_cfg.get('trial_store', {})
+    if store_cfg.get('enabled', False):
+        store_path = RESULTS_DIR / store_cfg.get('path', 'trials.bin')
+        trial_store = open_or_materialise(store_path, all_params, tasks, exp_cfg['n_repeats'], exp_cfg['n_rounds'])
+        safe_print(f"trial库: {store_path} ({store_path.stat().st_size / 1024 / 1024:.1f} MB)")
+    
+    # 沙箱子进程池需在工作线程启动前创建
+    sandbox = None
+    sandbox_cfg = exp_cfg.get('sandbox', {})
+    if sandbox_cfg.get('enabled', False):
+        sandbox = SandboxPool(
+            n_workers=sandbox_cfg.get('workers', 32),
+            cpu_seconds=sandbox_cfg.get('cpu_seconds', 1.0),
+            memory_mb=sandbox_cfg.get('memory_mb', 512),
+            max_sessions_per_worker=sandbox_cfg.get('max_sessions_per_worker', 50)
+        )
+        safe_print(f"沙箱进程池: {sandbox_cfg.get('workers', 32)} 个子进程")
+    
+    # 策略B代码制品库：per_trial 每trial生成并留档，reuse 每个 (模型, 臂数) 复用已验证代码
+    policy_store = None
+    policy_cfg = exp_cfg.get('policy_store', {})
+    if policy_cfg.get('enabled', False):
+        policy_store = PolicyStore(
+            RESULTS_DIR / policy_cfg.get('path', 'policies'),
+            mode=policy_cfg.get('mode', 'per_trial'),
+            dry_rounds=policy_cfg.get('dry_rounds', 20),
+            max_attempts=policy_cfg.get('max_attempts', 3)
+        )
+        safe_print(f"策略库: {policy_store.base_dir} (模式: {policy_store.mode})")
+    
+    # 自适应重复：早停省下的重复在本次运行内再分给跑满 n_repeats 仍未解决的单元
+    budget = None
+    adaptive_cfg = exp_cfg.get('adaptive', {})
+    max_repeats = adaptive_cfg.get('max_repeats') or exp_cfg['n_repeats']
+    if adaptive_cfg.get('enabled', False) and max_repeats > exp_cfg['n_repeats']:
+        budget = RepeatBudget(max_repeats)
+        safe_print(f"自适应重复: 早停节省的重复再分配给未解决单元（每单元至多 {max_repeats} 次）")
+    
+    def job_uid(job):
+        return job['uid']
+    
+    def give_up(job):
+        """本次运行放弃该作业；未成功的重复记入进度，下次运行补跑"""
+        with progress_lock:
+            progress['failed'].add(job_uid(job))
+            progress['parked'][job_uid(job)] = job['repeats']
+            save_progress(progress_file, progress)
+        safe_print(f"[放弃] {job_uid(job)} 剩余重复 {job['repeats']}")
+    
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    futures = {}
+    
+    def submit(job):
+        future = executor.submit(
+            run_single_param_group,
+            job['model_info'],
+            job['task_id'],
+            job['params'],
+            config,
+            job['group_idx'],
+            progress,
+            progress_file,
+            cassette,
+            leases,
+            breakers,
+            job.get('repeats'),
+            sandbox,
+            trial_store,
+            policy_store,
+            hedger,
+            api,
+            budget,
+            job.get('extend')
+        )
+        futures[future] = job
+    
+    source = scheduled(iter_jobs(counter=stream_stats))
+    source_done = False
+    
+    def total_jobs():
+        """本次运行的作业总数；作业流遍历完之前是逐步收紧的上界"""
+        return grid_size - stream_stats['skipped']
+    
+    def top_up():
+        """从作业流补充提交，直到在途作业达到上限；池中余额分出的追加作业排在新作业之前"""
+        nonlocal source_done
+        if budget is not None:
+            for job in budget.grant():
+                submit(job)
+        while not source_done and len(futures) < MAX_IN_FLIGHT:
+            job = next(source, None)
+            if job is None:
+                source_done = True
+                if not stream_stats.get('announced'):
+                    stream_stats['announced'] = True
+                    safe_print(f"[作业流] 遍历完成：本次 {total_jobs()} 个作业，跳过已完成 {stream_stats['skipped']} 个")
+            else:
+                submit(job)
+    
+    try:
+        top_up()
         
-        for future in as_completed(futures):
-            try:
-                result = future.result()
-                if result:
-                    completed_count += 1
-                    percentage = (completed_count / total_jobs * 100)
-                    safe_print(f"[总进度] {completed_count}/{total_jobs} ({percentage:.1f}%)")
-                    
-            except Exception as e:
-                safe_print(f"[错误] {str(e)[:100]}")
+        while futures or parked or not source_done:
+            if futures:
+                done, _ = wait(list(futures), timeout=BREAKER_COOLDOWN, return_when=FIRST_COMPLETED)
+            else:
+                # 只剩暂存作业：等待冷却结束再探测
+                time.sleep(1)
+                done = set()
+            for future in done:
+                job = futures.pop(future)
+                try:
+                    result = future.result()
+                    if result and 'extend' not in job:
+                        completed_count += 1
+                        actual_finish[job['model_info']['name']] = time.time() - start_time
+                        total = total_jobs()
+                        percentage = (completed_count / max(total, 1) * 100)
+                        bound = "" if source_done else "≤"
+                        safe_print(f"[总进度] {completed_count}/{bound}{total} ({percentage:.1f}%)")
+                
+                except LeaseLost as e:
+                    safe_print(f"[分片] {e}")
+                    leases.release(job_uid(job), done=False)
+                
+                except JobParked as e:
+                    job['repeats'] = e.repeats
+                    # 熔断导致的暂存不计入重新排队次数
+                    if not breakers.get(e.model_id).is_open():
+                        job['requeues'] = job.get('requeues', 0) + 1
+                    if job.get('requeues', 0) > MAX_REQUEUES:
+                        give_up(job)
+                    else:
+                        parked[e.model_id].append(job)
+                        
+                except Exception as e:
+                    safe_print(f"[错误] {str(e)[:100]}")
+                    if leases is not None:
+                        leases.release(job_uid(job), done=False)
+            
+            # 暂存作业：endpoint正常则立即重新排队，熔断中则冷却后探测
+            for model_id in list(parked):
+                breaker = breakers.get(model_id)
+                if breaker.is_open():
+                    if not breaker.ready_for_probe():
+                        continue
+                    if probe_endpoint(api.model_client(models_by_id[model_id]), model_id):
+                        breaker.record_success()
+                        safe_print(f"[熔断] {model_id} 已恢复，重新排队 {len(parked[model_id])} 个作业")
+                    else:
+                        breaker.probe_failed()
+                        if breaker.failed_probes >= MAX_FAILED_PROBES:
+                            for job in parked.pop(model_id):
+                                give_up(job)
+                        continue
+                for job in parked.pop(model_id):
+                    submit(job)
+            
+            top_up()
+            
+            if futures or parked or not source_done or leases is None:
+                continue
+            # 分片模式：等待其他分片手上的单元完成，失联分片的租约过期后由本分片接管
+            pending = sum(1 for _ in iter_jobs(skip=progress['failed']))
+            if pending:
+                safe_print(f"[分片] 等待其他分片完成 {pending} 个单元...")
+                time.sleep(leases.heartbeat_interval)
+                source = scheduled(iter_jobs(skip=progress['failed']))
+                source_done = False
+                top_up()
+    finally:
+        executor.shutdown(wait=True)
+        if leases is not None:
+            leases.stop()
+        if sandbox is not None:
+            sandbox.close()
+        if policy_store is not None:
+            safe_print(f"[策略库] 生成 {policy_store.stats['generated']} 次"
+                       f"（未通过验证 {policy_store.stats['invalid']}）| 复用 {policy_store.stats['reused']} 次")
+        if budget is not None:
+            safe_print(f"[自适应重复] 追加 {budget.granted} 次，剩余余额 {budget.available}，"
+                       f"仍未解决 {budget.waiting()} 个单元")
+        if hedger is not None:
+            report_hedging(hedger.report())
+            hedger.close()
+        if api is not None:
+            report_routing(api.routing_status())
+    
+    report_schedule(schedule, actual_finish, time.time() - start_time)
     
     # 生成最终报告
     generate_final_report(config, models, tasks, start_time)
 
+def plan_experiment(config, cassette_dir=None, retry_rate=0.0):
+    """干跑规划：不发任何请求，只预测剩余调用、token、费用与完成时间"""
+    exp_cfg = config['experiment']
+    param_gen = ParamGenerator(exp_cfg, seed=exp_cfg['seed'])
+    all_params = param_gen.generate_all_params(exp_cfg['n_param_groups'])
+    
+    # 已完成单元：主进度、各分片进度与租约完成标记的并集
+    models = [m for m in config['models'] if m.get('enabled', True)]
+    completed = set()
+    for progress_file in RESULTS_DIR.glob("progress*.json"):
+        progress = load_progress(progress_file)
+        adopt_legacy_progress(progress, models, TASKS, all_params, exp_cfg)
+        completed |= progress['completed']
+    lease_dir = RESULTS_DIR / "leases"
+    if lease_dir.exists():
+        # 按期望单元逐个查完成标记：标记文件名无法还原含 / 的模型名
+        leases = LeaseManager(lease_dir, "plan")
+        for task_id, task_key in TASKS:
+            for model_info in models:
+                for group_idx, params in enumerate(all_params[task_key]):
+                    uid = make_unit_id(model_info, task_id, group_idx, params, exp_cfg)
+                    if leases.is_done(uid):
+                        completed.add(uid)
+    
+    profile = token_profile(cassette_dir)
+    rates = feature_rates(RESULTS_DIR, exp_cfg['n_repeats'], exp_cfg['n_rounds'])
+    plan = plan_run(config, TASKS, all_params, completed,
+                    lambda model_info, task_id, group_idx, params:
+                        make_unit_id(model_info, task_id, group_idx, params, exp_cfg),
+                    estimate_trial_seconds(RESULTS_DIR), profile, MAX_WORKERS, retry_rate=retry_rate,
+                    rates=rates)
+    token_source = f"cassette ({cassette_dir})" if profile else "默认估计（无cassette录制）"
+    safe_print("\n[规划] 剩余工作量预测\n" + format_plan(plan, MAX_WORKERS, token_source))
+    overall = rates.get('*', {})
+    if exp_cfg.get('strategy_a', {}).get('gate', {}).get('enabled', False):
+        safe_print(f"[规划] 策略A门控: 按观测跳过率 {overall.get('skip_rate', 0.0):.1%} 折减调用"
+                   + ("" if 'skip_rate' in overall else "（暂无门控记录，按不跳过估计）"))
+    if exp_cfg.get('adaptive', {}).get('enabled', False):
+        safe_print(f"[规划] 序贯早停: 每单元按观测平均 {overall.get('repeats', exp_cfg['n_repeats']):.2f} 次重复估计"
+                   + ("" if 'repeats' in overall else "（暂无记录，按 n_repeats 估计）"))
+    return plan
+
+def report_schedule(schedule, actual_finish, elapsed):
+    """打印各模型预测与实际完成时间"""
+    safe_print("\n[调度] 模型 | 预测完成(分钟) | 实际完成(分钟)")
+    for model_name, predicted in sorted(schedule['model_finish'].items(), key=lambda kv: -kv[1]):
+        actual = actual_finish.get(model_name)
+        actual_str = f"{actual/60:.1f}" if actual is not None else "-"
+        safe_print(f"[调度] {model_name} | {predicted/60:.1f} | {actual_str}")
+    safe_print(f"[调度] 整体 | {schedule['makespan']/60:.1f} | {elapsed/60:.1f}")
+
+def report_routing(status):
+    """打印多endpoint模型的各endpoint请求、错误与摘除次数"""
+    for model_name, endpoints in sorted(status.items()):
+        if len(endpoints) < 2:
+            continue
+        for ep in endpoints:
+            safe_print(f"[路由] {model_name} | {ep['name']} | 请求 {ep['requests']} | "
+                       f"错误 {ep['errors']} | 摘除 {ep['ejections']}")
+
+def report_hedging(report):
+    """打印对冲统计，以及对冲前后trial耗时的p50/p99"""
+    safe_print(f"\n[对冲] 调用 {report['calls']} | 对冲 {report['hedged']}（胜出 {report['wins']}）"
+               f"| 预算拒绝 {report['budget_denied']} | 线程池满 {report['pool_full']} | 超时 {report['deadline_exceeded']}")
+    if report['trials']:
+        safe_print(f"[对冲] trial耗时 p50 {report['p50']:.1f}s (不对冲约 {report['p50_unhedged']:.1f}s) | "
+                   f"p99 {report['p99']:.1f}s (不对冲约 {report['p99_unhedged']:.1f}s)")
+
 def generate_final_report(config, models, tasks, start_time):
     """生成最终报告"""
     safe_print("\n" + "="*70)
@@ -331,37 +847,73 @@ def generate_final_report(config, models, tasks, start_time):
     
     report_lines.append("## 实验结果\n\n")
     
+    # 先收集全部 模型×任务 单元，统计检验在所有单元上一次向量化计算
+    stats_cfg = config['experiment'].get('stats', {})
+    exp_cfg = config['experiment']
+    all_params = ParamGenerator(exp_cfg, seed=exp_cfg['seed']).generate_all_params(exp_cfg['n_param_groups'])
+    cells, rows = [], []
     for task_id, task_key in tasks:
-        report_lines.append(f"### {task_id}\n\n")
-        report_lines.append("| 模型 | 策略A | 策略B | 提升(%) | 实验次数 |\n")
-        report_lines.append("|------|-------|-------|---------|----------|\n")
-        
         for model_info in models:
             model_name = model_info['name']
-            model_dir = RESULTS_DIR / model_name.replace('/', '_').replace('\\', '_')
-            jsonl_file = model_dir / f"{task_id}.jsonl"
             
-            if jsonl_file.exists():
-                a_vals, b_vals = [], []
-                with open(jsonl_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        data = json.loads(line)
-                        a_vals.append(data['a_reward'])
-                        b_vals.append(data['b_reward'])
-                
-                if a_vals and b_vals:
-                    a_mean = np.mean(a_vals)
-                    a_std = np.std(a_vals)
-                    b_mean = np.mean(b_vals)
-                    b_std = np.std(b_vals)
-                    improvement = (b_mean - a_mean) / max(a_mean, 1e-9) * 100
-                    
-                    report_lines.append(f"| {model_name} | {a_mean:.1f}±{a_std:.1f} | "
-                                      f"{b_mean:.1f}±{b_std:.1f} | "
-                                      f"{improvement:.1f}% | {len(a_vals)} |\n")
+            # 只统计当前输入下的记录（旧版记录没有键，保留）；
+            # 同一 (组, 重复) 只保留最后一条，避免分片重复写入影响配对
+            current = {
+                group_idx: unit_key_for(model_info, task_id, params, exp_cfg)
+                for group_idx, params in enumerate(all_params[task_key])
+            }
+            records = {}
+            for data in iter_task_records(model_name, task_id):
+                if 'key' in data and data['key'] != current.get(data['group']):
+                    continue
+                records[(data['group'], data['repeat'])] = data
+            if records:
+                cells.append([(d['group'], d['a_reward'], d['b_reward']) for d in records.values()])
+                rows.append((task_id, model_name, list(records.values())))
+    summaries = summarize_cells(
+        cells,
+        n_resamples=stats_cfg.get('n_resamples', 10000),
+        unit=stats_cfg.get('unit', 'group'),
+        seed=stats_cfg.get('seed', 0)
+    )
+    
+    by_task = defaultdict(list)
+    for (task_id, model_name, records), summary in zip(rows, summaries):
+        by_task[task_id].append((model_name, records, summary))
+    
+    for task_id, task_key in tasks:
+        report_lines.append(f"### {task_id}\n\n")
+        report_lines.append("| 模型 | 策略A | 策略B | 提升(%) [95%CI] | 差值B-A [95%CI] | Wilcoxon p | 置换 p | 遗憾A | 遗憾B | 实验次数 |\n")
+        report_lines.append("|------|-------|-------|-----------------|-----------------|------------|--------|-------|-------|----------|\n")
+        
+        for model_name, records, summary in by_task[task_id]:
+            a_vals = [d['a_reward'] for d in records]
+            b_vals = [d['b_reward'] for d in records]
+            # 旧记录没有动态遗憾字段
+            a_regrets = [d['a_regret'] for d in records if 'a_regret' in d]
+            b_regrets = [d['b_regret'] for d in records if 'b_regret' in d]
+            
+            a_mean = np.mean(a_vals)
+            a_std = np.std(a_vals)
+            b_mean = np.mean(b_vals)
+            b_std = np.std(b_vals)
+            a_regret = f"{np.mean(a_regrets):.1f}" if a_regrets else "-"
+            b_regret = f"{np.mean(b_regrets):.1f}" if b_regrets else "-"
+            
+            report_lines.append(f"| {model_name} | {a_mean:.1f}±{a_std:.1f} | "
+                              f"{b_mean:.1f}±{b_std:.1f} | "
+                              f"{summary['rel']:.1f}% [{summary['rel_lo']:.1f}, {summary['rel_hi']:.1f}] | "
+                              f"{summary['diff']:.1f} [{summary['diff_lo']:.1f}, {summary['diff_hi']:.1f}] | "
+                              f"{summary['p_wilcoxon']:.3g} | {summary['p_perm']:.3g} | "
+                              f"{a_regret} | {b_regret} | {len(a_vals)} |\n")
         
         report_lines.append("\n")
     
+    unit_desc = "按参数组两阶段重采样" if stats_cfg.get('unit', 'group') == 'group' else "按重复独立重采样"
+    report_lines.append(f"注: 提升 = (均值B - 均值A) / 均值A；置信区间为配对bootstrap"
+                        f"（{stats_cfg.get('n_resamples', 10000)}次，{unit_desc}）；"
+                        f"p值为双侧Wilcoxon符号秩检验与符号翻转置换检验。\n\n")
+    
     # 写入报告
     report_file = RESULTS_DIR / "final_summary.md"
     with open(report_file, 'w', encoding='utf-8') as f:
@@ -369,22 +921,65 @@ def generate_final_report(config, models, tasks, start_time):
     
     safe_print(f"✅ 报告已生成: {report_file}")
 
-def main():
+def main(argv=None):
     """主函数"""
+    global RESULTS_DIR, MAX_WORKERS, MAX_IN_FLIGHT
+    
+    parser = argparse.ArgumentParser(description="7模型并发Bandit实验")
+    parser.add_argument("--config", type=str, default=None,
+                        help="配置文件路径 (默认: 脚本目录下的 config.yaml)")
+    parser.add_argument("--cassette", type=str, default="off",
+                        choices=["off", "record", "replay"],
+                        help="LLM交互录制/回放: off | record | replay (默认: off)")
+    parser.add_argument("--cassette_dir", type=str, default=None,
+                        help="cassette目录 (默认: results/cassettes)")
+    parser.add_argument("--results_dir", type=str, default=None,
+                        help="结果目录 (默认: results/，回放模式默认 results_replay/)")
+    parser.add_argument("--shard_id", type=str, default=None,
+                        help="分片ID；多个进程/机器指向同一结果目录并使用不同分片ID即可协作运行")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"最大并发 (默认: {MAX_WORKERS})")
+    parser.add_argument("--plan", action="store_true",
+                        help="只做干跑规划：预测剩余API调用、token、费用与完成时间后退出")
+    parser.add_argument("--retry_rate", type=float, default=0.0,
+                        help="规划时预计重发的调用比例 (默认: 0)")
+    args = parser.parse_args(argv)
+    
+    cassette_dir = Path(args.cassette_dir) if args.cassette_dir else RESULTS_DIR / "cassettes"
+    if args.workers:
+        MAX_WORKERS = args.workers
+        MAX_IN_FLIGHT = MAX_WORKERS * 2
+    if args.results_dir:
+        RESULTS_DIR = Path(args.results_dir)
+    elif args.cassette == 'replay':
+        # 回放结果单独存放，避免与在线结果的进度混在一起
+        RESULTS_DIR = SCRIPT_DIR / "results_replay"
+    
+    cassette = None
+    if args.cassette != 'off':
+        cassette = Cassette(cassette_dir, mode=args.cassette, writer=args.shard_id)
+    
     safe_print(f"脚本目录: {SCRIPT_DIR}")
     safe_print(f"结果目录: {RESULTS_DIR}")
     
-    config_file = SCRIPT_DIR / 'config.yaml'
+    config_file = Path(args.config) if args.config else SCRIPT_DIR / 'config.yaml'
     with open(config_file, 'r', encoding='utf-8') as f:
         config = yaml.safe_load(f)
     
-    # 阶段1: 快速验证
-    if not validate_setup(config):
+    if args.plan:
+        plan_experiment(config, cassette_dir=cassette_dir, retry_rate=args.retry_rate)
+        return
+    
+    if cassette is not None:
+        safe_print(f"cassette模式: {cassette.mode} ({cassette.base_dir})")
+    
+    # 阶段1: 快速验证（回放模式无需网络，跳过）
+    if (cassette is None or cassette.mode == 'record') and not validate_setup(config):
         safe_print("\n❌ 验证失败，终止运行")
         return
     
     # 阶段2: 全量运行
-    run_full_experiment(config)
+    run_full_experiment(config, cassette=cassette, shard_id=args.shard_id)
     
     safe_print("\n" + "="*70)
     safe_print("✅ 所有实验完成！")
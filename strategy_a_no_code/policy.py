@@ -1,17 +1,13 @@
 # strategy_a_no_code/policy.py
 import re
 import numpy as np
-import os
-import sys
 
-# 添加utils路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-utils_dir = os.path.join(parent_dir, 'utils')
-if utils_dir not in sys.path:
-    sys.path.insert(0, utils_dir)
+from utils.shared import availability_table, calc_curves, trial_best_mean, FULL_STATS_MAX_ARMS
 
-from shared import calc_curves
+# 大K模式提示词摘要的默认规模（config.yaml 的 experiment.large_k 可覆盖）
+SUMMARY_DEFAULTS = {'top_k': 10, 'tail_groups': 4, 'unexplored_sample': 5}
+# 置信门控的默认值（config.yaml 的 experiment.strategy_a.gate 可覆盖）
+GATE_DEFAULTS = {'z': 3.0, 'requery_every': 10, 'min_count': 3}
 
 def _parse_action(text, n_arms):
     m = re.search(r"-?\d+", text or "")
@@ -22,16 +18,95 @@ def _parse_action(text, n_arms):
         return a
     return None
 
-def run_trial_no_code(client, model_id, trial, n_rounds=120, temperature=0.1):
-    # 兼容不同类型的trial数据
-    means = np.array(trial.get("means", [0] * trial.get("n_arms", 3)), dtype=float)
-    reward_table = np.array(trial["rewards"], dtype=float)  # [T, K]
-    n_arms = reward_table.shape[1]
+def _parse_action_prefix(text, n_arms):
+    """
+    流式增量解析：返回 (是否已可判定, 动作)
+    第一个整数后面已出现非数字字符，或再追加数字也不可能成为合法臂编号时即可判定
+    """
+    m = re.search(r"-?\d+", text)
+    if not m:
+        return False, None
+    complete = m.end() < len(text)
+    if not complete:
+        v = int(m.group())
+        complete = v < 0 or (v > 0 and v * 10 >= n_arms)
+    if not complete:
+        return False, None
+    return True, _parse_action(text, n_arms)
 
-    history = {i: [] for i in range(n_arms)}
-    actions, rewards = [], []
+def _stream_action(client, model_id, prompt, n_arms, temperature, max_tokens=None):
+    """流式请求，解析到动作后立即关闭流，省去其余输出token"""
+    kwargs = {}
+    if max_tokens:
+        kwargs['max_tokens'] = max_tokens
+    stream = client.chat.completions.create(
+        model=model_id,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        stream=True,
+        **kwargs
+    )
+    text = ""
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text += chunk.choices[0].delta.content or ""
+            done, a = _parse_action_prefix(text, n_arms)
+            if done:
+                return a
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return _parse_action(text, n_arms)
 
-    for t in range(n_rounds):
+def _summary_lines(t, counts, sums, top_k, tail_groups, unexplored_sample, available=None):
+    """
+    大K提示词的有界摘要：未探索臂数与少量编号、UCB前k的已探索臂、其余已探索臂按均值分组
+    每轮 O(K) 数组运算，输出行数与K无关；休眠任务只统计本轮可用的臂
+    """
+    mask = np.ones(len(counts), dtype=bool) if available is None else available
+    explored = np.flatnonzero((counts > 0) & mask)
+    unexplored = np.flatnonzero((counts == 0) & mask)
+    lines = [f"已探索 {len(explored)} 臂，未探索 {len(unexplored)} 臂"]
+    if available is not None:
+        lines[0] = f"本轮可用 {int(mask.sum())} 臂（其余休眠、不可选）；可用臂中" + lines[0]
+    if len(unexplored):
+        sample = ", ".join(str(i) for i in unexplored[:unexplored_sample])
+        lines[0] += f"（未探索编号示例: {sample}）"
+    if not len(explored):
+        return lines
+
+    n = counts[explored]
+    means = sums[explored] / n
+    ucb = means + np.sqrt(2.0 * np.log(t + 1) / n)
+    k = min(top_k, len(explored))
+    top = np.argpartition(-ucb, k - 1)[:k]
+    top = top[np.argsort(-ucb[top], kind='stable')]
+    lines.append(f"UCB前{k}的臂（编号: 次数, 均值, UCB）:")
+    for j in top:
+        lines.append(f"  {explored[j]}: n={n[j]}, mean={means[j]:.2f}, ucb={ucb[j]:.2f}")
+
+    rest = np.ones(len(explored), dtype=bool)
+    rest[top] = False
+    if rest.any() and tail_groups > 0:
+        hist, edges = np.histogram(means[rest], bins=tail_groups)
+        pulls, _ = np.histogram(means[rest], bins=edges, weights=n[rest])
+        lines.append("其余已探索臂按均值分组:")
+        for lo, hi, c, p in zip(edges[:-1], edges[1:], hist, pulls):
+            if c:
+                lines.append(f"  均值[{lo:.2f}, {hi:.2f}]: {c} 臂, 共 {int(p)} 次")
+    return lines
+
+def build_prompt(t, n_arms, history, counts, sums, summary_cfg=None, available=None):
+    """
+    策略A单轮提示词
+    臂数不超过 FULL_STATS_MAX_ARMS 时给出各臂完整统计（原有格式）；
+    更多臂时改用有界摘要，提示词长度不随K增长；
+    available 为休眠任务本轮的可用掩码，给出时提示只能从可用臂中选择
+    """
+    if n_arms <= FULL_STATS_MAX_ARMS:
         # 只给统计摘要，避免 token 爆炸
         arm_stats = {
             i: {
@@ -39,36 +114,143 @@ def run_trial_no_code(client, model_id, trial, n_rounds=120, temperature=0.1):
                 "mean": float(np.mean(history[i])) if history[i] else 0.0
             } for i in range(n_arms)
         }
+        stats_text = f"各臂统计: {arm_stats}"
+        if available is not None:
+            stats_text += f"\n本轮可用臂: {np.flatnonzero(available).tolist()}（其余臂休眠，只能从可用臂中选择）"
+    else:
+        cfg = {**SUMMARY_DEFAULTS, **(summary_cfg or {})}
+        stats_text = "\n".join(_summary_lines(t, counts, sums, cfg['top_k'], cfg['tail_groups'],
+                                              cfg['unexplored_sample'], available))
+
+    return (
+        f"你在做{n_arms}臂老虎机决策。当前轮次 t={t}。\n"
+        f"{stats_text}\n"
+        f"请直接回复下一步动作编号（0到{n_arms-1}之间的整数）。"
+        f"不要解释，不要代码。"
+    )
+
+def _random_arm(rng, n_arms, available=None):
+    """随机兜底；休眠任务只在本轮可用臂中取"""
+    if available is None:
+        return int(rng.integers(0, n_arms))
+    return int(rng.choice(np.flatnonzero(available)))
+
+def _observe(t, a, reward_table, history, counts, sums, sumsq, actions, rewards):
+    """记录一轮结果"""
+    r = float(reward_table[t, a])
+    history[a].append(r)
+    counts[a] += 1
+    sums[a] += r
+    sumsq[a] += r * r
+    actions.append(a)
+    rewards.append(r)
 
-        prompt = (
-            f"你在做{n_arms}臂老虎机决策。当前轮次 t={t}。\n"
-            f"各臂统计: {arm_stats}\n"
-            f"请直接回复下一步动作编号（0到{n_arms-1}之间的整数）。"
-            f"不要解释，不要代码。"
-        )
+def confidence_gap(counts, sums, sumsq, min_count, z=GATE_DEFAULTS['z']):
+    """
+    领先臂的置信差距；领先臂取样本数不少于 min_count（至少2）的臂中均值最高者
+    - 与其余样本充足的臂比较：min_i (均值_领先 - 均值_i) / sqrt(se_领先² + se_i²)
+    - 样本不足的臂用样本充足臂的合并方差算乐观上界 均值_i + z·sqrt(方差/n_i)，
+      上界超过领先臂均值（或从未拉动）时视为未分出胜负，差距为0
+    大K时多数臂样本不足，只要它们的上界落后于领先臂，门控仍可生效；每轮 O(K)
+
+    Returns:
+        (领先臂, 差距的标准误倍数)；没有样本充足的臂时为 (None, 0.0)，
+        其余臂都样本不足且已被排除时差距为 inf
+    """
+    enough = counts >= max(min_count, 2)
+    if len(counts) < 2 or not enough.any():
+        return None, 0.0
+    n = np.maximum(counts, 1)
+    means = sums / n
+    var = np.maximum((sumsq - sums * means) / np.maximum(counts - 1, 1), 1e-12)
+    sampled = np.flatnonzero(enough)
+    leader = int(sampled[np.argmax(means[sampled])])
+
+    few = ~enough
+    if few.any():
+        if counts[few].min() == 0:
+            return leader, 0.0
+        dof = counts[enough] - 1
+        pooled = float(np.sum(var[enough] * dof) / np.sum(dof))
+        upper = means[few] + z * np.sqrt(pooled / n[few])
+        if upper.max() > means[leader]:
+            return leader, 0.0
+
+    others = enough.copy()
+    others[leader] = False
+    if not others.any():
+        return leader, float('inf')
+    se2 = var / n
+    gaps = (means[leader] - means[others]) / np.sqrt(se2[leader] + se2[others])
+    return leader, float(gaps.min())
+
+def run_trial_no_code(client, model_id, trial, n_rounds=120, temperature=0.1, stream=False, max_tokens=None,
+                      large_k=None, rng=None, gate=None):
+    """
+    策略A：每轮把统计摘要发给LLM，直接回复动作编号
+    large_k 为 config.yaml 的 experiment.large_k，提供大K摘要的 top_k / tail_groups / unexplored_sample；
+    rng 为该单元专属的随机数生成器（utils.rng.unit_rng），解析失败时的随机兜底只从中取数，
+    不传时用一个未播种的新生成器；
+    gate 为 experiment.strategy_a.gate，启用时若上次LLM选的正是领先臂、且领先优势超过 z 个标准误，
+    直接沿用该选择不发请求，每 requery_every 轮或领先臂变化/优势跌破阈值时重新询问；
+    跳过的调用数记在返回结果的 skipped 字段；
+    休眠任务（trial 带 availability）每轮只能拉动可用臂，LLM 选中休眠臂按解析失败处理
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    # 兼容不同类型的trial数据
+    reward_table = np.asarray(trial["rewards"], dtype=float)  # [T, K]，trial库中为只读映射视图
+    n_arms = reward_table.shape[1]
+    avail_table = availability_table(trial)
+
+    history = {i: [] for i in range(n_arms)}
+    counts = np.zeros(n_arms, dtype=np.int64)
+    sums = np.zeros(n_arms)
+    sumsq = np.zeros(n_arms)
+    actions, rewards = [], []
+    summary_cfg = {**SUMMARY_DEFAULTS, **(large_k or {})}
+    gate_cfg = {**GATE_DEFAULTS, **gate} if gate and gate.get('enabled', False) else None
+    last_choice, last_query, skipped = None, 0, 0
+
+    for t in range(n_rounds):
+        available = avail_table[t] if avail_table is not None else None
+        if (gate_cfg is not None and last_choice is not None and t - last_query < gate_cfg['requery_every']
+                and (available is None or available[last_choice])):
+            leader, gap = confidence_gap(counts, sums, sumsq, gate_cfg['min_count'], gate_cfg['z'])
+            if leader == last_choice and gap >= gate_cfg['z']:
+                skipped += 1
+                _observe(t, last_choice, reward_table, history, counts, sums, sumsq, actions, rewards)
+                continue
+
+        prompt = build_prompt(t, n_arms, history, counts, sums, summary_cfg, available)
+        last_choice, last_query = None, t
 
         try:
-            resp = client.chat.completions.create(
-                model=model_id,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature
-            )
-            raw = resp.choices[0].message.content
-            a = _parse_action(raw, n_arms)
+            if stream:
+                a = _stream_action(client, model_id, prompt, n_arms, temperature, max_tokens)
+            else:
+                kwargs = {'max_tokens': max_tokens} if max_tokens else {}
+                resp = client.chat.completions.create(
+                    model=model_id,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    **kwargs
+                )
+                raw = resp.choices[0].message.content
+                a = _parse_action(raw, n_arms)
+            if a is not None and available is not None and not available[a]:
+                a = None
             if a is None:
-                a = int(np.random.randint(0, n_arms))
+                a = _random_arm(rng, n_arms, available)
+            else:
+                # 只沿用LLM真正给出的选择，随机兜底不参与门控
+                last_choice = a
         except Exception:
-            a = int(np.random.randint(0, n_arms))
+            a = _random_arm(rng, n_arms, available)
 
-        r = float(reward_table[t, a])
-        history[a].append(r)
-        actions.append(a)
-        rewards.append(r)
+        _observe(t, a, reward_table, history, counts, sums, sumsq, actions, rewards)
 
-    # 计算best_mean
-    if len(means) > 0 and np.max(means) > 0:
-        best_mean = float(np.max(means))
-    else:
-        best_mean = float(trial.get("best_mean", reward_table.max(axis=1).mean()))
-    
-    return calc_curves(actions, rewards, best_mean=best_mean)
+    result = calc_curves(actions, rewards, best_mean=trial_best_mean(trial), oracle=trial.get("oracle"))
+    if gate_cfg is not None:
+        result["skipped"] = skipped
+    return result
@@ -0,0 +1,181 @@
+# strategy_b_with_interpreter/batch_codegen.py
+"""
+策略B代码生成的离线批量推理
+代码生成是互不依赖的一次性请求，不必与策略A的逐轮串行调用争抢交互式endpoint：
+把网格中尚无可复用代码的 (模型, 臂数) 写成服务商风格的批量输入JSONL，
+交给批量推理接口处理，再把对应的输出JSONL导入策略库（复用模式）。
+
+输入行:  {"custom_id", "method": "POST", "url": "/v1/chat/completions", "body": <请求体>}
+输出行:  {"id", "custom_id", "response": {"status_code", "body": <chat completion>}, "error"}
+
+custom_id 为 模型ID|臂数|提示词版本|候选序号；导入时提示词版本已变化的结果会被跳过。
+休眠任务的提示词不同，导入时按提示词版本区分是否为休眠任务的代码。
+process_locally 是本地替身处理器：给定客户端时逐条调用交互接口，不给时返回内置参考策略，
+用于在没有批量接口的环境下测试整条链路。参考策略的输出行带 "origin": "reference"，
+它不是模型生成的代码，ingest_batch_output 默认拒绝导入，以免在复用模式下被记到模型名下。
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
+
+from strategy_b_with_interpreter.policy import extract_code, policy_request
+from strategy_b_with_interpreter.policy_store import prompt_version
+
+BATCH_URL = "/v1/chat/completions"
+
+# 本地替身处理器离线时的回复：向量化UCB1，任意臂数可用
+REFERENCE_POLICY = """```python
+unexplored = np.flatnonzero(counts == 0)
+if len(unexplored):
+    choice = int(unexplored[0])
+else:
+    choice = int(np.argmax(sums / counts + np.sqrt(2 * np.log(t + 1) / counts)))
+```"""
+
+
+def make_custom_id(model_id: str, n_arms: int, version: str, candidate: int) -> str:
+    return f"{model_id}|{n_arms}|{version}|{candidate}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[str, int, str, int]:
+    # 模型ID本身可能含 '|'，从右侧切分
+    model_id, n_arms, version, candidate = custom_id.rsplit("|", 3)
+    return model_id, int(n_arms), version, int(candidate)
+
+
+def _variant(v) -> Tuple[int, bool]:
+    """臂数，或 (臂数, 是否休眠任务)"""
+    if isinstance(v, (tuple, list)):
+        return int(v[0]), bool(v[1])
+    return int(v), False
+
+
+def pending_codegen(store, model_ids: Iterable[str], variants: Iterable) -> List[Tuple[str, int, bool]]:
+    """
+    策略库中当前提示词版本下尚无已验证代码的 (模型ID, 臂数, 是否休眠任务)
+
+    Args:
+        variants: 臂数，或 (臂数, 是否休眠任务)
+    """
+    variants = sorted(set(_variant(v) for v in variants))
+    return [(m, n, sleeping) for m in model_ids for n, sleeping in variants
+            if not store.has_valid_ref(m, n, sleeping)]
+
+
+def write_batch_input(path, pending: Iterable[Tuple[str, int, bool]], candidates: int = 1) -> int:
+    """
+    写批量输入文件
+
+    Args:
+        candidates: 每个 (模型, 臂数) 的候选数；导入时第一份通过验证的被采用
+
+    Returns:
+        写入的请求数
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for model_id, n_arms, sleeping in pending:
+            version = prompt_version(n_arms, sleeping)
+            for i in range(candidates):
+                f.write(json.dumps({
+                    "custom_id": make_custom_id(model_id, n_arms, version, i),
+                    "method": "POST",
+                    "url": BATCH_URL,
+                    "body": policy_request(model_id, n_arms, sleeping),
+                }, ensure_ascii=False) + "\n")
+                n += 1
+    return n
+
+
+def _iter_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _output_line(index: int, custom_id: str, content: str = None, error: str = None,
+                 origin: str = None) -> Dict[str, Any]:
+    if error is not None:
+        return {"id": f"batch_req_{index}", "custom_id": custom_id, "response": None,
+                "error": {"code": "request_failed", "message": error}}
+    line = {
+        "id": f"batch_req_{index}",
+        "custom_id": custom_id,
+        "response": {
+            "status_code": 200,
+            "body": {"object": "chat.completion",
+                     "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                  "finish_reason": "stop"}]},
+        },
+        "error": None,
+    }
+    if origin is not None:
+        line["origin"] = origin
+    return line
+
+
+def process_locally(input_path, output_path, client=None, workers: int = 8) -> int:
+    """
+    本地替身批量处理器：读取输入文件，写出同格式的输出文件
+
+    Args:
+        client: 兼容 chat.completions.create 的客户端；None 时每条返回 REFERENCE_POLICY（标记 origin=reference）
+
+    Returns:
+        处理的请求数
+    """
+    requests = list(_iter_jsonl(input_path))
+
+    def handle(item):
+        index, req = item
+        if client is None:
+            return _output_line(index, req["custom_id"], REFERENCE_POLICY, origin="reference")
+        try:
+            resp = client.chat.completions.create(**req["body"])
+            return _output_line(index, req["custom_id"], resp.choices[0].message.content)
+        except Exception as e:
+            return _output_line(index, req["custom_id"], error=str(e)[:200])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        lines = list(pool.map(handle, enumerate(requests)))
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return len(lines)
+
+
+def ingest_batch_output(output_path, store, sandbox=None, allow_reference: bool = False) -> Dict[str, int]:
+    """
+    把批量输出导入策略库
+
+    Args:
+        allow_reference: 仅供测试：导入本地替身处理器的参考策略输出（应使用单独的策略库）
+
+    Returns:
+        {'valid', 'invalid', 'errors', 'stale', 'reference'}：通过/未通过验证、请求失败、
+        提示词版本已过期、因是参考策略而拒绝的条数
+    """
+    stats = {'valid': 0, 'invalid': 0, 'errors': 0, 'stale': 0, 'reference': 0}
+    for line in _iter_jsonl(output_path):
+        if line.get("origin") == "reference" and not allow_reference:
+            stats['reference'] += 1
+            continue
+        model_id, n_arms, version, _ = parse_custom_id(line["custom_id"])
+        sleeping = version == prompt_version(n_arms, True)
+        if not sleeping and version != prompt_version(n_arms):
+            stats['stale'] += 1
+            continue
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            stats['errors'] += 1
+            continue
+        content = response["body"]["choices"][0]["message"]["content"]
+        _, ok = store.ingest_code(model_id, n_arms, extract_code(content), sandbox=sandbox, sleeping=sleeping)
+        stats['valid' if ok else 'invalid'] += 1
+    return stats
@@ -1,39 +1,116 @@
 # strategy_b_with_interpreter/policy.py
 import io
+import sys
 import math
-import numpy as np
+import threading
 import contextlib
-import os
-import sys
+import numpy as np
+
+from utils.shared import availability_table, calc_curves, trial_best_mean, FULL_STATS_MAX_ARMS
+
+class _ThreadLocalStdout:
+    """
+    按线程重定向的标准输出：设置了捕获缓冲的线程写入自己的缓冲，其余线程照常输出
+    contextlib.redirect_stdout 替换的是进程级 sys.stdout，多线程并发执行策略代码时会互相覆盖、
+    甚至把 sys.stdout 永久留在某个缓冲上
+    """
+    _local = threading.local()
+    _lock = threading.Lock()
+    _installed = None
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        buf = getattr(self._local, 'buf', None)
+        return (buf if buf is not None else self._stream).write(text)
+
+    def flush(self):
+        buf = getattr(self._local, 'buf', None)
+        (buf if buf is not None else self._stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    @classmethod
+    @contextlib.contextmanager
+    def capture(cls, buf):
+        with cls._lock:
+            if sys.stdout is not cls._installed:
+                cls._installed = sys.stdout = cls(sys.stdout)
+        prev = getattr(cls._local, 'buf', None)
+        cls._local.buf = buf
+        try:
+            yield buf
+        finally:
+            cls._local.buf = prev
+
+class _UnitRandom:
+    """单元专属的 np.random：旧式接口（np.random.rand/randint/choice...）走按单元播种的 RandomState，其余属性照旧"""
+
+    def __init__(self, seed):
+        self._state = np.random.RandomState(seed)
+
+    def __getattr__(self, name):
+        try:
+            return getattr(self._state, name)
+        except AttributeError:
+            return getattr(np.random, name)
+
+
+class _UnitNumpy:
+    """解释器中的 np：只把 random 换成单元专属版本，策略代码调用 np.random.* 不再共用进程级随机状态"""
 
-# 添加utils路径
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-utils_dir = os.path.join(parent_dir, 'utils')
-if utils_dir not in sys.path:
-    sys.path.insert(0, utils_dir)
+    def __init__(self, seed):
+        self.random = _UnitRandom(seed)
+
+    def __getattr__(self, name):
+        # 首次访问后缓存，策略代码每轮调用 np.argmax 等不再走 __getattr__
+        value = getattr(np, name)
+        setattr(self, name, value)
+        return value
 
-from shared import calc_curves
 
 class PersistentInterpreter:
-    def __init__(self, n_arms):
+    def __init__(self, n_arms, rng=None, seed=None):
+        """
+        Args:
+            rng: 解释器中的 rng 变量；不给时由 seed 创建
+            seed: 单元种子，同时用于解释器中的 np.random；多线程执行策略代码时各自独立、可复现
+        """
+        if rng is None:
+            rng = np.random.default_rng(seed)
         self.state = {
-            "np": np,
+            "np": _UnitNumpy(seed),
             "math": math,
             "n_arms": n_arms,
             "t": 0,
             "history": {i: [] for i in range(n_arms)},
+            # 数组形式的统计，臂很多时比遍历 history 快
+            "counts": np.zeros(n_arms, dtype=np.int64),
+            "sums": np.zeros(n_arms),
+            # 单元专属随机数生成器，策略代码需要随机性时应使用它而非全局 np.random
+            "rng": rng,
+            # 本轮可用臂掩码；只有休眠任务会出现 False
+            "available": np.ones(n_arms, dtype=bool),
             "choice": 0
         }
 
+    def observe(self, arm, reward):
+        """记录一轮结果：追加历史并更新数组统计"""
+        self.state["history"][arm].append(reward)
+        self.state["counts"][arm] += 1
+        self.state["sums"][arm] += reward
+
     def run(self, code, verbose=False):
         buf = io.StringIO()
         ok, err = True, ""
         try:
-            with contextlib.redirect_stdout(buf):
+            with _ThreadLocalStdout.capture(buf):
                 exec(code, self.state)
         except Exception as e:
-            ok, err = False, str(e)
+            # MemoryError 等异常的 str 为空，带上异常类型
+            ok, err = False, f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
 
         out = buf.getvalue().strip()
         if verbose:
@@ -45,10 +122,26 @@ class PersistentInterpreter:
                 print("[TOOL ERROR]", err)
         return ok, out, err
 
-def fallback_ucb(history, t, n_arms):
-    """兜底UCB算法，确保B稳定不崩"""
+def fallback_ucb(history, t, n_arms, counts=None, sums=None, available=None):
+    """
+    兜底UCB算法，确保B稳定不崩
+    给出 counts/sums（由执行方维护，不受策略代码改写影响）时按数组 O(K) 计算；
+    再给出 available（休眠任务本轮可用掩码）时只在可用臂中选择
+    """
+    if available is not None and counts is not None:
+        arms = np.flatnonzero(available)
+        unexplored = arms[counts[arms] == 0]
+        if len(unexplored):
+            return int(unexplored[0])
+        n = counts[arms]
+        return int(arms[np.argmax(sums[arms] / n + np.sqrt(2.0 * math.log(t + 1) / n))])
     if t < n_arms:
         return t
+    if counts is not None:
+        unexplored = np.flatnonzero(counts == 0)
+        if len(unexplored):
+            return int(unexplored[0])
+        return int(np.argmax(sums / counts + np.sqrt(2.0 * math.log(t + 1) / counts)))
     vals = []
     for i in range(n_arms):
         hist_i = history.get(i, [])
@@ -78,32 +171,59 @@ def fallback_ucb(history, t, n_arms):
         vals.append(avg + bonus)
     return int(np.argmax(vals))
 
-def build_policy_code_with_llm(client, model_id, n_arms):
+# 休眠任务在提示词中追加的变量说明与要求；非休眠任务的提示词保持不变
+_SLEEPING_VAR = "- available: np.ndarray[bool]，本轮可用臂掩码（每轮变化），False 的臂本轮休眠、不可选\n"
+_SLEEPING_RULE = "5) choice 必须是 available 为 True 的臂：探索与 UCB 都只在可用臂中进行\n"
+
+def build_policy_prompt(n_arms, sleeping=False):
     """
-    让 LLM 生成"每轮可执行"的通用 bandit 优化代码（UCB风格）
+    策略代码生成提示词；提示词内容的哈希即策略库中的提示词版本
+    臂数超过 FULL_STATS_MAX_ARMS 时改用数组统计版本，避免生成逐臂遍历列表、逐臂打印的代码；
+    sleeping 为休眠任务，提示词说明解释器中的 available 掩码
     """
-    prompt = f"""
+    var = _SLEEPING_VAR if sleeping else ""
+    rule = _SLEEPING_RULE if sleeping else ""
+    if n_arms > FULL_STATS_MAX_ARMS:
+        return f"""
+你需要输出一段 Python 代码（只输出代码，不要解释），用于每轮决策 {n_arms} 臂老虎机。
+可用变量：
+- t: 当前轮次，从0开始
+- n_arms: 臂数量
+- np: numpy
+- counts: np.ndarray[int]，每个臂被选次数
+- sums: np.ndarray[float]，每个臂奖励之和
+- rng: np.random.Generator，需要随机性时只用 rng（如 rng.random()、rng.integers(n)），不要用 np.random
+{var}你必须：
+1) 给变量 choice 赋值（0 到 {n_arms-1}）
+2) 优先选择 counts 为 0 的臂
+3) 其余情况用 numpy 向量化计算 UCB1：sums/counts + sqrt(2*log(t+1)/counts)，取最大者
+4) 只 print UCB 最高的 5 个臂的 count、mean、ucb（用于工具日志）
+{rule}禁止：
+- 不要修改 counts、sums
+- 不要用 Python 循环遍历所有臂
+- 不要 import 任何库
+"""
+    return f"""
 你需要输出一段 Python 代码（只输出代码，不要解释），用于每轮决策 {n_arms} 臂老虎机。
 可用变量：
 - t: 当前轮次，从0开始
 - n_arms: 臂数量
 - history: dict[int, list[float]]，每个臂历史奖励
-你必须：
+- np: numpy
+- rng: np.random.Generator，需要随机性时只用 rng（如 rng.random()、rng.integers(n)），不要用 np.random
+{var}你必须：
 1) 给变量 choice 赋值（0 到 {n_arms-1}）
 2) 前 n_arms 轮每个臂至少探索一次
 3) 后续使用 UCB1 思路：avg + sqrt(2*log(t+1)/count)
 4) print 当前每个臂 count、mean、ucb（用于工具日志）
-禁止：
+{rule}禁止：
 - 不要重置 history
 - 不要 import 任何库
 """
-    resp = client.chat.completions.create(
-        model=model_id,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.1
-    )
-    raw = resp.choices[0].message.content or ""
-    # 简单提取代码块
+
+def extract_code(raw):
+    """从LLM回复中提取代码块"""
+    raw = raw or ""
     if "```" in raw:
         parts = raw.split("```")
         for p in parts:
@@ -112,41 +232,121 @@ def build_policy_code_with_llm(client, model_id, n_arms):
         return parts[1].strip() if len(parts) > 1 else raw
     return raw.strip()
 
-def run_trial_with_interpreter(client, model_id, trial, n_rounds=120, verbose_tool=False):
+def policy_request(model_id, n_arms, sleeping=False):
+    """策略代码生成请求体；交互调用与离线批量文件共用"""
+    return {
+        "model": model_id,
+        "messages": [{"role": "user", "content": build_policy_prompt(n_arms, sleeping)}],
+        "temperature": 0.1
+    }
+
+def build_policy_code_with_llm(client, model_id, n_arms, sleeping=False):
+    """
+    让 LLM 生成"每轮可执行"的通用 bandit 优化代码（UCB风格）
+    """
+    resp = client.chat.completions.create(**policy_request(model_id, n_arms, sleeping))
+    return extract_code(resp.choices[0].message.content)
+
+def _checked_choice(a, t, n_arms, counts, sums, available):
+    """越界的选择截断到合法范围；休眠任务中选中休眠臂时改由 fallback_ucb 在可用臂中选"""
+    a = int(np.clip(a, 0, n_arms - 1))
+    if available is not None and not available[a]:
+        a = fallback_ucb(None, t, n_arms, counts, sums, available)
+    return a
+
+def _run_rounds_in_sandbox(sandbox, code, reward_table, n_rounds, verbose_tool=False, seed=None,
+                           avail_table=None):
+    """在沙箱子进程中逐轮执行策略代码，本地保留一份数组统计供 fallback_ucb 使用"""
+    n_arms = reward_table.shape[1]
+    counts = np.zeros(n_arms, dtype=np.int64)
+    sums = np.zeros(n_arms)
+    actions, rewards = [], []
+    last = None
+    with sandbox.session(code, n_arms, seed=seed) as sess:
+        for t in range(n_rounds):
+            verbose = verbose_tool and (t < 3 or t % 50 == 0)
+            available = avail_table[t] if avail_table is not None else None
+            ok, a, out, err = sess.step(t, last, verbose=verbose, available=available)
+            if verbose:
+                print("\n[TOOL CALL] 沙箱执行代码:")
+                print(code)
+                print("[TOOL OUTPUT]")
+                print(out if out else "(无输出)")
+                if not ok:
+                    print("[TOOL ERROR]", err)
+            if not ok or a is None:
+                a = fallback_ucb(None, t, n_arms, counts, sums, available)
+
+            a = _checked_choice(a, t, n_arms, counts, sums, available)
+            r = float(reward_table[t, a])
+
+            counts[a] += 1
+            sums[a] += r
+            actions.append(a)
+            rewards.append(r)
+            last = (a, r)
+    return actions, rewards
+
+def run_trial_with_interpreter(client, model_id, trial, n_rounds=120, verbose_tool=False, sandbox=None,
+                               policy_store=None, rng=None):
+    """
+    策略B：LLM生成一次策略代码，每轮交给解释器执行
+    传入 sandbox（SandboxPool）时代码在隔离子进程中执行，超时/超内存回退到 fallback_ucb；
+    传入 policy_store（PolicyStore）时策略代码经由策略库获取（按配置每trial生成或复用已验证代码）；
+    rng 为该单元专属的随机数生成器，从中取一个种子：解释器（进程内或沙箱子进程）中的 rng 与 np.random
+    都由它播种，两种执行方式结果一致；
+    休眠任务每轮把可用掩码放进解释器的 available 变量，策略选中休眠臂时由 fallback_ucb 在可用臂中改选
+    """
+    if rng is None:
+        rng = np.random.default_rng()
     # 兼容不同类型的trial数据
-    means = np.array(trial.get("means", [0] * trial.get("n_arms", 3)), dtype=float)
-    reward_table = np.array(trial["rewards"], dtype=float)
+    reward_table = np.asarray(trial["rewards"], dtype=float)
     n_arms = reward_table.shape[1]
+    avail_table = availability_table(trial)
+    seed = int(rng.integers(2 ** 32))
 
-    interp = PersistentInterpreter(n_arms=n_arms)
+    interp = PersistentInterpreter(n_arms=n_arms, seed=seed)
+    counts = np.zeros(n_arms, dtype=np.int64)
+    sums = np.zeros(n_arms)
     actions, rewards = [], []
 
     # 只让LLM生成一次策略代码；每轮交给解释器执行（稳定 + 快）
-    code = build_policy_code_with_llm(client, model_id, n_arms=n_arms)
-
-    for t in range(n_rounds):
-        interp.state["t"] = t
-        ok, _, _ = interp.run(code, verbose=verbose_tool and (t < 3 or t % 50 == 0))
-        if ok:
-            a = interp.state.get("choice", 0)
-            try:
-                a = int(a)
-            except Exception:
-                a = fallback_ucb(interp.state["history"], t, n_arms)
-        else:
-            a = fallback_ucb(interp.state["history"], t, n_arms)
-
-        a = int(np.clip(a, 0, n_arms - 1))
-        r = float(reward_table[t, a])
-
-        interp.state["history"][a].append(r)
-        actions.append(a)
-        rewards.append(r)
-
-    # 计算best_mean
-    if len(means) > 0 and np.max(means) > 0:
-        best_mean = float(np.max(means))
+    policy_sha = None
+    sleeping = avail_table is not None
+    if policy_store is not None:
+        code, policy_sha = policy_store.get_code(client, model_id, n_arms, sandbox=sandbox, sleeping=sleeping)
+    else:
+        code = build_policy_code_with_llm(client, model_id, n_arms=n_arms, sleeping=sleeping)
+
+    if sandbox is not None:
+        actions, rewards = _run_rounds_in_sandbox(sandbox, code, reward_table, n_rounds, verbose_tool,
+                                                  seed=seed, avail_table=avail_table)
     else:
-        best_mean = float(trial.get("best_mean", reward_table.max(axis=1).mean()))
-    
-    return calc_curves(actions, rewards, best_mean=best_mean)
+        for t in range(n_rounds):
+            available = avail_table[t] if avail_table is not None else None
+            interp.state["t"] = t
+            if available is not None:
+                interp.state["available"] = available.copy()
+            ok, _, _ = interp.run(code, verbose=verbose_tool and (t < 3 or t % 50 == 0))
+            if ok:
+                a = interp.state.get("choice", 0)
+                try:
+                    a = int(a)
+                except Exception:
+                    a = fallback_ucb(None, t, n_arms, counts, sums, available)
+            else:
+                a = fallback_ucb(None, t, n_arms, counts, sums, available)
+
+            a = _checked_choice(a, t, n_arms, counts, sums, available)
+            r = float(reward_table[t, a])
+
+            interp.observe(a, r)
+            counts[a] += 1
+            sums[a] += r
+            actions.append(a)
+            rewards.append(r)
+
+    result = calc_curves(actions, rewards, best_mean=trial_best_mean(trial), oracle=trial.get("oracle"))
+    if policy_sha is not None:
+        result["policy_sha"] = policy_sha
+    return result
@@ -0,0 +1,264 @@
+# strategy_b_with_interpreter/policy_store.py
+"""
+策略B代码的版本化制品库
+LLM生成的策略代码按内容哈希保存，附带提示词版本、模型、臂数与验证结果
+（能否编译、是否给 choice 赋合法值、能否连续跑 N 轮干跑）。
+
+两种模式：
+- per_trial: 每个trial重新生成（原有行为），制品仅用于留档
+- reuse:     每个 (模型, 臂数, 提示词版本) 复用一份已验证的代码，只在首次或验证失败时调用LLM
+
+休眠任务的提示词多出 available 掩码的说明，提示词版本不同，与非休眠任务各自复用一份代码。
+
+目录布局:
+    <dir>/objects/<sha256>.json                        制品（代码 + 元数据）
+    <dir>/refs/<模型>/<臂数>-<提示词版本>.json          复用模式下指向已验证制品
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from strategy_b_with_interpreter.policy import (
+    PersistentInterpreter, build_policy_code_with_llm, build_policy_prompt
+)
+
+MODES = ("per_trial", "reuse")
+
+
+def prompt_version(n_arms: int, sleeping: bool = False) -> str:
+    """提示词内容哈希：改动提示词后自动成为新版本，不会复用旧代码"""
+    return hashlib.sha256(build_policy_prompt(n_arms, sleeping).encode("utf-8")).hexdigest()[:12]
+
+
+def _dry_rewards(n_arms: int, n_rounds: int) -> np.ndarray:
+    """干跑用的固定奖励表"""
+    rng = np.random.default_rng(0)
+    means = np.linspace(2.0, 8.0, n_arms)
+    return rng.normal(means, 1.0, size=(n_rounds, n_arms))
+
+
+def _dry_availability(n_arms: int, n_rounds: int) -> np.ndarray:
+    """休眠任务干跑用的固定可用掩码，每轮至少一个臂可用"""
+    rng = np.random.default_rng(1)
+    mask = rng.random((n_rounds, n_arms)) >= 0.3
+    mask[np.arange(n_rounds), rng.integers(0, n_arms, n_rounds)] = True
+    return mask
+
+
+def validate_policy_code(code: str, n_arms: int, dry_rounds: int = 20, sandbox=None,
+                         sleeping: bool = False) -> Dict[str, Any]:
+    """
+    验证策略代码；sleeping 时干跑带可用掩码，选中休眠臂视为不合格
+
+    Returns:
+        {'compiled', 'sets_choice', 'dry_rounds', 'ok', 'error'}；
+        dry_rounds 为连续成功执行并给出合法 choice 的轮数
+    """
+    report = {'compiled': False, 'sets_choice': False, 'dry_rounds': 0, 'ok': False, 'error': ''}
+    try:
+        compiled = compile(code, "<policy>", "exec")
+    except Exception as e:
+        report['error'] = f"编译失败: {e}"
+        return report
+    report['compiled'] = True
+
+    rewards = _dry_rewards(n_arms, dry_rounds)
+    avail = _dry_availability(n_arms, dry_rounds) if sleeping else None
+    if sandbox is not None:
+        # 有沙箱时在隔离子进程中干跑，避免不可信代码在主进程里卡死
+        with sandbox.session(code, n_arms) as sess:
+            last = None
+            for t in range(dry_rounds):
+                ok, choice, _, err = sess.step(t, last, available=avail[t] if sleeping else None)
+                if not ok or choice is None or not 0 <= choice < n_arms:
+                    report['error'] = err or f"第{t}轮 choice 非法: {choice}"
+                    break
+                if sleeping and not avail[t, choice]:
+                    report['error'] = f"第{t}轮 choice 为休眠臂: {choice}"
+                    break
+                report['sets_choice'] = True
+                report['dry_rounds'] = t + 1
+                last = (choice, float(rewards[t, choice]))
+    else:
+        interp = PersistentInterpreter(n_arms=n_arms)
+        for t in range(dry_rounds):
+            interp.state["t"] = t
+            interp.state["choice"] = None
+            if sleeping:
+                interp.state["available"] = avail[t].copy()
+            ok, _, err = interp.run(compiled)
+            choice = interp.state.get("choice")
+            if not ok:
+                report['error'] = f"第{t}轮执行失败: {err}"
+                break
+            try:
+                choice = int(choice)
+            except Exception:
+                report['error'] = f"第{t}轮未给 choice 赋值"
+                break
+            if not 0 <= choice < n_arms:
+                report['error'] = f"第{t}轮 choice 越界: {choice}"
+                break
+            if sleeping and not avail[t, choice]:
+                report['error'] = f"第{t}轮 choice 为休眠臂: {choice}"
+                break
+            report['sets_choice'] = True
+            report['dry_rounds'] = t + 1
+            interp.observe(choice, float(rewards[t, choice]))
+
+    report['ok'] = report['dry_rounds'] == dry_rounds
+    return report
+
+
+def _atomic_write_json(path: Path, data: Dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class PolicyStore:
+    """策略代码制品库，线程安全；同一 (模型, 臂数) 在复用模式下只有一个线程去生成"""
+
+    def __init__(self, base_dir, mode: str = "per_trial", dry_rounds: int = 20, max_attempts: int = 3):
+        """
+        Args:
+            mode: per_trial / reuse
+            dry_rounds: 验证时干跑的轮数
+            max_attempts: 复用模式下生成不出合格代码时最多调用LLM的次数
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的策略库模式: {mode}（可选: {', '.join(MODES)}）")
+        self.base_dir = Path(base_dir)
+        self.mode = mode
+        self.dry_rounds = dry_rounds
+        self.max_attempts = max_attempts
+        self._cache: Dict[Tuple[str, int, str], Tuple[str, str]] = {}
+        self._locks: Dict[Tuple[str, int, str], threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.stats = {'generated': 0, 'reused': 0, 'invalid': 0}
+
+    def _ref_path(self, model_id: str, n_arms: int, version: str) -> Path:
+        safe = model_id.replace('/', '_').replace('\\', '_')
+        return self.base_dir / "refs" / safe / f"{n_arms}-{version}.json"
+
+    def _object_path(self, sha: str) -> Path:
+        return self.base_dir / "objects" / f"{sha}.json"
+
+    def _lock(self, key) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def load(self, sha: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希读取制品"""
+        try:
+            with open(self._object_path(sha), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, code: str, model_id: str, n_arms: int, validation: Dict[str, Any],
+             sleeping: bool = False) -> str:
+        """保存制品（内容相同则覆盖为最新验证结果），返回内容哈希"""
+        sha = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        _atomic_write_json(self._object_path(sha), {
+            'sha': sha,
+            'code': code,
+            'model_id': model_id,
+            'n_arms': n_arms,
+            'prompt_version': prompt_version(n_arms, sleeping),
+            'sleeping': sleeping,
+            'validation': validation,
+            'created': datetime.now().isoformat(),
+        })
+        return sha
+
+    def _valid_ref(self, model_id: str, n_arms: int, version: str) -> Optional[Dict[str, Any]]:
+        """引用指向的已验证制品；没有引用或制品未通过验证时返回None"""
+        ref_path = self._ref_path(model_id, n_arms, version)
+        if not ref_path.exists():
+            return None
+        with open(ref_path, "r", encoding="utf-8") as f:
+            artifact = self.load(json.load(f)['sha'])
+        if artifact is not None and artifact['validation'].get('ok'):
+            return artifact
+        return None
+
+    def has_valid_ref(self, model_id: str, n_arms: int, sleeping: bool = False) -> bool:
+        """当前提示词版本下该 (模型, 臂数) 是否已有可复用的已验证代码"""
+        return self._valid_ref(model_id, n_arms, prompt_version(n_arms, sleeping)) is not None
+
+    def ingest_code(self, model_id: str, n_arms: int, code: str, sandbox=None,
+                    sleeping: bool = False) -> Tuple[str, bool]:
+        """
+        导入外部生成的代码（如离线批量推理结果）：验证并保存制品；
+        通过验证且该 (模型, 臂数) 尚无可复用代码时写入引用
+
+        Returns:
+            (sha, 是否通过验证)
+        """
+        validation = validate_policy_code(code, n_arms, self.dry_rounds, sandbox=sandbox, sleeping=sleeping)
+        sha = self.save(code, model_id, n_arms, validation, sleeping)
+        version = prompt_version(n_arms, sleeping)
+        key = (model_id, n_arms, version)
+        with self._lock(key):
+            if validation['ok'] and self._valid_ref(model_id, n_arms, version) is None:
+                _atomic_write_json(self._ref_path(model_id, n_arms, version),
+                                   {'sha': sha, 'updated': datetime.now().isoformat()})
+                self._cache[key] = (code, sha)
+        return sha, validation['ok']
+
+    def _generate(self, client, model_id: str, n_arms: int, sandbox=None,
+                  sleeping: bool = False) -> Tuple[str, str, bool]:
+        code = build_policy_code_with_llm(client, model_id, n_arms, sleeping)
+        validation = validate_policy_code(code, n_arms, self.dry_rounds, sandbox=sandbox, sleeping=sleeping)
+        sha = self.save(code, model_id, n_arms, validation, sleeping)
+        with self._locks_guard:
+            self.stats['generated'] += 1
+            self.stats['invalid'] += not validation['ok']
+        return code, sha, validation['ok']
+
+    def get_code(self, client, model_id: str, n_arms: int, sandbox=None, sleeping: bool = False) -> Tuple[str, str]:
+        """
+        取策略代码；sleeping 为休眠任务（提示词与验证都带可用掩码）
+
+        Returns:
+            (code, sha)；复用模式下若 max_attempts 次都未通过验证，返回最后一次的代码
+            （运行时由 fallback_ucb 兜底），且不写入引用，下个trial会重新尝试
+        """
+        if self.mode == "per_trial":
+            code, sha, _ = self._generate(client, model_id, n_arms, sandbox, sleeping)
+            return code, sha
+
+        version = prompt_version(n_arms, sleeping)
+        key = (model_id, n_arms, version)
+        with self._lock(key):
+            if key in self._cache:
+                with self._locks_guard:
+                    self.stats['reused'] += 1
+                return self._cache[key]
+
+            artifact = self._valid_ref(model_id, n_arms, version)
+            if artifact is not None:
+                self._cache[key] = (artifact['code'], artifact['sha'])
+                with self._locks_guard:
+                    self.stats['reused'] += 1
+                return self._cache[key]
+
+            ref_path = self._ref_path(model_id, n_arms, version)
+
+            code, sha = "", ""
+            for _ in range(self.max_attempts):
+                code, sha, ok = self._generate(client, model_id, n_arms, sandbox, sleeping)
+                if ok:
+                    _atomic_write_json(ref_path, {'sha': sha, 'updated': datetime.now().isoformat()})
+                    self._cache[key] = (code, sha)
+                    break
+            return code, sha
@@ -0,0 +1,245 @@
+# strategy_b_with_interpreter/sandbox.py
+"""
+沙箱解释器进程池
+LLM 生成的策略代码在预先启动的子进程中执行，每轮有 CPU 时间上限，进程有 RLIMIT_AS 内存上限；
+超时或崩溃的子进程被杀掉并替换，当前 trial 剩余轮次回退到 fallback_ucb。
+每轮 IPC 只传递上一轮的 (arm, reward) 增量，历史由子进程自己维护；休眠任务另附按位打包的本轮可用掩码。
+"""
+import multiprocessing as mp
+import os
+import queue
+import signal
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # 非Unix平台没有rlimit
+    resource = None
+
+
+class _RoundTimeout(Exception):
+    """单轮CPU时间超限"""
+
+
+def _on_cpu_limit(signum, frame):
+    raise _RoundTimeout("单轮CPU时间超限")
+
+
+def _address_space_bytes():
+    """当前进程虚拟地址空间大小（字节），读取失败返回0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _worker_main(conn, cpu_seconds, memory_mb):
+    """子进程主循环：init 创建新解释器会话，step 执行一轮"""
+    from strategy_b_with_interpreter.policy import PersistentInterpreter
+
+    if resource is not None and memory_mb:
+        # 在已加载的模块之上再留 memory_mb 的余量
+        limit = _address_space_bytes() + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGPROF, _on_cpu_limit)
+
+    interp, code = None, None
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        kind = msg[0]
+        if kind == "close":
+            return
+        if kind == "init":
+            _, source, n_arms, seed = msg
+            # 解释器里的 rng 与 np.random 按种子独立播种；子进程独占一个trial，全局 np.random 也一并播种
+            np.random.seed(seed)
+            interp = PersistentInterpreter(n_arms=n_arms, seed=seed)
+            try:
+                code = compile(source, "<policy>", "exec")
+                conn.send(("ok",))
+            except Exception as e:
+                code = None
+                conn.send(("err", str(e)))
+            continue
+
+        # step: 先把上一轮结果追加进历史，再执行一轮
+        _, t, last, verbose, available = msg
+        if last is not None:
+            interp.observe(last[0], last[1])
+        interp.state["t"] = t
+        if available is not None:
+            bits, n = available
+            interp.state["available"] = np.unpackbits(np.frombuffer(bits, dtype=np.uint8), count=n).astype(bool)
+        if code is None:
+            conn.send(("err", None, "", "代码编译失败"))
+            continue
+        if hasattr(signal, "setitimer"):
+            signal.setitimer(signal.ITIMER_PROF, cpu_seconds)
+        try:
+            ok, out, err = interp.run(code, verbose=False)
+        except _RoundTimeout as e:
+            # 策略代码自身的 except Exception 之外逃逸出来的超时
+            ok, out, err = False, "", str(e)
+        except MemoryError:
+            ok, out, err = False, "", "内存超限"
+        finally:
+            if hasattr(signal, "setitimer"):
+                signal.setitimer(signal.ITIMER_PROF, 0)
+        choice = None
+        if ok:
+            try:
+                choice = int(interp.state.get("choice", 0))
+            except Exception as e:
+                ok, err = False, str(e)
+        conn.send(("ok" if ok else "err", choice, out if verbose else "", err))
+
+
+class _Worker:
+    def __init__(self, ctx, cpu_seconds, memory_mb):
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, memory_mb),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.sessions = 0
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except Exception:
+            pass
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class SandboxSession:
+    """一次trial独占一个子进程；子进程失效后 step 一律返回失败，由调用方走 fallback_ucb"""
+
+    def __init__(self, pool: "SandboxPool", worker: _Worker):
+        self.pool = pool
+        self.worker = worker
+        self.dead = False
+
+    def _request(self, msg):
+        if self.dead:
+            return None
+        try:
+            self.worker.conn.send(msg)
+            if self.worker.conn.poll(self.pool.wall_timeout):
+                return self.worker.conn.recv()
+        except (EOFError, OSError):
+            pass
+        # 超时或子进程崩溃：杀掉并替换，本会话剩余轮次回退
+        self.dead = True
+        self.pool._replace(self.worker)
+        self.worker = None
+        return None
+
+    def init(self, code, n_arms, seed=None):
+        reply = self._request(("init", code, n_arms, seed))
+        return reply is not None and reply[0] == "ok"
+
+    def step(self, t, last=None, verbose=False, available=None):
+        """
+        执行一轮
+
+        Args:
+            t: 当前轮次
+            last: 上一轮的 (arm, reward)，首轮为None
+            available: 休眠任务本轮的可用掩码，其余任务为None
+
+        Returns:
+            (ok, choice, out, err)
+        """
+        if available is not None:
+            available = np.packbits(available).tobytes(), len(available)
+        reply = self._request(("step", t, last, verbose, available))
+        if reply is None:
+            return False, None, "", "沙箱超时或崩溃"
+        status, choice, out, err = reply
+        return status == "ok", choice, out, err
+
+    def close(self):
+        if self.worker is not None:
+            self.pool._release(self.worker)
+            self.worker = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SandboxPool:
+    """
+    预启动的沙箱子进程池
+
+    使用 forkserver 启动子进程，避免从多线程runner直接fork
+    """
+
+    def __init__(self, n_workers: int = 8, cpu_seconds: float = 1.0, memory_mb: int = 512,
+                 max_sessions_per_worker: int = 50):
+        """
+        Args:
+            n_workers: 子进程数量
+            cpu_seconds: 每轮CPU时间上限（秒）
+            memory_mb: 子进程内存余量上限（MB，RLIMIT_AS）
+            max_sessions_per_worker: 每个子进程服务多少个trial后回收重建
+        """
+        methods = mp.get_all_start_methods()
+        self.ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        # 墙钟超时兜底：CPU计时器无法打断的情况（如阻塞在C扩展里）
+        self.wall_timeout = cpu_seconds * 2 + 1.0
+        self.max_sessions_per_worker = max_sessions_per_worker
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(n_workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self.ctx, self.cpu_seconds, self.memory_mb)
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        if not self._closed:
+            self._idle.put(self._spawn())
+
+    def _release(self, worker: _Worker):
+        worker.sessions += 1
+        if worker.sessions >= self.max_sessions_per_worker or not worker.process.is_alive():
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+
+    def session(self, code: str, n_arms: int, seed: int = None) -> SandboxSession:
+        """取一个空闲子进程（没有时阻塞等待），加载策略代码；seed 为该trial子进程的随机种子"""
+        sess = SandboxSession(self, self._idle.get())
+        # 编译失败时会话仍可用，之后每轮返回失败并回退到 fallback_ucb
+        sess.init(code, n_arms, seed)
+        return sess
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                worker.conn.send(("close",))
+            except (EOFError, OSError):
+                pass
+            worker.kill()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# 测试直接导入仓库根目录下的包（utils、strategy_*、run_fixed）与 quick start 下的脚本（目录名含空格）
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "quick start")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+TESTS = os.path.dirname(os.path.abspath(__file__))
+if TESTS not in sys.path:
+    sys.path.insert(0, TESTS)
@@ -0,0 +1,19 @@
+"""测试用的假客户端：接口兼容 client.chat.completions.create"""
+from types import SimpleNamespace
+
+
+def completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=None))])
+
+
+class FakeClient:
+    """按 reply(messages, kwargs) 的返回值作答，记录每次调用"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return completion(self.reply(kwargs["messages"], kwargs))
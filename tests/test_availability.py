@@ -0,0 +1,91 @@
+import numpy as np
+
+from fakes import FakeClient
+from strategy_a_no_code.policy import build_prompt, run_trial_no_code
+from strategy_b_with_interpreter.policy import fallback_ucb, run_trial_with_interpreter
+from utils.param_generator import create_trial_from_params
+
+PARAMS = {'n_arms': 4, 'mean_low': 2.0, 'mean_high': 9.0, 'sigma': 1.0, 'seed': 7, 'sleep_prob': 0.5}
+
+
+def _sleeping_trial(n_rounds=60):
+    trial = create_trial_from_params(PARAMS, n_rounds)
+    return trial, np.asarray(trial['availability'], dtype=bool)
+
+
+def _assert_only_available(result, availability, trial):
+    actions = np.asarray(result['actions'])
+    assert availability[np.arange(len(actions)), actions].all()
+    # 只拉可用臂时，每轮期望奖励不超过oracle
+    means = np.asarray(trial['means'])
+    assert (np.asarray(trial['oracle'])[:len(actions)] >= means[actions] - 1e-12).all()
+
+
+def test_strategy_a_never_pulls_asleep_arm():
+    trial, availability = _sleeping_trial()
+    # 总是回答最优臂，不管它是否休眠
+    best = str(int(np.argmax(trial['means'])))
+    client = FakeClient(lambda messages, kwargs: best)
+    result = run_trial_no_code(client, 'm', trial, n_rounds=60, rng=np.random.default_rng(0))
+    _assert_only_available(result, availability, trial)
+    assert "本轮可用臂" in client.calls[0]['messages'][0]['content']
+
+
+def test_strategy_b_never_pulls_asleep_arm():
+    trial, availability = _sleeping_trial()
+    client = FakeClient(lambda messages, kwargs: "```python\nchoice = 0\n```")
+    result = run_trial_with_interpreter(client, 'm', trial, n_rounds=60, rng=np.random.default_rng(0))
+    _assert_only_available(result, availability, trial)
+
+
+def test_strategy_b_code_sees_available_mask():
+    trial, availability = _sleeping_trial()
+    code = "```python\nchoice = int(np.flatnonzero(available)[-1])\n```"
+    result = run_trial_with_interpreter(FakeClient(lambda m, k: code), 'm', trial, n_rounds=60)
+    expected = [int(np.flatnonzero(row)[-1]) for row in availability]
+    assert result['actions'] == expected
+
+
+def test_fallback_ucb_respects_mask():
+    counts = np.array([5, 0, 3, 2])
+    sums = np.array([50.0, 0.0, 3.0, 2.0])
+    available = np.array([True, False, True, True])
+    # 未探索的臂1休眠，不能被选中
+    assert fallback_ucb(None, 10, 4, counts, sums, available) == 0
+    assert fallback_ucb(None, 10, 4, counts, sums, np.array([False, False, True, True])) in (2, 3)
+
+
+def test_prompt_unchanged_without_availability():
+    history = {i: [] for i in range(3)}
+    zeros = np.zeros(3)
+    assert build_prompt(0, 3, history, zeros.astype(int), zeros) == build_prompt(
+        0, 3, history, zeros.astype(int), zeros, available=None)
+    assert "本轮可用" not in build_prompt(0, 3, history, zeros.astype(int), zeros)
+
+
+def test_strategy_b_prompt_documents_available_only_for_sleeping():
+    from strategy_b_with_interpreter.policy import build_policy_prompt
+    from strategy_b_with_interpreter.policy_store import prompt_version
+    for n_arms in (4, 50):
+        assert "available" in build_policy_prompt(n_arms, sleeping=True)
+        assert "available" not in build_policy_prompt(n_arms)
+        assert prompt_version(n_arms, True) != prompt_version(n_arms)
+
+
+def test_strategy_b_choices_come_from_policy_code():
+    trial, availability = _sleeping_trial()
+    # 遵循提示词的策略代码：选本轮可用臂中编号最大的；fallback_ucb 不会这样选
+    code = "```python\nchoice = int(np.flatnonzero(available)[-1])\n```"
+    client = FakeClient(lambda messages, kwargs: code)
+    result = run_trial_with_interpreter(client, 'm', trial, n_rounds=60, rng=np.random.default_rng(0))
+    assert "available" in client.calls[0]['messages'][0]['content']
+    expected = [int(np.flatnonzero(row)[-1]) for row in availability[:60]]
+    assert result['actions'] == expected
+
+
+def test_policy_validation_rejects_code_ignoring_available():
+    from strategy_b_with_interpreter.policy_store import validate_policy_code
+    assert validate_policy_code("choice = 0", 4)['ok']
+    report = validate_policy_code("choice = 0", 4, sleeping=True)
+    assert not report['ok'] and "休眠臂" in report['error']
+    assert validate_policy_code("choice = int(np.flatnonzero(available)[0])", 4, sleeping=True)['ok']
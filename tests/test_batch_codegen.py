@@ -0,0 +1,65 @@
+import json
+
+from fakes import FakeClient
+from strategy_b_with_interpreter import batch_codegen
+from strategy_b_with_interpreter.policy_store import PolicyStore
+
+MODELS = ["vendor|model-a", "model-b"]
+
+
+def _prepare(tmp_path, store):
+    pending = batch_codegen.pending_codegen(store, MODELS, [3, 5, 3])
+    assert pending == [(m, n, False) for m in MODELS for n in (3, 5)]
+    input_path = tmp_path / "batch" / "in.jsonl"
+    assert batch_codegen.write_batch_input(input_path, pending) == 4
+    return input_path
+
+
+def test_reference_outputs_are_refused(tmp_path):
+    store = PolicyStore(tmp_path / "policies", mode="reuse")
+    input_path = _prepare(tmp_path, store)
+    output_path = tmp_path / "batch" / "out.jsonl"
+    assert batch_codegen.process_locally(input_path, output_path) == 4
+    lines = [json.loads(l) for l in open(output_path, encoding="utf-8")]
+    assert all(l["origin"] == "reference" for l in lines)
+
+    stats = batch_codegen.ingest_batch_output(output_path, store)
+    assert stats == {'valid': 0, 'invalid': 0, 'errors': 0, 'stale': 0, 'reference': 4}
+    assert not (tmp_path / "policies").exists()
+    assert len(batch_codegen.pending_codegen(store, MODELS, [3, 5])) == 4
+
+
+def test_reference_round_trip_when_allowed(tmp_path):
+    store = PolicyStore(tmp_path / "policies_reference", mode="reuse")
+    input_path = _prepare(tmp_path, store)
+    output_path = tmp_path / "batch" / "out.jsonl"
+    batch_codegen.process_locally(input_path, output_path)
+    stats = batch_codegen.ingest_batch_output(output_path, store, allow_reference=True)
+    assert stats['valid'] == 4 and stats['reference'] == 0
+    assert batch_codegen.pending_codegen(store, MODELS, [3, 5]) == []
+
+
+def test_model_outputs_round_trip(tmp_path):
+    store = PolicyStore(tmp_path / "policies", mode="reuse")
+    input_path = _prepare(tmp_path, store)
+    output_path = tmp_path / "batch" / "out.jsonl"
+    client = FakeClient(lambda m, k: batch_codegen.REFERENCE_POLICY)
+    batch_codegen.process_locally(input_path, output_path, client=client)
+    assert len(client.calls) == 4
+    lines = [json.loads(l) for l in open(output_path, encoding="utf-8")]
+    assert all("origin" not in l for l in lines)
+
+    stats = batch_codegen.ingest_batch_output(output_path, store)
+    assert stats['valid'] == 4
+    assert batch_codegen.pending_codegen(store, MODELS, [3, 5]) == []
+
+
+def test_stale_and_failed_outputs(tmp_path):
+    store = PolicyStore(tmp_path / "policies", mode="reuse")
+    output_path = tmp_path / "out.jsonl"
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(batch_codegen._output_line(0, batch_codegen.make_custom_id("m", 3, "old", 0), "x")) + "\n")
+        custom_id = batch_codegen.make_custom_id("m", 3, batch_codegen.prompt_version(3), 0)
+        f.write(json.dumps(batch_codegen._output_line(1, custom_id, error="boom")) + "\n")
+    stats = batch_codegen.ingest_batch_output(output_path, store)
+    assert stats['stale'] == 1 and stats['errors'] == 1 and stats['valid'] == 0
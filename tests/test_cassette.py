@@ -0,0 +1,79 @@
+import gzip
+import multiprocessing as mp
+
+import pytest
+
+from fakes import FakeClient
+from utils.cassette import Cassette, CassetteMiss
+
+
+def _record(base, writer, unit_key, content, model="m", task="basic", group=0, repeat=0):
+    cassette = Cassette(base, mode="record", writer=writer)
+    sess = cassette.session(FakeClient(lambda m, k: content), model, task, group, repeat, "A", unit_key)
+    sess.chat.completions.create(model=model, messages=[{"role": "user", "content": "q"}])
+    sess.flush()
+
+
+def test_replay_round_trip(tmp_path):
+    _record(tmp_path, "s1", "k1", "2")
+    replay = Cassette(tmp_path, mode="replay")
+    sess = replay.session(None, "m", "basic", 0, 0, "A", "k1")
+    resp = sess.chat.completions.create(model="m", messages=[])
+    assert resp.choices[0].message.content == "2"
+
+
+def test_replay_ignores_stale_unit_key(tmp_path):
+    _record(tmp_path, "s1", "old", "2")
+    sess = Cassette(tmp_path, mode="replay").session(None, "m", "basic", 0, 0, "A", "new")
+    with pytest.raises(CassetteMiss):
+        sess.chat.completions.create(model="m", messages=[])
+    assert sess.misses == 1
+
+
+def test_streaming_replay(tmp_path):
+    _record(tmp_path, "s1", "k1", "1")
+    sess = Cassette(tmp_path, mode="replay").session(None, "m", "basic", 0, 0, "A", "k1")
+    chunks = list(sess.chat.completions.create(model="m", messages=[], stream=True))
+    assert chunks[0].choices[0].delta.content == "1"
+
+
+def test_writers_use_separate_files(tmp_path):
+    _record(tmp_path, "s1", "k1", "1", group=0)
+    _record(tmp_path, "s2", "k1", "2", group=1)
+    files = sorted(p.name for p in (tmp_path / "m").iterdir())
+    assert files == ["basic.s1.jsonl.gz", "basic.s2.jsonl.gz"]
+    replay = Cassette(tmp_path, mode="replay")
+    for group, content in ((0, "1"), (1, "2")):
+        sess = replay.session(None, "m", "basic", group, 0, "A", "k1")
+        assert sess.chat.completions.create(model="m", messages=[]).choices[0].message.content == content
+
+
+def _record_many(base, writer, start):
+    for g in range(start, start + 50):
+        _record(base, writer, "k", str(g), group=g)
+
+
+def test_concurrent_processes_same_writer_do_not_corrupt(tmp_path):
+    # 即使两个进程误用同一写入方，每个member一次 O_APPEND 写入，文件仍可完整读出
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_record_many, args=(str(tmp_path), "same", s)) for s in (0, 50)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    with gzip.open(tmp_path / "m" / "basic.same.jsonl.gz", "rt", encoding="utf-8") as f:
+        lines = f.readlines()
+    assert len(lines) == 100
+
+
+def test_errors_replayed_as_exceptions(tmp_path):
+    def boom(messages, kwargs):
+        raise RuntimeError("upstream 500")
+    cassette = Cassette(tmp_path, mode="record", writer="s1")
+    sess = cassette.session(FakeClient(boom), "m", "basic", 0, 0, "A", "k")
+    with pytest.raises(RuntimeError):
+        sess.chat.completions.create(model="m", messages=[])
+    sess.flush()
+    replay = Cassette(tmp_path, mode="replay").session(None, "m", "basic", 0, 0, "A", "k")
+    with pytest.raises(RuntimeError, match="upstream 500"):
+        replay.chat.completions.create(model="m", messages=[])
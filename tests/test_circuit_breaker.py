@@ -0,0 +1,124 @@
+import json
+import time
+
+import pytest
+
+import run_fixed
+from fakes import FakeClient
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError, GuardedClient, probe_endpoint
+
+
+def test_state_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    # 成功清零连续失败计数
+    assert breaker.state == CircuitBreaker.CLOSED and not breaker.is_open()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.is_open()
+    assert not breaker.ready_for_probe()
+
+    time.sleep(0.06)
+    assert breaker.ready_for_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.is_open()
+    # 半开期间只允许一次探测
+    assert not breaker.ready_for_probe()
+
+    breaker.probe_failed()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.failed_probes == 1
+    assert not breaker.ready_for_probe()
+
+    time.sleep(0.06)
+    assert breaker.ready_for_probe()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0 and breaker.failed_probes == 0
+
+
+def test_guarded_client_fails_fast_while_open():
+    def down(messages, kwargs):
+        raise ConnectionError("down")
+
+    inner = FakeClient(down)
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    client = GuardedClient(inner, breaker)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            client.chat.completions.create(model="m", messages=[])
+    assert breaker.is_open()
+
+    with pytest.raises(CircuitOpenError):
+        client.chat.completions.create(model="m", messages=[])
+    # 熔断期间不再访问底层客户端
+    assert len(inner.calls) == 3
+
+    assert not probe_endpoint(inner, "m")
+    assert probe_endpoint(FakeClient(lambda m, k: "pong"), "m")
+
+
+class FlakyClient(FakeClient):
+    """前 healthy_calls 次调用正常，随后 failures 次失败，之后恢复"""
+
+    def __init__(self, healthy_calls, failures):
+        super().__init__(self._reply)
+        self.healthy_calls = healthy_calls
+        self.failures = failures
+
+    def _reply(self, messages, kwargs):
+        # 调用已先记入 calls，n 为本次调用的序号
+        n = len(self.calls)
+        if self.healthy_calls < n <= self.healthy_calls + self.failures:
+            raise ConnectionError("down")
+        if "Python 代码" in messages[-1]["content"]:
+            return "```python\nchoice = int(np.argmin(counts))\n```"
+        return "0"
+
+
+class FakeAPI:
+    def __init__(self, client):
+        self.client = client
+
+    def model_client(self, model_info):
+        return self.client
+
+    def routing_status(self):
+        return {}
+
+
+def test_parked_job_is_requeued_with_remaining_repeats(tmp_path, monkeypatch):
+    n_rounds = 4
+    # 每次重复：策略A每轮一次调用 + 策略B一次代码生成；第2次重复开头连续失败触发熔断
+    client = FlakyClient(healthy_calls=n_rounds + 1, failures=2)
+    monkeypatch.setattr(run_fixed, "RESULTS_DIR", tmp_path)
+    monkeypatch.setattr(run_fixed, "TASKS", [("1_basic_bandit", "basic")])
+    monkeypatch.setattr(run_fixed, "UnifiedAPIClient", lambda **kwargs: FakeAPI(client))
+    monkeypatch.setattr(run_fixed, "BREAKER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(run_fixed, "BREAKER_COOLDOWN", 0.05)
+
+    submitted = []
+    original = run_fixed.run_single_param_group
+
+    def recording(*args):
+        submitted.append(args[10])
+        return original(*args)
+
+    monkeypatch.setattr(run_fixed, "run_single_param_group", recording)
+    config = {
+        "models": [{"name": "m", "model_id": "m"}],
+        "experiment": {"n_param_groups": 1, "n_repeats": 3, "n_rounds": n_rounds, "seed": 42,
+                       "stats": {"n_resamples": 100}},
+    }
+    run_fixed.run_full_experiment(config)
+
+    # 首次提交跑全部重复；熔断后暂存，探测成功后只重新排队未完成的重复
+    assert submitted == [None, [1, 2]]
+    # 探测请求到达了已恢复的endpoint
+    assert any(call.get("max_tokens") == 1 for call in client.calls)
+
+    with open(tmp_path / "m" / "1_basic_bandit.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(r["repeat"] for r in records) == [0, 1, 2]
+    progress = json.loads((tmp_path / "progress.json").read_text(encoding="utf-8"))
+    assert len(progress["completed"]) == 1 and progress["parked"] == {}
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+import yaml
+
+import cli
+import run_fixed
+from utils.lease import LeaseManager, done_units
+from utils.param_generator import ParamGenerator
+
+CONFIG = {
+    "volcengine": {"base_url": "http://127.0.0.1:9/v1", "api_key": "test"},
+    "models": [{"name": "org/m", "model_id": "org/m-v1"}],
+    "experiment": {"n_param_groups": 2, "n_repeats": 1, "n_rounds": 10, "seed": 42,
+                   "stats": {"n_resamples": 100}},
+}
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    """临时项目根目录：一个单元记在进度文件里，另一个只有租约完成标记；模型名含 /"""
+    # cli 会改写 run_fixed 的路径全局变量，测试结束后还原
+    monkeypatch.setattr(run_fixed, "SCRIPT_DIR", run_fixed.SCRIPT_DIR)
+    monkeypatch.setattr(run_fixed, "RESULTS_DIR", run_fixed.RESULTS_DIR)
+    (tmp_path / "config.yaml").write_text(yaml.safe_dump(CONFIG, allow_unicode=True), encoding="utf-8")
+    results = tmp_path / "results"
+    exp_cfg = CONFIG["experiment"]
+    model_info = CONFIG["models"][0]
+    params = ParamGenerator(exp_cfg, seed=42).generate_all_params(2)["basic"]
+    uids = [run_fixed.make_unit_id(model_info, "1_basic_bandit", g, p, exp_cfg) for g, p in enumerate(params)]
+
+    results.mkdir()
+    (results / "progress.json").write_text(json.dumps({
+        "completed": [uids[0]], "failed": [], "parked": {}, "start_time": "2024-01-01T00:00:00",
+    }), encoding="utf-8")
+    leases = LeaseManager(results / "leases", "s1")
+    assert leases.claim(uids[1])
+    leases.release(uids[1], done=True)
+
+    model_dir = results / "org_m"
+    model_dir.mkdir()
+    with open(model_dir / "1_basic_bandit.jsonl", "w", encoding="utf-8") as f:
+        for g, uid in enumerate(uids):
+            f.write(json.dumps({
+                "model": "org/m", "task": "1_basic_bandit", "group": g, "repeat": 0,
+                "a_reward": 100.0 + g, "b_reward": 110.0 + g, "improvement": 10.0,
+                "a_regret": 5.0, "b_regret": 3.0, "key": uid.rsplit("|", 1)[1],
+            }) + "\n")
+    return tmp_path, uids
+
+
+def test_done_marker_keeps_unit_id(root):
+    tmp_path, uids = root
+    assert done_units(tmp_path / "results" / "leases") == {uids[1]}
+
+
+def test_status_counts_each_unit_once(root, capsys):
+    tmp_path, _ = root
+    cli.main(["--root", str(tmp_path), "status"])
+    out = capsys.readouterr().out
+    rows = [line for line in out.splitlines() if "1_basic_bandit" in line]
+    assert len(rows) == 1
+    assert rows[0].split()[:4] == ["org_m", "1_basic_bandit", "2", "2"]
+    assert "合计: 完成组 2 | 记录 2" in out
+
+
+def test_plan_skips_units_done_by_any_shard(root, capsys, monkeypatch):
+    tmp_path, uids = root
+    seen = {}
+    original = run_fixed.plan_run
+
+    def recording(config, tasks, all_params, completed, *args, **kwargs):
+        seen["completed"] = set(completed)
+        return original(config, tasks, all_params, completed, *args, **kwargs)
+
+    monkeypatch.setattr(run_fixed, "plan_run", recording)
+    cli.main(["--root", str(tmp_path), "plan"])
+    assert set(uids) <= seen["completed"]
+    row = next(line for line in capsys.readouterr().out.splitlines() if line.startswith("org/m "))
+    # 5 类任务 × 2 个参数组，已完成 2 个
+    assert row.split()[1] == "8"
+
+
+def test_report_uses_current_records(root):
+    tmp_path, _ = root
+    cli.main(["--root", str(tmp_path), "report"])
+    summary = (tmp_path / "results" / "final_summary.md").read_text(encoding="utf-8")
+    row = next(line for line in summary.splitlines() if line.startswith("| org/m |"))
+    assert "100.5±0.5" in row and "110.5±0.5" in row and row.rstrip().endswith("| 2 |")
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from utils.param_generator import create_trial_from_params
+from utils.shared import calc_curves, calc_curves_batch, trial_best_mean, trial_oracle
+
+N_ROUNDS = 50
+
+
+def _trials():
+    base = {'n_arms': 4, 'mean_low': 2.0, 'mean_high': 9.0, 'sigma': 1.0}
+    extras = [{}, {'drift_rate': 0.05}, {'sleep_prob': 0.4}, {'adversarial': True, 'switch_interval': 10}]
+    return [create_trial_from_params({**base, 'seed': i, **extra}, N_ROUNDS) for i, extra in enumerate(extras)]
+
+
+def _play(trial, seed):
+    rng = np.random.default_rng(seed)
+    table = np.asarray(trial['rewards'], dtype=float)
+    actions = rng.integers(0, table.shape[1], N_ROUNDS)
+    return actions, table[np.arange(N_ROUNDS), actions]
+
+
+def test_batch_matches_per_trial_with_oracle():
+    trials = _trials()
+    played = [_play(tr, i) for i, tr in enumerate(trials)]
+    batch = calc_curves_batch([r for _, r in played], np.stack([trial_oracle(tr, N_ROUNDS) for tr in trials]))
+    for i, (tr, (actions, rewards)) in enumerate(zip(trials, played)):
+        single = calc_curves(actions, rewards, best_mean=trial_best_mean(tr), oracle=tr.get('oracle'))
+        assert np.allclose(batch['cum_reward'][i], single['cum_reward'])
+        assert np.allclose(batch['cum_regret'][i], single['cum_regret'])
+
+
+@pytest.mark.parametrize("shape", ["vector", "scalar"])
+def test_batch_matches_per_trial_with_static_best_mean(shape):
+    rng = np.random.default_rng(0)
+    rewards = rng.normal(5.0, 1.0, (6, N_ROUNDS))
+    best = rng.uniform(6.0, 9.0, 6) if shape == "vector" else 7.5
+    batch = calc_curves_batch(rewards, best)
+    for i in range(6):
+        single = calc_curves(range(N_ROUNDS), rewards[i], best_mean=np.broadcast_to(best, 6)[i])
+        assert np.allclose(batch['cum_reward'][i], single['cum_reward'])
+        assert np.allclose(batch['cum_regret'][i], single['cum_regret'])
+
+
+def test_oracle_longer_than_rewards_is_truncated():
+    oracle = np.full((2, N_ROUNDS + 10), 3.0)
+    out = calc_curves_batch(np.ones((2, N_ROUNDS)), oracle)
+    assert out['cum_regret'].shape == (2, N_ROUNDS)
+    assert out['cum_regret'][0, -1] == pytest.approx(2.0 * N_ROUNDS)
@@ -0,0 +1,93 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fakes import FakeClient
+from strategy_a_no_code.policy import run_trial_no_code
+from strategy_b_with_interpreter.policy import run_trial_with_interpreter
+from strategy_b_with_interpreter.sandbox import SandboxPool
+from utils.param_generator import create_trial_from_params
+from utils.rng import unit_rng
+
+N_ROUNDS = 40
+
+# 同时用到 np.random 与 rng：两者都必须由单元种子决定
+RANDOM_POLICY = """```python
+if rng.random() < 0.5:
+    choice = int(np.random.randint(n_arms))
+else:
+    choice = int(rng.integers(n_arms))
+```"""
+
+TASKS = {
+    "basic": {},
+    "restless": {"drift_rate": 0.05},
+    "sleeping": {"sleep_prob": 0.3},
+}
+
+
+def _a_reply(messages, kwargs):
+    # 每隔几轮回复无法解析的内容，走 rng 随机兜底
+    prompt = messages[-1]["content"]
+    t = int(re.search(r"t=(\d+)", prompt).group(1))
+    n_arms = int(re.search(r"(\d+)臂老虎机", prompt).group(1))
+    return "不确定" if t % 3 == 0 else str(t % n_arms)
+
+
+def _units():
+    units = []
+    for task_id, extra in TASKS.items():
+        for repeat in range(2):
+            params = {"n_arms": 4, "mean_low": 2.0, "mean_high": 9.0, "sigma": 1.0, "seed": 7 + repeat, **extra}
+            trial = create_trial_from_params(params, n_rounds=N_ROUNDS)
+            for strategy in ("A", "B"):
+                units.append((task_id, repeat, strategy, trial))
+    return units
+
+
+def _run_unit(unit, sandbox=None):
+    task_id, repeat, strategy, trial = unit
+    rng = unit_rng(42, "m", task_id, 0, repeat, strategy)
+    if strategy == "A":
+        res = run_trial_no_code(FakeClient(_a_reply), "m", trial, n_rounds=N_ROUNDS, rng=rng)
+    else:
+        res = run_trial_with_interpreter(FakeClient(lambda m, k: RANDOM_POLICY), "m", trial,
+                                         n_rounds=N_ROUNDS, sandbox=sandbox, rng=rng)
+    return res["actions"], res["rewards"]
+
+
+def test_results_independent_of_order_and_workers():
+    units = _units()
+    golden = [_run_unit(u) for u in units]
+    # 随机策略确实产生了多样的动作，否则比较没有意义
+    assert len({a for actions, _ in golden for a in actions}) == 4
+
+    # 并发逆序重跑，期间另一线程不断扰动全局 np.random
+    stop = threading.Event()
+
+    def noise():
+        while not stop.is_set():
+            np.random.random()
+
+    noisy = threading.Thread(target=noise, daemon=True)
+    noisy.start()
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            order = list(reversed(range(len(units))))
+            futures = {i: pool.submit(_run_unit, units[i]) for i in order}
+            rerun = [futures[i].result() for i in range(len(units))]
+    finally:
+        stop.set()
+        noisy.join()
+    assert rerun == golden
+
+
+def test_sandbox_matches_in_process():
+    units = [u for u in _units() if u[2] == "B"]
+    pool = SandboxPool(n_workers=2, cpu_seconds=0.5, memory_mb=256)
+    try:
+        assert [_run_unit(u, sandbox=pool) for u in units] == [_run_unit(u) for u in units]
+    finally:
+        pool.close()
@@ -0,0 +1,64 @@
+import re
+
+import numpy as np
+
+from fakes import FakeClient
+from strategy_a_no_code.policy import confidence_gap, run_trial_no_code
+
+GATE = {'enabled': True, 'z': 3.0, 'requery_every': 10, 'min_count': 3}
+
+
+def _stats(samples):
+    counts = np.array([len(s) for s in samples], dtype=np.int64)
+    sums = np.array([float(np.sum(s)) for s in samples])
+    sumsq = np.array([float(np.sum(np.square(s))) for s in samples])
+    return counts, sums, sumsq
+
+
+def test_compares_leader_only_with_sampled_arms():
+    counts, sums, sumsq = _stats([[1.0, 1.1, 0.9, 1.0], [0.0, 0.1, -0.1, 0.0], [0.2]])
+    leader, gap = confidence_gap(counts, sums, sumsq, min_count=3)
+    assert leader == 0 and gap > 3.0
+
+
+def test_undersampled_arm_with_high_bound_is_unresolved():
+    counts, sums, sumsq = _stats([[1.0, 1.1, 0.9, 1.0], [0.0, 0.1, -0.1, 0.0], [1.2]])
+    assert confidence_gap(counts, sums, sumsq, min_count=3) == (0, 0.0)
+
+
+def test_unpulled_arm_is_unresolved():
+    counts, sums, sumsq = _stats([[1.0, 1.1, 0.9], [0.0, 0.1, -0.1], []])
+    assert confidence_gap(counts, sums, sumsq, min_count=3) == (0, 0.0)
+
+
+def test_no_sampled_arm():
+    counts, sums, sumsq = _stats([[1.0], [0.0]])
+    assert confidence_gap(counts, sums, sumsq, min_count=3) == (None, 0.0)
+
+
+def _explore_then_best(best):
+    """每臂先拉一次，之后一直选 best；回复只取决于提示词中的轮次"""
+    def reply(messages, kwargs):
+        t = int(re.search(r"t=(\d+)", messages[0]["content"]).group(1))
+        n_arms = int(re.search(r"(\d+)臂老虎机", messages[0]["content"]).group(1))
+        return str(t if t < n_arms else best)
+    return reply
+
+
+def test_gated_run_matches_ungated_for_large_k():
+    n_arms, n_rounds, best = 50, 120, 7
+    means = np.linspace(0.0, 0.5, n_arms)
+    means[best] = 1.0
+    trial = {'means': means.tolist(), 'rewards': np.tile(means, (n_rounds, 1))}
+
+    plain_client = FakeClient(_explore_then_best(best))
+    plain = run_trial_no_code(plain_client, "m", trial, n_rounds=n_rounds, rng=np.random.default_rng(0))
+    gated_client = FakeClient(_explore_then_best(best))
+    gated = run_trial_no_code(gated_client, "m", trial, n_rounds=n_rounds, rng=np.random.default_rng(0),
+                              gate=GATE)
+
+    assert np.array_equal(plain['actions'], gated['actions'])
+    assert np.allclose(plain['cum_reward'], gated['cum_reward'])
+    # 其余臂各只有1个样本，旧实现要求每臂至少3次时不会跳过
+    assert gated['skipped'] > 0
+    assert len(gated_client.calls) == n_rounds - gated['skipped'] < len(plain_client.calls)
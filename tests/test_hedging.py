@@ -0,0 +1,129 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from fakes import completion
+from utils.api_client import UnifiedAPIClient
+from utils.hedging import HedgedClient, Hedger
+
+
+class SlowClient:
+    """按 delays 依次给出每次调用的延迟；记录执行调用的线程"""
+
+    def __init__(self, delays, chunks=None):
+        self.delays = list(delays)
+        self.threads = []
+        self.chunks = chunks
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        with self.lock:
+            delay = self.delays.pop(0) if self.delays else 0.0
+            self.threads.append(threading.current_thread())
+        if kwargs.get("stream"):
+            return self._stream(delay)
+        time.sleep(delay)
+        return completion(str(delay))
+
+    def _stream(self, delay):
+        # 响应头立即返回，首个chunk在 delay 之后才到
+        time.sleep(delay)
+        for c in self.chunks:
+            yield c
+
+
+def _warm(hedger, client, n, **kwargs):
+    for _ in range(n):
+        client.chat.completions.create(model="m", messages=[], **kwargs)
+
+
+def test_primary_runs_on_caller_thread_without_samples():
+    hedger = Hedger(min_samples=3)
+    fake = SlowClient([0.0] * 3)
+    client = hedger.wrap(fake, "ep")
+    _warm(hedger, client, 3)
+    assert fake.threads == [threading.current_thread()] * 3
+    assert hedger.stats['hedged'] == 0
+    hedger.close()
+
+
+def test_slow_primary_is_hedged():
+    hedger = Hedger(min_samples=3, quantile=0.5, deadline=5.0)
+    fake = SlowClient([0.01] * 3 + [1.0, 0.01])
+    client = hedger.wrap(fake, "ep")
+    _warm(hedger, client, 3)
+    start = time.monotonic()
+    resp = client.chat.completions.create(model="m", messages=[])
+    assert time.monotonic() - start < 0.5
+    assert resp.choices[0].message.content == "0.01"
+    assert hedger.stats['hedged'] == 1 and hedger.stats['wins'] == 1
+    hedger.close()
+
+
+def test_losers_do_not_block_new_primaries():
+    # 对冲池只有一个线程且被落选请求占着，新的原始请求仍不排队
+    hedger = Hedger(min_samples=3, quantile=0.5, deadline=5.0, max_workers=1, burst=1)
+    fake = SlowClient([0.01] * 3 + [0.05, 2.0, 0.05])
+    client = hedger.wrap(fake, "ep")
+    _warm(hedger, client, 3)
+    client.chat.completions.create(model="m", messages=[])   # 原始0.05s赢，对冲2s落选
+    assert hedger.stats['hedged'] == 1
+    start = time.monotonic()
+    client.chat.completions.create(model="m", messages=[])
+    assert time.monotonic() - start < 1.0
+    hedger.close()
+
+
+def test_stream_latency_is_time_to_first_chunk():
+    hedger = Hedger(min_samples=100)
+    fake = SlowClient([0.2], chunks=["a", "b"])
+    client = hedger.wrap(fake, "ep")
+    start = time.monotonic()
+    stream = client.chat.completions.create(model="m", messages=[], stream=True)
+    assert time.monotonic() - start >= 0.2
+    assert list(stream) == ["a", "b"]
+    (samples,) = [list(v) for k, v in hedger._latency.items() if k == ("ep", True)]
+    assert samples[0] >= 0.2
+    assert ("ep", False) not in hedger._latency
+    hedger.close()
+
+
+def test_primaries_use_bounded_pool():
+    # 原始请求池只有一个线程：落选的原始请求占着它时，下一次调用在调用方线程执行而不排队
+    hedger = Hedger(min_samples=3, quantile=0.5, deadline=5.0, primary_workers=1)
+    fake = SlowClient([0.01] * 3 + [1.0, 0.01, 0.01])
+    client = hedger.wrap(fake, "ep")
+    _warm(hedger, client, 3)
+    client.chat.completions.create(model="m", messages=[])   # 原始1s落选，对冲0.01s胜出
+    assert hedger.stats['wins'] == 1
+    assert fake.threads[3].name.startswith("hedge-primary")
+    start = time.monotonic()
+    client.chat.completions.create(model="m", messages=[])
+    assert time.monotonic() - start < 0.5
+    assert fake.threads[5] is threading.current_thread()
+    assert hedger.stats['pool_full'] == 1 and hedger.stats['hedged'] == 1
+    hedger.close()
+
+
+def test_router_keys_latency_per_endpoint():
+    hedger = Hedger(min_samples=100)
+    config = {
+        "volcengine": {"base_url": "http://127.0.0.1:9/v1", "api_key": "test"},
+        "models": [],
+        "experiment": {"routing": {"policy": "weighted_round_robin"}},
+    }
+    model_info = {"name": "m", "model_id": "m",
+                  "endpoints": [{"name": "fast"}, {"name": "slow", "base_url": "http://127.0.0.1:10/v1"}]}
+    router = UnifiedAPIClient(config=config, hedger=hedger).model_client(model_info)
+    fast, slow = router.endpoints
+    assert isinstance(fast.client, HedgedClient) and fast.client.key == "m@fast"
+    assert slow.client.key == "m@slow"
+    fast.client.client = SlowClient([0.0] * 2)
+    slow.client.client = SlowClient([0.1] * 2)
+    for _ in range(4):
+        router.chat.completions.create(model="m", messages=[])
+    assert len(hedger._latency[("m@fast", False)]) == 2
+    assert min(hedger._latency[("m@slow", False)]) >= 0.1
+    assert max(hedger._latency[("m@fast", False)]) < 0.1
+    hedger.close()
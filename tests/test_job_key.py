@@ -0,0 +1,49 @@
+from utils.job_key import is_legacy_id, unit_key
+
+PARAMS = {'n_arms': 3, 'gap': 0.1}
+
+
+def _key(**kwargs):
+    return unit_key('m', 'basic', PARAMS, 120, 42, **kwargs)
+
+
+def test_key_is_stable_and_sensitive_to_inputs():
+    assert _key() == _key()
+    assert len(_key()) == 16
+    assert unit_key('m', 'basic', {**PARAMS, 'gap': 0.2}, 120, 42) != _key()
+    assert unit_key('m', 'basic', PARAMS, 100, 42) != _key()
+    assert unit_key('m', 'basic', PARAMS, 120, 7) != _key()
+    assert unit_key('m2', 'basic', PARAMS, 120, 42) != _key()
+
+
+def test_default_settings_keep_old_key():
+    assert _key(strategy_a={'stream': False, 'max_tokens': None, 'gate': {'enabled': False}},
+                sandbox={'enabled': False, 'cpu_seconds': 9},
+                policy_store={'enabled': False, 'mode': 'reuse'}) == _key()
+
+
+def test_result_affecting_settings_change_key():
+    base = _key()
+    keys = {
+        _key(strategy_a={'stream': True}),
+        _key(strategy_a={'max_tokens': 8}),
+        _key(strategy_a={'gate': {'enabled': True, 'z': 3.0}}),
+        _key(sandbox={'enabled': True}),
+        _key(sandbox={'enabled': True, 'cpu_seconds': 2.0}),
+        _key(policy_store={'enabled': True, 'mode': 'per_trial'}),
+        _key(policy_store={'enabled': True, 'mode': 'reuse'}),
+    }
+    assert base not in keys
+    assert len(keys) == 7
+
+
+def test_scheduling_settings_do_not_change_key():
+    on = {'enabled': True, 'cpu_seconds': 1.0, 'memory_mb': 512}
+    assert _key(sandbox={**on, 'workers': 4}) == _key(sandbox={**on, 'workers': 64, 'max_sessions_per_worker': 5})
+    store = {'enabled': True, 'mode': 'reuse'}
+    assert _key(policy_store={**store, 'path': 'a'}) == _key(policy_store={**store, 'path': 'b'})
+
+
+def test_legacy_id():
+    assert is_legacy_id('m|basic|0')
+    assert not is_legacy_id(f'm|basic|0|{_key()}')
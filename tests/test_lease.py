@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+from utils.lease import LeaseManager
+
+UNIT = "model|basic|0|abcd"
+
+
+def _expire(manager, unit_id):
+    old = time.time() - manager.ttl - 10
+    os.utime(manager._lease_path(unit_id), (old, old))
+
+
+def test_claim_is_exclusive(tmp_path):
+    a = LeaseManager(tmp_path, "a")
+    b = LeaseManager(tmp_path, "b")
+    assert a.claim(UNIT)
+    assert not b.claim(UNIT)
+    a.release(UNIT, done=True)
+    assert a.is_done(UNIT)
+    assert not b.claim(UNIT)
+
+
+def test_release_without_done_lets_others_claim(tmp_path):
+    a = LeaseManager(tmp_path, "a")
+    b = LeaseManager(tmp_path, "b")
+    assert a.claim(UNIT)
+    a.release(UNIT, done=False)
+    assert b.claim(UNIT)
+
+
+def test_concurrent_claims_single_winner(tmp_path):
+    managers = [LeaseManager(tmp_path, f"s{i}") for i in range(8)]
+    wins = []
+    barrier = threading.Barrier(len(managers))
+
+    def claim(m):
+        barrier.wait()
+        if m.claim(UNIT):
+            wins.append(m.shard_id)
+
+    threads = [threading.Thread(target=claim, args=(m,)) for m in managers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(wins) == 1
+
+
+def test_stale_lease_taken_over_and_marked_lost(tmp_path):
+    a = LeaseManager(tmp_path, "a", ttl=5)
+    b = LeaseManager(tmp_path, "b", ttl=5)
+    assert a.claim(UNIT)
+    assert not a.lost(UNIT)
+    _expire(a, UNIT)
+    assert b.claim(UNIT)
+    assert a.lost(UNIT)
+    assert not b.lost(UNIT)
+    # 原持有者收尾时不得写完成标记，也不得删除新持有者的租约
+    a.release(UNIT, done=True)
+    assert not a.is_done(UNIT)
+    assert b._lease_path(UNIT).exists()
+    b.release(UNIT, done=True)
+    assert b.is_done(UNIT)
+
+
+def test_heartbeat_marks_lost_and_stops_renewing(tmp_path):
+    a = LeaseManager(tmp_path, "a", ttl=5, heartbeat_interval=0.05)
+    b = LeaseManager(tmp_path, "b", ttl=5)
+    assert a.claim(UNIT)
+    _expire(a, UNIT)
+    assert b.claim(UNIT)
+    _expire(b, UNIT)
+    a.start()
+    try:
+        deadline = time.time() + 2
+        while UNIT not in a._lost and time.time() < deadline:
+            time.sleep(0.02)
+        assert UNIT in a._lost
+    finally:
+        a.stop()
+    # a 没有替 b 续期
+    assert not b.is_alive(UNIT)
+
+
+def test_heartbeat_renews_own_lease(tmp_path):
+    a = LeaseManager(tmp_path, "a", ttl=5, heartbeat_interval=0.05)
+    assert a.claim(UNIT)
+    _expire(a, UNIT)
+    a.start()
+    try:
+        time.sleep(0.3)
+        assert a.is_alive(UNIT)
+        assert not a.lost(UNIT)
+    finally:
+        a.stop()
+    assert not a._lease_path(UNIT).exists()
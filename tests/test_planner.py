@@ -0,0 +1,64 @@
+import json
+
+from utils.planner import feature_rates, plan_run
+
+MODEL = {'name': 'm1', 'model_id': 'm1'}
+
+
+def _config(gate=False, adaptive=False):
+    return {
+        'models': [MODEL],
+        'experiment': {
+            'n_repeats': 5, 'n_rounds': 100,
+            'strategy_a': {'gate': {'enabled': gate}},
+            'adaptive': {'enabled': adaptive, 'max_repeats': 10},
+        },
+    }
+
+
+PARAMS = {'basic': [{'n_arms': 3}, {'n_arms': 4}]}
+TASKS = [('basic', 'basic')]
+
+
+def _plan(config, rates=None):
+    return plan_run(config, TASKS, PARAMS, set(), lambda *a: f"{a[1]}|{a[2]}", {}, {}, n_workers=2,
+                    rates=rates)
+
+
+def _write_records(tmp_path, records):
+    d = tmp_path / "m1"
+    d.mkdir()
+    with open(d / "basic.jsonl", "w", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+
+def test_feature_rates_from_records(tmp_path):
+    records = [{'model': 'm1', 'task': 'basic', 'group': 0, 'key': 'k', 'repeat': r, 'a_skipped': 40}
+               for r in range(3)]
+    records += [{'model': 'm1', 'task': 'basic', 'group': 1, 'key': 'k', 'repeat': r, 'a_skipped': 20}
+                for r in range(5)]
+    _write_records(tmp_path, records)
+    rates = feature_rates(tmp_path, n_repeats=5, n_rounds=100)
+    assert rates['m1']['repeats'] == 4.0
+    assert abs(rates['*']['skip_rate'] - (3 * 40 + 5 * 20) / 800) < 1e-12
+
+
+def test_plan_ignores_rates_when_features_off():
+    plan = _plan(_config(), rates={'*': {'skip_rate': 0.5, 'repeats': 2.0}})
+    assert plan['total']['trials'] == 10
+    assert plan['total']['calls_a'] == 10 * 100
+
+
+def test_plan_applies_gate_and_early_stop():
+    rates = {'*': {'skip_rate': 0.5, 'repeats': 2.0}}
+    plan = _plan(_config(gate=True, adaptive=True), rates=rates)
+    assert plan['total']['trials'] == 4
+    assert plan['total']['calls_a'] == 4 * 100 * 0.5
+    off = _plan(_config())
+    assert plan['makespan'] < off['makespan']
+
+
+def test_plan_repeats_capped_by_max_repeats():
+    plan = _plan(_config(adaptive=True), rates={'m1': {'repeats': 50.0}})
+    assert plan['total']['trials'] == 2 * 10
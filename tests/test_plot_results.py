@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+import plot_results
+import run_fixed
+from utils.param_generator import ParamGenerator
+
+
+def _record(group, repeat, a, b, key=None):
+    rec = {'group': group, 'repeat': repeat, 'a_reward': a, 'b_reward': b,
+           'improvement': (b - a) / a * 100}
+    if key is not None:
+        rec['key'] = key
+    return rec
+
+
+def _append(path, *records, tail=""):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        for rec in records:
+            f.write(json.dumps(rec) + "\n")
+        f.write(tail)
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """不依赖 matplotlib：记录被重画的面板"""
+    drawn = []
+
+    def fake(label, data, output_path):
+        drawn.append(output_path.name)
+        output_path.write_bytes(b"png")
+
+    monkeypatch.setattr(plot_results, "render_task", fake)
+    monkeypatch.setattr(plot_results, "render_model", fake)
+    return drawn
+
+
+def test_incremental_append_dedupes_and_waits_for_full_lines(tmp_path):
+    path = tmp_path / "m" / "basic.jsonl"
+    _append(path, _record(0, 0, 10, 12), _record(0, 1, 10, 14))
+    cache = plot_results.load_cache(tmp_path / "cache.json")
+    units, changed = plot_results.scan(tmp_path, cache)
+    assert changed == 1 and units[("m", "basic")]['n'] == 2
+
+    # 重写 (0, 0)，追加新重复，另有半行尚未写完
+    half = json.dumps(_record(1, 0, 10, 20))
+    _append(path, _record(0, 0, 10, 11), tail=half[:10])
+    units, changed = plot_results.scan(tmp_path, cache)
+    agg = units[("m", "basic")]
+    assert changed == 1 and agg['n'] == 2
+    assert agg['b_sum'] == 11 + 14
+    assert agg['group_means'] == {'0': pytest.approx((10 + 40) / 2)}
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(half[10:] + "\n")
+    units, _ = plot_results.scan(tmp_path, cache)
+    assert units[("m", "basic")]['n'] == 3
+    assert units[("m", "basic")]['group_means']['1'] == pytest.approx(100.0)
+
+    # 无变化时不重读
+    assert plot_results.scan(tmp_path, cache)[1] == 0
+
+
+def test_only_current_key_is_counted(tmp_path):
+    path = tmp_path / "m" / "basic.jsonl"
+    _append(path,
+            _record(0, 0, 10, 12, key="new"),
+            _record(0, 0, 10, 50, key="old"),   # 旧配置下后写入的记录不覆盖当前键的记录
+            _record(0, 1, 10, 30, key="old"),
+            _record(1, 0, 10, 15))              # 旧版无键记录保留
+    cache = plot_results.load_cache(tmp_path / "cache.json")
+    current = {("m", "basic"): {"0": "new", "1": "new"}}
+    units, _ = plot_results.scan(tmp_path, cache, current)
+    agg = units[("m", "basic")]
+    assert agg['n'] == 2 and agg['b_sum'] == 12 + 15
+
+    # 不在当前配置中的 (模型, 任务) 不出图
+    _append(tmp_path / "gone" / "basic.jsonl", _record(0, 0, 10, 12))
+    units, _ = plot_results.scan(tmp_path, cache, current)
+    assert set(units) == {("m", "basic")}
+
+
+def test_shard_records_follow_main_file(tmp_path):
+    _append(tmp_path / "m" / "basic.shard-a.jsonl", _record(0, 0, 10, 30))
+    _append(tmp_path / "m" / "basic.jsonl", _record(0, 0, 10, 20), _record(0, 1, 10, 10))
+    cache = plot_results.load_cache(tmp_path / "cache.json")
+    units, _ = plot_results.scan(tmp_path, cache)
+    assert units[("m", "basic")]['n'] == 2 and units[("m", "basic")]['b_sum'] == 30 + 10
+
+
+def test_cache_stays_bounded_and_only_changed_panels_redraw(tmp_path, renders):
+    results, out = tmp_path / "results", tmp_path / "plots"
+    _append(results / "m1" / "basic.jsonl", _record(0, 0, 10, 12))
+    _append(results / "m2" / "basic.jsonl", _record(0, 0, 10, 12))
+    _append(results / "m2" / "sleeping.jsonl", _record(0, 0, 10, 12))
+    assert plot_results.build(results, out) == (4, 4, 3)
+    size = (out / ".cache.json").stat().st_size
+
+    renders.clear()
+    assert plot_results.build(results, out) == (0, 4, 0)
+    assert renders == []
+
+    # 同一重复被反复重写：缓存大小不随记录条数增长
+    for i in range(50):
+        _append(results / "m2" / "sleeping.jsonl", _record(0, 0, 10, 12))
+    assert plot_results.build(results, out)[0] == 0
+    assert (out / ".cache.json").stat().st_size < size + 200
+
+    _append(results / "m2" / "sleeping.jsonl", _record(1, 0, 10, 20))
+    rebuilt, total, changed = plot_results.build(results, out)
+    assert (rebuilt, changed) == (2, 1)
+    assert sorted(renders) == ["compare_sleeping.png", "heatmap_m2.png"]
+
+
+def test_current_keys_match_report(tmp_path):
+    config = {
+        "models": [{"name": "org/m", "model_id": "org/m-v1"}, {"name": "off", "model_id": "x", "enabled": False}],
+        "experiment": {"n_param_groups": 2, "n_repeats": 1, "n_rounds": 10, "seed": 3},
+    }
+    keys = plot_results.current_keys(config)
+    assert {model for model, _ in keys} == {"org_m"}
+    all_params = ParamGenerator(config["experiment"], seed=3).generate_all_params(2)
+    model_info = config["models"][0]
+    for task_id, task_key in run_fixed.TASKS:
+        assert keys[("org_m", task_id)] == {
+            str(g): run_fixed.unit_key_for(model_info, task_id, p, config["experiment"])
+            for g, p in enumerate(all_params[task_key])
+        }
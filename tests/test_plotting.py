@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pytest
+
+import generate_plots
+from utils import plotting
+from utils.plotting import CurveStats, iter_json_arrays
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64, 256, 5000])
+def test_curve_stats_matches_numpy(chunk_size):
+    rng = np.random.default_rng(0)
+    # 大偏移 + 小方差，检验分块合并的数值稳定性
+    curves = 1e6 + np.cumsum(rng.normal(1.0, 0.5, size=(1000, 50)), axis=1)
+    stats = CurveStats(chunk_size=chunk_size)
+    for c in curves:
+        stats.add(c.tolist())
+    mean, std = stats.result()
+    assert np.allclose(mean, curves.mean(axis=0), rtol=0, atol=1e-6)
+    assert np.allclose(std, curves.std(axis=0), rtol=1e-9, atol=1e-9)
+
+
+def test_curve_stats_edge_cases():
+    assert CurveStats().result() == (None, None)
+    stats = CurveStats(chunk_size=2)
+    stats.add([1.0, 2.0])
+    stats.add([3.0, 4.0])
+    stats.add([1.0])
+    with pytest.raises(ValueError):
+        stats.result()
+
+
+def _write_results(path, a, b, keys=("A", "B")):
+    data = {
+        "config": {"arms": 3, "note": "x" * 50},
+        keys[0]: [{"cum_reward": r.tolist(), "cum_regret": (-r).tolist()} for r in a],
+        keys[1]: [{"cum_reward": r.tolist(), "cum_regret": (-r).tolist()} for r in b],
+        "metrics": {"A_mean": 1.5e-3},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    return data
+
+
+def test_iter_json_arrays_across_small_chunks(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    a, b = rng.normal(size=(4, 9)), rng.normal(size=(3, 9))
+    data = _write_results(tmp_path / "results.json", a, b)
+    # 极小的读块，数字与对象都会跨块
+    monkeypatch.setattr(plotting._JsonStream.__init__, "__defaults__", (7,))
+    items = list(iter_json_arrays(tmp_path / "results.json", {"A", "B"}))
+    assert [k for k, _ in items] == ["A"] * 4 + ["B"] * 3
+    assert [v for _, v in items] == data["A"] + data["B"]
+
+
+@pytest.mark.parametrize("keys", [("A", "B"), ("A_no_code", "B_with_interpreter")])
+def test_aggregate_results_equals_full_arrays(tmp_path, keys):
+    rng = np.random.default_rng(2)
+    a, b = rng.normal(100, 5, size=(300, 20)), rng.normal(120, 5, size=(300, 20))
+    _write_results(tmp_path / "results.json", a, b, keys)
+    stats = generate_plots.aggregate_results(str(tmp_path / "results.json"))
+    for side, curves in (("A", a), ("B", b)):
+        mean, std = stats[side]["reward"]
+        assert np.allclose(mean, curves.mean(axis=0)) and np.allclose(std, curves.std(axis=0))
+        mean, std = stats[side]["regret"]
+        assert np.allclose(mean, -curves.mean(axis=0)) and np.allclose(std, curves.std(axis=0))
+
+
+def test_fresh_stamp_skips_rendering(tmp_path, monkeypatch):
+    drawn = []
+
+    def fake_render(stats, title, output_path):
+        drawn.append(title)
+        with open(output_path, "wb") as f:
+            f.write(b"png")
+
+    monkeypatch.setattr(generate_plots, "render", fake_render)
+    exp_dir = tmp_path / "1_basic_bandit"
+    exp_dir.mkdir()
+    rng = np.random.default_rng(3)
+    _write_results(exp_dir / "results.json", rng.normal(size=(5, 10)), rng.normal(size=(5, 10)))
+
+    assert generate_plots.plot_experiment(str(exp_dir), "t")[0] == "ok"
+    assert generate_plots.plot_experiment(str(exp_dir), "t")[0] == "cached"
+    assert drawn == ["t"]
+
+    # 标题、输入或输出任一变化都重画；--force 总是重画
+    assert generate_plots.plot_experiment(str(exp_dir), "t2")[0] == "ok"
+    _write_results(exp_dir / "results.json", rng.normal(size=(6, 10)), rng.normal(size=(6, 10)))
+    assert generate_plots.plot_experiment(str(exp_dir), "t2")[0] == "ok"
+    (exp_dir / "plot.png").unlink()
+    assert generate_plots.plot_experiment(str(exp_dir), "t2")[0] == "ok"
+    assert generate_plots.plot_experiment(str(exp_dir), "t2", force=True)[0] == "ok"
+    assert len(drawn) == 5
+    assert generate_plots.plot_experiment(str(tmp_path / "missing"), "t")[0] == "skip"
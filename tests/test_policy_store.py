@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeClient
+from strategy_b_with_interpreter import policy_store
+from strategy_b_with_interpreter.policy_store import PolicyStore, prompt_version
+
+GOOD = "```python\nchoice = int(np.argmin(counts))\n```"
+BAD = "```python\nchoice = n_arms\n```"
+GOOD_SLEEPING = "```python\nchoice = int(np.argmin(np.where(available, counts, 10 ** 9)))\n```"
+
+
+def _refs(store):
+    return sorted(p.relative_to(store.base_dir / "refs").as_posix()
+                  for p in (store.base_dir / "refs").glob("*/*.json"))
+
+
+def test_concurrent_callers_share_one_generation(tmp_path):
+    def slow(messages, kwargs):
+        time.sleep(0.1)
+        return GOOD_SLEEPING if "available" in messages[-1]["content"] else GOOD
+
+    client = FakeClient(slow)
+    store = PolicyStore(tmp_path, mode="reuse")
+    start = threading.Barrier(8)
+
+    def get(_):
+        start.wait()
+        return store.get_code(client, "org/m", 4)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(get, range(8)))
+    assert len(client.calls) == 1
+    assert len(set(results)) == 1
+    assert store.stats == {'generated': 1, 'reused': 7, 'invalid': 0}
+    assert _refs(store) == [f"org_m/4-{prompt_version(4)}.json"]
+
+    # 新的进程（新的 PolicyStore）经由引用复用，同样不调用LLM
+    again = PolicyStore(tmp_path, mode="reuse").get_code(client, "org/m", 4)
+    assert again == results[0] and len(client.calls) == 1
+
+    # 其他臂数、休眠任务各自生成一份
+    store.get_code(client, "org/m", 5)
+    store.get_code(client, "org/m", 4, sleeping=True)
+    assert len(client.calls) == 3
+
+
+def test_invalid_code_is_retried_without_writing_ref(tmp_path):
+    client = FakeClient(lambda m, k: BAD)
+    store = PolicyStore(tmp_path, mode="reuse", max_attempts=3)
+    code, sha = store.get_code(client, "m", 4)
+    assert len(client.calls) == 3
+    assert store.stats['invalid'] == 3 and store.stats['generated'] == 3
+    assert code == "choice = n_arms" and not store.load(sha)['validation']['ok']
+    assert _refs(store) == []
+    assert not store.has_valid_ref("m", 4)
+
+    # 下个trial重新尝试，第二次生成合格即写入引用
+    replies = iter([BAD, GOOD])
+    client.reply = lambda m, k: next(replies)
+    code, sha = store.get_code(client, "m", 4)
+    assert len(client.calls) == 5
+    assert store.load(sha)['validation']['ok'] and store.has_valid_ref("m", 4)
+
+
+def test_prompt_change_invalidates_ref(tmp_path, monkeypatch):
+    client = FakeClient(lambda m, k: GOOD)
+    PolicyStore(tmp_path, mode="reuse").get_code(client, "m", 4)
+    old_version = prompt_version(4)
+
+    original = policy_store.build_policy_prompt
+    monkeypatch.setattr(policy_store, "build_policy_prompt",
+                        lambda n_arms, sleeping=False: original(n_arms, sleeping) + "\n改动")
+    assert prompt_version(4) != old_version
+    store = PolicyStore(tmp_path, mode="reuse")
+    assert not store.has_valid_ref("m", 4)
+    store.get_code(client, "m", 4)
+    assert len(client.calls) == 2
+    assert _refs(store) == sorted([f"m/4-{old_version}.json", f"m/4-{prompt_version(4)}.json"])
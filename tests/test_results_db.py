@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from utils.results_db import ResultsDB
+
+
+def _record(model="m", task="basic", group=0, repeat=0, a=1.0, b=2.0, n_arms=3):
+    return {"model": model, "task": task, "group": group, "repeat": repeat, "a_reward": a, "b_reward": b,
+            "params": {"n_arms": n_arms, "sigma": 1.0}, "key": "k"}
+
+
+def _append(path, records, tail=""):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+        f.write(tail)
+
+
+def _count(db):
+    return db.sql("SELECT COUNT(*) FROM records")[1][0][0]
+
+
+def test_incremental_ingest(tmp_path):
+    results = tmp_path / "results"
+    path = results / "m" / "basic.jsonl"
+    _append(path, [_record(repeat=0), _record(repeat=1)])
+    with ResultsDB(tmp_path / "results.db") as db:
+        assert db.ingest(results) == (2, 1)
+        assert db.ingest(results) == (0, 0)
+        # 写入中的半行不导入，补全后再导入
+        _append(path, [_record(repeat=2)], tail='{"model": "m", "ta')
+        assert db.ingest(results) == (1, 1)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('sk": "basic", "group": 1, "repeat": 0, "a_reward": 1.0, "b_reward": 1.0}\nnot json\n')
+        assert db.ingest(results) == (1, 1)
+        assert _count(db) == 4
+
+
+def test_rewritten_and_deleted_files(tmp_path):
+    results = tmp_path / "results"
+    path = results / "m" / "basic.jsonl"
+    other = results / "n" / "basic.jsonl"
+    _append(path, [_record(repeat=i) for i in range(3)])
+    _append(other, [_record(model="n")])
+    with ResultsDB(tmp_path / "results.db") as db:
+        db.ingest(results)
+        path.write_text(json.dumps(_record(repeat=9)) + "\n", encoding="utf-8")
+        os.utime(path, ns=(1, 1))
+        db.ingest(results)
+        assert db.sql("SELECT rep FROM records WHERE model = 'm'")[1] == [(9,)]
+        other.unlink()
+        db.ingest(results)
+        assert db.sql("SELECT model FROM records")[1] == [("m",)]
+
+
+def test_summary(tmp_path):
+    results = tmp_path / "results"
+    _append(results / "m" / "basic.jsonl", [_record(a=1.0, b=2.0), _record(a=3.0, b=2.0, n_arms=8)])
+    _append(results / "n" / "basic.jsonl", [_record(model="n", a=2.0, b=3.0)])
+    with ResultsDB(tmp_path / "results.db") as db:
+        db.ingest(results)
+        columns, rows = db.summary(by=["model"])
+        assert columns[:4] == ["model", "n", "a_mean", "b_mean"]
+        assert [(r[0], r[1]) for r in rows] == [("m", 2), ("n", 1)]
+        assert rows[0][4] == pytest.approx(0.0)
+        assert rows[1][4] == pytest.approx(50.0)
+        _, rows = db.summary(where="n_arms >= 8", by=[])
+        assert rows[0][:3] == (1, 3.0, 2.0)
+        with pytest.raises(ValueError):
+            db.summary(by=["params"])
+
+
+def test_readonly_open(tmp_path):
+    results = tmp_path / "results"
+    _append(results / "m" / "basic.jsonl", [_record()])
+    with ResultsDB(tmp_path / "results.db") as db:
+        db.ingest(results)
+    with ResultsDB(tmp_path / "results.db", readonly=True) as db:
+        assert _count(db) == 1
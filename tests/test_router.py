@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import APIStatusError
+
+from utils.api_client import UnifiedAPIClient
+
+
+class Stub:
+    """本地HTTP桩：兼容 /v1/chat/completions；status 为返回码，消息含 hold 时阻塞到 release"""
+
+    def __init__(self, name, status=200):
+        self.name = name
+        self.status = status
+        self.hits = 0
+        self.release = threading.Event()
+        self.holding = threading.Event()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.hits += 1
+                if "hold" in body["messages"][0]["content"]:
+                    stub.holding.set()
+                    stub.release.wait(5)
+                if stub.status != 200:
+                    data = json.dumps({"error": {"message": "down"}}).encode()
+                else:
+                    data = json.dumps({
+                        "id": "x", "object": "chat.completion", "created": 0, "model": body["model"],
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": stub.name}}],
+                    }).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                # 5xx 不让客户端自行重试，每次调用对应一次路由结果
+                self.send_header("x-should-retry", "false")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stubs():
+    made = []
+
+    def make(name, status=200):
+        made.append(Stub(name, status))
+        return made[-1]
+
+    yield make
+    for s in made:
+        s.close()
+
+
+def _router(endpoints, **routing):
+    config = {
+        "volcengine": {"base_url": endpoints[0]["base_url"], "api_key": "test"},
+        "models": [],
+        "experiment": {"routing": routing},
+    }
+    model_info = {"name": "m", "model_id": "m", "endpoints": endpoints}
+    return UnifiedAPIClient(config=config, timeout=10).model_client(model_info)
+
+
+def _ask(router, content="q"):
+    resp = router.chat.completions.create(model="m", messages=[{"role": "user", "content": content}])
+    return resp.choices[0].message.content
+
+
+def test_weighted_round_robin_split(stubs):
+    a, b = stubs("a"), stubs("b")
+    router = _router([{"base_url": a.url, "name": "a", "weight": 3},
+                      {"base_url": b.url, "name": "b", "weight": 1}], policy="weighted_round_robin")
+    answers = [_ask(router) for _ in range(8)]
+    assert answers.count("a") == 6 and answers.count("b") == 2
+    # 平滑加权轮询不会连续把4个请求压在 a 上
+    assert "b" in answers[:4]
+    assert (a.hits, b.hits) == (6, 2)
+    assert [s["requests"] for s in router.status()] == [6, 2]
+
+
+def test_least_outstanding_prefers_idle_endpoint(stubs):
+    a, b = stubs("a"), stubs("b")
+    router = _router([{"base_url": a.url, "name": "a"}, {"base_url": b.url, "name": "b"}],
+                     policy="least_outstanding")
+    held = []
+    worker = threading.Thread(target=lambda: held.append(_ask(router, "hold")))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while not (a.holding.is_set() or b.holding.is_set()):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    busy = a if a.holding.is_set() else b
+    idle = b if busy is a else a
+    assert [s["outstanding"] for s in router.status()] == ([1, 0] if busy is a else [0, 1])
+
+    answers = [_ask(router) for _ in range(4)]
+    assert answers == [idle.name] * 4
+    busy.release.set()
+    worker.join(5)
+    assert held == [busy.name]
+    assert [s["outstanding"] for s in router.status()] == [0, 0]
+
+
+def test_failing_endpoint_is_ejected_and_readmitted(stubs):
+    good, bad = stubs("good"), stubs("bad", status=500)
+    router = _router([{"base_url": good.url, "name": "good"}, {"base_url": bad.url, "name": "bad"}],
+                     policy="weighted_round_robin", eject_after=2, eject_seconds=0.5)
+    errors = 0
+    for _ in range(4):
+        try:
+            assert _ask(router) == "good"
+        except APIStatusError:
+            errors += 1
+    assert errors == 2 and bad.hits == 2
+    status = {s["name"]: s for s in router.status()}
+    assert status["bad"]["ejected"] and status["bad"]["ejections"] == 1 and status["bad"]["errors"] == 2
+
+    # 摘除期间全部路由到健康的endpoint
+    assert [_ask(router) for _ in range(4)] == ["good"] * 4
+    assert bad.hits == 2
+
+    # 冷却到期后重新参与路由
+    time.sleep(0.6)
+    assert not {s["name"]: s for s in router.status()}["bad"]["ejected"]
+    for _ in range(4):
+        try:
+            _ask(router)
+        except APIStatusError:
+            pass
+    assert bad.hits > 2
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from strategy_b_with_interpreter.policy import PersistentInterpreter
+from strategy_b_with_interpreter.sandbox import SandboxPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = SandboxPool(n_workers=2, cpu_seconds=0.5, memory_mb=256)
+    yield pool
+    pool.close()
+
+
+def test_memory_error_message_not_empty():
+    ok, _, err = PersistentInterpreter(3).run("raise MemoryError()")
+    assert not ok and err == "MemoryError"
+    ok, _, err = PersistentInterpreter(3).run("raise ValueError('bad')")
+    assert err == "ValueError: bad"
+
+
+def test_runs_policy_and_keeps_state(pool):
+    code = "choice = int(np.argmin(counts))"
+    with pool.session(code, 3, seed=1) as sess:
+        choices = []
+        last = None
+        for t in range(6):
+            ok, a, _, _ = sess.step(t, last)
+            assert ok
+            choices.append(a)
+            last = (a, 1.0)
+    assert choices == [0, 1, 2, 0, 1, 2]
+
+
+def test_compile_error_reported_each_round(pool):
+    with pool.session("choice = (", 3) as sess:
+        ok, a, _, err = sess.step(0)
+    assert not ok and a is None and err
+
+
+def test_cpu_timeout_kills_round_not_pool(pool):
+    with pool.session("while True:\n    pass", 3) as sess:
+        ok, _, _, err = sess.step(0)
+        assert not ok
+        assert "超限" in err or "超时" in err
+    # 池仍可用
+    with pool.session("choice = 2", 3) as sess:
+        assert sess.step(0)[:2] == (True, 2)
+
+
+def test_memory_limit(pool):
+    with pool.session("x = bytearray(2 * 1024 ** 3)\nchoice = 0", 3) as sess:
+        ok, _, _, err = sess.step(0)
+    assert not ok
+    assert err == "MemoryError"
+
+
+def test_crash_replaces_worker(pool):
+    with pool.session("import os\nos._exit(1)", 3) as sess:
+        ok, _, _, err = sess.step(0)
+        assert not ok and sess.dead
+        # 会话失效后每轮直接失败
+        assert sess.step(1)[0] is False
+    for _ in range(3):
+        with pool.session("choice = 1", 3) as sess:
+            assert sess.step(0)[:2] == (True, 1)
+
+
+def test_seeded_sessions_reproducible(pool):
+    code = "choice = int(rng.integers(n_arms)) if t else int(np.random.randint(n_arms))"
+
+    def run(seed):
+        with pool.session(code, 50, seed=seed) as sess:
+            return [sess.step(t)[1] for t in range(10)]
+
+    assert run(7) == run(7)
+    assert run(7) != run(8)
+
+
+def test_available_mask_delivered(pool):
+    mask = np.array([False, True, False, True, False])
+    with pool.session("choice = int(np.flatnonzero(available)[0])", 5) as sess:
+        assert sess.step(0, available=mask)[:2] == (True, 1)
@@ -0,0 +1,41 @@
+from utils.scheduler import iter_schedule, predict_job_seconds
+
+
+def _jobs(n, models=("fast", "slow")):
+    for i in range(n):
+        yield {'model_info': {'name': models[i % len(models)]}, 'task_id': 'basic', 'i': i}
+
+
+LATENCY = {('fast', '*'): 1.0, ('slow', '*'): 10.0}
+
+
+def test_first_dispatch_does_not_wait_for_lookahead():
+    pulled = []
+
+    def source():
+        for job in _jobs(10_000):
+            pulled.append(job)
+            yield job
+
+    first = next(iter_schedule(source(), LATENCY, n_repeats=5, n_workers=8, lookahead=2000))
+    assert first is not None
+    assert len(pulled) == 9
+
+
+def test_all_jobs_emitted_once_and_slow_model_first():
+    out = list(iter_schedule(_jobs(100), LATENCY, n_repeats=5, n_workers=4, lookahead=50))
+    assert sorted(j['i'] for j in out) == list(range(100))
+    assert out[0]['model_info']['name'] == 'slow'
+
+
+def test_schedule_prediction_updated():
+    schedule = {}
+    list(iter_schedule(_jobs(4), LATENCY, n_repeats=1, n_workers=2, schedule=schedule))
+    # 2个 slow(10s) 先占满两个工作线程，2个 fast(1s) 随后
+    assert schedule['makespan'] == 11.0
+    assert schedule['model_finish'] == {'slow': 10.0, 'fast': 11.0}
+
+
+def test_predict_falls_back_to_model_level_and_default():
+    assert predict_job_seconds(LATENCY, 'fast', 'basic', 5) == 5.0
+    assert predict_job_seconds({}, 'x', 'basic', 1) == 300.0
@@ -0,0 +1,70 @@
+import math
+
+from utils.sequential import RepeatBudget, is_resolved, paired_ci, t975, uncertainty
+
+CFG = {'min_repeats': 3, 'rel_precision': 0.5}
+
+
+def test_small_n_never_resolved():
+    assert not is_resolved([], CFG)
+    assert not is_resolved([10.0], CFG)
+    assert not is_resolved([10.0, 10.0], CFG)
+    # min_repeats 配成1也至少需要2个样本才有方差
+    assert not is_resolved([10.0], {'min_repeats': 1})
+    assert paired_ci([5.0]) == (5.0, math.inf)
+
+
+def test_zero_variance_resolved():
+    assert is_resolved([4.0, 4.0, 4.0], CFG)
+    # 差值全为0：A/B完全一致，半宽为0
+    assert is_resolved([0.0, 0.0, 0.0], CFG)
+
+
+def test_mean_near_zero_not_resolved_without_abs_precision():
+    diffs = [1.0, -1.2, 0.9, -0.8, 1.1, -1.0]
+    assert not is_resolved(diffs, CFG)
+    assert is_resolved(diffs, dict(CFG, abs_precision=2.0))
+
+
+def test_precise_difference_resolved():
+    assert is_resolved([50.0, 52.0, 49.0], CFG)
+    assert not is_resolved([50.0, -20.0, 90.0], CFG)
+
+
+def test_ci_matches_textbook():
+    mean, hw = paired_ci([1.0, 2.0, 3.0])
+    assert mean == 2.0
+    assert math.isclose(hw, t975(2) * 1.0 / math.sqrt(3))
+    assert t975(0) == math.inf and t975(100) == 1.96
+
+
+def _job(uid):
+    return {'uid': uid, 'model_info': {}, 'task_id': 't', 'params': {}, 'group_idx': 0}
+
+
+def test_budget_grants_most_uncertain_first_and_caps():
+    budget = RepeatBudget(max_repeats=7)
+    budget.wait(_job('calm'), [10.0, 11.0, 9.0, 10.0, 10.5], next_repeat=5)
+    budget.wait(_job('noisy'), [1.0, -1.0, 2.0, -2.0, 0.5], next_repeat=5)
+    assert budget.grant() == []
+    budget.credit(3)
+    jobs = budget.grant()
+    assert [j['uid'] for j in jobs] == ['noisy', 'calm']
+    assert jobs[0]['repeats'] == [5, 6]          # 上限7次，已有5次
+    assert jobs[1]['repeats'] == [7 - 2]         # 余额只剩1
+    assert jobs[0]['extend'] == [1.0, -1.0, 2.0, -2.0, 0.5]
+    assert budget.available == 0 and budget.granted == 3 and budget.waiting() == 0
+
+
+def test_budget_skips_units_at_cap():
+    budget = RepeatBudget(max_repeats=5)
+    budget.wait(_job('full'), [1.0, -1.0, 2.0, -2.0, 0.5], next_repeat=5)
+    budget.credit(4)
+    assert budget.grant() == []
+    assert budget.available == 4
+
+
+def test_uncertainty_ordering():
+    assert uncertainty([3.0, 3.0, 3.0]) == 0.0
+    assert uncertainty([1.0, -1.0, 1.0, -1.0]) == math.inf
+    assert uncertainty([10.0, 12.0, 8.0]) < uncertainty([10.0, 20.0, 0.5])
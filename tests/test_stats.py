@@ -0,0 +1,79 @@
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from utils.stats import bootstrap_ci, pack_cells, permutation_test, summarize_cells, wilcoxon
+
+
+def _cell(diffs, base=1.0, groups=2):
+    return [(i % groups, base, base + d) for i, d in enumerate(diffs)]
+
+
+def _exact_wilcoxon_p(diffs):
+    """枚举全部符号组合的双侧精确p值（无结、无零差值）"""
+    d = np.asarray(diffs, dtype=float)
+    ranks = np.argsort(np.argsort(np.abs(d))) + 1
+    w = ranks[d > 0].sum()
+    stats = [sum(r for r, s in zip(ranks, signs) if s) for signs in itertools.product((0, 1), repeat=len(d))]
+    lower = np.mean([s <= w for s in stats])
+    upper = np.mean([s >= w for s in stats])
+    return min(1.0, 2 * min(lower, upper))
+
+
+def test_pack_cells_pads_groups_and_repeats():
+    packed = pack_cells([[(0, 1.0, 2.0), (0, 1.0, 3.0), (1, 1.0, 1.5)], [(5, 0.0, 1.0)]])
+    assert packed['a'].shape == (2, 2, 2)
+    assert packed['n_grp'].tolist() == [2, 1]
+    assert packed['n_rep'].tolist() == [[2, 1], [1, 0]]
+
+
+def test_wilcoxon_exact_matches_enumeration():
+    cells = [[0.3, -0.1, 0.7, 0.2, -0.5, 0.9, 0.4], [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]]
+    res = wilcoxon(pack_cells([_cell(c) for c in cells]))
+    for c, diffs in enumerate(cells):
+        assert res['p'][c] == pytest.approx(_exact_wilcoxon_p(diffs))
+        assert res['n'][c] == len(diffs)
+
+
+def test_wilcoxon_drops_zeros_and_handles_ties():
+    res = wilcoxon(pack_cells([_cell([0.0, 0.0]), _cell([1.0, 1.0, -1.0, 2.0] * 20)]))
+    assert res['p'][0] == 1.0 and res['n'][0] == 0
+    assert 0.0 < res['p'][1] < 0.01
+
+
+def test_bootstrap_constant_difference_has_zero_width():
+    ci = bootstrap_ci(pack_cells([_cell([0.5] * 12, base=2.0)]), n_resamples=200)
+    assert ci['diff_lo'][0] == pytest.approx(0.5) and ci['diff_hi'][0] == pytest.approx(0.5)
+    assert ci['rel_lo'][0] == pytest.approx(25.0)
+
+
+@pytest.mark.parametrize("unit", ["group", "repeat"])
+def test_bootstrap_interval_covers_mean(unit):
+    rng = np.random.default_rng(1)
+    diffs = rng.normal(0.3, 1.0, 200)
+    ci = bootstrap_ci(pack_cells([_cell(diffs, groups=10)]), n_resamples=2000, unit=unit, chunk=300)
+    assert ci['diff_lo'][0] < diffs.mean() < ci['diff_hi'][0]
+    assert ci['diff_hi'][0] - ci['diff_lo'][0] < 0.5
+
+
+def test_bootstrap_rejects_unknown_unit():
+    with pytest.raises(ValueError):
+        bootstrap_ci(pack_cells([_cell([1.0])]), unit="model")
+
+
+def test_permutation_test():
+    p = permutation_test(pack_cells([_cell([0.0] * 10), _cell([1.0 + 0.1 * i for i in range(30)])]),
+                         n_permutations=2000)
+    assert p[0] == 1.0
+    assert p[1] == pytest.approx(1 / 2001)
+
+
+def test_summarize_cells_uses_ratio_of_means():
+    out = summarize_cells([[(0, 0.001, 1.0), (0, 4.0, 4.0)]], n_resamples=200)
+    (row,) = out
+    assert row['diff'] == pytest.approx(0.4995)
+    assert row['rel'] == pytest.approx(0.999 / 4.001 * 100)
+    assert summarize_cells([]) == []
+    assert math.isfinite(row['rel_hi'])
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import pytest
+
+from strategy_a_no_code.policy import _parse_action_prefix, _stream_action
+
+
+@pytest.mark.parametrize("text, n_arms, expected", [
+    ("", 15, (False, None)),
+    ("选择", 15, (False, None)),
+    ("1", 15, (False, None)),     # 还可能是 10..14
+    ("1", 10, (True, 1)),         # 追加数字必然越界
+    ("2", 15, (True, 2)),
+    ("12", 15, (True, 12)),
+    ("12,", 15, (True, 12)),
+    ("臂 3。", 15, (True, 3)),
+    ("0", 15, (False, None)),
+    ("0 ", 15, (True, 0)),
+    ("-", 15, (False, None)),
+    ("-1", 15, (True, None)),
+    ("15", 15, (True, None)),
+    ("1", 150, (False, None)),
+    ("149", 150, (True, 149)),
+])
+def test_parse_action_prefix(text, n_arms, expected):
+    assert _parse_action_prefix(text, n_arms) == expected
+
+
+def _chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeStream:
+    """逐个给出chunk，记录已读取的数量与是否被关闭；error 为读完 chunks 后抛出的异常"""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for c in self.chunks:
+            self.read += 1
+            yield c
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+class StreamingClient:
+    def __init__(self, stream):
+        self.stream = stream
+        self.kwargs = None
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        return self.stream
+
+
+def _run(chunks, n_arms, **kwargs):
+    stream = FakeStream([_chunk(c) if isinstance(c, str) or c is None else c for c in chunks])
+    client = StreamingClient(stream)
+    a = _stream_action(client, "m", "prompt", n_arms, 0.1, **kwargs)
+    return a, stream, client
+
+
+def test_multi_digit_arm_waits_then_cuts():
+    a, stream, client = _run(["1", "2", ",", " 因为..."], 15, max_tokens=8)
+    assert a == 12 and stream.read == 2 and stream.closed
+    assert client.kwargs["stream"] is True and client.kwargs["max_tokens"] == 8
+
+
+def test_single_digit_cuts_immediately():
+    a, stream, _ = _run(["3", "，理由"], 15)
+    assert a == 3 and stream.read == 1 and stream.closed
+
+
+def test_empty_and_choiceless_chunks_are_skipped():
+    a, stream, _ = _run([SimpleNamespace(choices=[]), None, "1", "1", "\n"], 15)
+    assert a == 11 and stream.read == 4 and stream.closed
+
+
+def test_negative_and_out_of_range_are_rejected():
+    a, stream, _ = _run(["-", "2", " 其余"], 15)
+    assert a is None and stream.read == 2 and stream.closed
+    a, stream, _ = _run(["1", "7"], 15)
+    assert a is None and stream.read == 2 and stream.closed
+
+
+def test_stream_end_resolves_pending_prefix():
+    # 流在 "1" 之后结束：按完整文本解析
+    a, stream, _ = _run(["1"], 15)
+    assert a == 1 and stream.closed
+    a, stream, _ = _run(["无法", "判断"], 15)
+    assert a is None and stream.closed
+
+
+def test_stream_closed_on_error():
+    stream = FakeStream([_chunk("1")], error=ConnectionError("reset"))
+    with pytest.raises(ConnectionError):
+        _stream_action(StreamingClient(stream), "m", "prompt", 15, 0.1)
+    assert stream.closed
@@ -0,0 +1,51 @@
+import numpy as np
+
+from run_fixed import TASKS
+from utils import trial_store
+from utils.param_generator import ParamGenerator, create_trial_from_params
+from utils.trial_store import TrialStore, materialise, open_or_materialise
+
+N_ROUNDS = 30
+N_REPEATS = 2
+
+
+def _params():
+    return ParamGenerator({}, seed=5).generate_all_params(2)
+
+
+def test_get_round_trips_create_trial_from_params(tmp_path):
+    all_params = _params()
+    store = TrialStore(materialise(tmp_path / "trials.bin", all_params, TASKS, N_REPEATS, N_ROUNDS))
+    seen = set()
+    for task_id, task_key in TASKS:
+        for group_idx, params in enumerate(all_params[task_key]):
+            for r_idx in range(N_REPEATS):
+                trial_params = dict(params, seed=params['seed'] + r_idx)
+                expected = create_trial_from_params(trial_params, N_ROUNDS)
+                got = store.get(task_id, group_idx, r_idx)
+                assert set(got) == set(expected)
+                for name, value in expected.items():
+                    if name in trial_store.ARRAY_FIELDS:
+                        arr = np.asarray(value)
+                        assert got[name].dtype == arr.dtype and np.array_equal(got[name], arr), name
+                    else:
+                        assert got[name] == value, name
+                seen.update(expected)
+    # 逐轮oracle与休眠掩码都经过了往返
+    assert {'oracle', 'availability', 'contexts', 'drift_rate'} <= seen
+
+
+def test_fingerprint_tracks_format_and_generator(tmp_path, monkeypatch):
+    all_params = _params()
+    path = tmp_path / "trials.bin"
+    first = open_or_materialise(path, all_params, TASKS, N_REPEATS, N_ROUNDS).fingerprint
+    assert open_or_materialise(path, all_params, TASKS, N_REPEATS, N_ROUNDS).fingerprint == first
+
+    # 生成代码变化：旧文件失效并重新生成
+    monkeypatch.setattr(trial_store, "_generator_digest", lambda: "changed")
+    second = open_or_materialise(path, all_params, TASKS, N_REPEATS, N_ROUNDS).fingerprint
+    assert second != first
+    assert TrialStore(path).fingerprint == second
+
+    monkeypatch.setattr(trial_store, "FORMAT_VERSION", trial_store.FORMAT_VERSION + 1)
+    assert trial_store.fingerprint(all_params, TASKS, N_REPEATS, N_ROUNDS) != second
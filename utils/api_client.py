@@ -1,32 +1,199 @@
 """
 统一API客户端
 支持火山云等兼容OpenAI格式的API
+
+每个模型可配置多个endpoint（base_url、api_key、model_id、weight），
+由 EndpointRouter 按最少在途请求或加权轮询路由，连续失败的endpoint暂时摘除；
+给出 hedger 时对冲包在各endpoint之内，延迟按endpoint统计
 """
 import yaml
 from openai import OpenAI
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from types import SimpleNamespace
 import os
+import threading
+import time
+
+
+ROUTING_POLICIES = ("least_outstanding", "weighted_round_robin")
+
+
+class _Endpoint:
+    """单个endpoint的客户端与健康状态"""
+    
+    def __init__(self, client, model_id: str, weight: float, name: str):
+        self.client = client
+        self.model_id = model_id
+        self.weight = max(float(weight), 1e-9)
+        self.name = name
+        self.outstanding = 0
+        self.current = 0.0          # 平滑加权轮询的当前权重
+        self.failures = 0           # 连续失败次数
+        self.ejected_until = 0.0
+        self.stats = {'requests': 0, 'errors': 0, 'ejections': 0}
+
+
+class _TrackedStream:
+    """流式响应的包装：流读完或关闭时才结束在途计数"""
+    
+    def __init__(self, stream, on_done):
+        self._stream = stream
+        self._on_done = on_done
+    
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                yield chunk
+        finally:
+            self._finish()
+    
+    def close(self):
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+    
+    def _finish(self):
+        if self._on_done is not None:
+            self._on_done()
+            self._on_done = None
+
+
+class _Completions:
+    def __init__(self, router: "EndpointRouter"):
+        self._router = router
+    
+    def create(self, **kwargs):
+        return self._router.create(**kwargs)
+
+
+class EndpointRouter:
+    """
+    同一模型多个endpoint之间的路由，接口兼容 client.chat.completions.create
+    请求中的 model 会被替换为所选endpoint的 model_id；线程安全
+    """
+    
+    def __init__(self, endpoints: List[_Endpoint], policy: str = "least_outstanding",
+                 eject_after: int = 3, eject_seconds: float = 30.0):
+        """
+        Args:
+            policy: least_outstanding（在途数/权重最小）或 weighted_round_robin（平滑加权轮询）
+            eject_after: 连续失败多少次后摘除
+            eject_seconds: 摘除时长，到期后重新参与路由
+        """
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"未知的路由策略: {policy}（可选: {', '.join(ROUTING_POLICIES)}）")
+        if not endpoints:
+            raise ValueError("至少需要一个endpoint")
+        self.endpoints = endpoints
+        self.policy = policy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._rr = 0
+        self.chat = SimpleNamespace(completions=_Completions(self))
+    
+    def _pick(self) -> _Endpoint:
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.ejected_until <= now]
+        if not healthy:
+            # 全部摘除时选最先到期的，交给熔断器决定是否继续
+            return min(self.endpoints, key=lambda e: e.ejected_until)
+        if self.policy == "weighted_round_robin":
+            total = sum(e.weight for e in healthy)
+            for e in healthy:
+                e.current += e.weight
+            chosen = max(healthy, key=lambda e: e.current)
+            chosen.current -= total
+            return chosen
+        # 在途数相同则轮换起点，避免总压在第一个endpoint上
+        self._rr += 1
+        n = len(healthy)
+        order = healthy[self._rr % n:] + healthy[:self._rr % n]
+        return min(order, key=lambda e: e.outstanding / e.weight)
+    
+    def _done(self, endpoint: _Endpoint, ok: bool):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.failures = 0
+                return
+            endpoint.failures += 1
+            endpoint.stats['errors'] += 1
+            if endpoint.failures >= self.eject_after:
+                endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                endpoint.failures = 0
+                endpoint.stats['ejections'] += 1
+    
+    def create(self, **kwargs):
+        with self._lock:
+            endpoint = self._pick()
+            endpoint.outstanding += 1
+            endpoint.stats['requests'] += 1
+        kwargs['model'] = endpoint.model_id
+        try:
+            resp = endpoint.client.chat.completions.create(**kwargs)
+        except Exception:
+            self._done(endpoint, False)
+            raise
+        if kwargs.get('stream'):
+            return _TrackedStream(resp, lambda: self._done(endpoint, True))
+        self._done(endpoint, True)
+        return resp
+    
+    def status(self) -> List[Dict[str, Any]]:
+        """各endpoint的请求数、错误数、摘除次数与当前在途数"""
+        with self._lock:
+            return [dict(e.stats, name=e.name, outstanding=e.outstanding,
+                         ejected=e.ejected_until > time.monotonic()) for e in self.endpoints]
+
+
+def model_endpoints(config: Dict[str, Any], model_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    模型的endpoint列表；未配置 endpoints 时为 volcengine 默认地址 + model_id 的单个endpoint。
+    endpoints 中各项缺省的 base_url / api_key / model_id 取全局或模型的默认值
+    """
+    default = {
+        'base_url': config['volcengine']['base_url'],
+        'api_key': config['volcengine']['api_key'],
+        'model_id': model_info['model_id'],
+        'weight': 1,
+    }
+    return [{**default, **ep} for ep in model_info.get('endpoints') or [{}]]
 
 
 class UnifiedAPIClient:
     """统一的API客户端，从配置文件读取"""
     
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", config: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None, hedger=None):
         """
         初始化API客户端
         
         Args:
             config_path: 配置文件路径
+            config: 已加载的配置字典，给出时不再读文件
+            timeout: 每次请求的超时（秒）
+            hedger: utils.hedging.Hedger；给出时每个endpoint的客户端都经其包装，键为 <模型名>@<endpoint名>
         """
-        self.config = self._load_config(config_path)
+        self.config = config if config is not None else self._load_config(config_path)
         self.base_url = self.config['volcengine']['base_url']
         self.api_key = self.config['volcengine']['api_key']
+        self.timeout = timeout
+        self.hedger = hedger
         
         # 创建OpenAI客户端
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            timeout=timeout
         )
+        # 同一 (base_url, api_key) 共用一个连接池；每个模型一个路由器
+        self._clients = {(self.base_url, self.api_key): self.client}
+        self._routers: Dict[str, EndpointRouter] = {}
+        self._lock = threading.Lock()
         
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """加载配置文件"""
@@ -49,6 +216,41 @@ class UnifiedAPIClient:
         """获取OpenAI客户端实例"""
         return self.client
     
+    def model_client(self, model_info: Dict[str, Any]) -> EndpointRouter:
+        """
+        模型的路由客户端（按模型名缓存，各线程共享在途计数与健康状态）
+        路由策略取 experiment.routing: {policy, eject_after, eject_seconds}
+        """
+        name = model_info['name']
+        with self._lock:
+            if name not in self._routers:
+                routing = self.config.get('experiment', {}).get('routing', {})
+                endpoints = []
+                for i, ep in enumerate(model_endpoints(self.config, model_info)):
+                    key = (ep['base_url'], ep['api_key'])
+                    if key not in self._clients:
+                        self._clients[key] = OpenAI(api_key=ep['api_key'], base_url=ep['base_url'],
+                                                    timeout=self.timeout)
+                    ep_name = ep.get('name', f"{ep['base_url']}#{i}")
+                    client = self._clients[key]
+                    if self.hedger is not None:
+                        # 对冲在路由之后：延迟分布按endpoint统计，对冲请求发往同一endpoint
+                        client = self.hedger.wrap(client, f"{name}@{ep_name}")
+                    endpoints.append(_Endpoint(client, ep['model_id'], ep['weight'], ep_name))
+                self._routers[name] = EndpointRouter(
+                    endpoints,
+                    policy=routing.get('policy', 'least_outstanding'),
+                    eject_after=routing.get('eject_after', 3),
+                    eject_seconds=routing.get('eject_seconds', 30.0)
+                )
+            return self._routers[name]
+    
+    def routing_status(self) -> Dict[str, List[Dict[str, Any]]]:
+        """已创建路由器的各endpoint状态"""
+        with self._lock:
+            routers = dict(self._routers)
+        return {name: router.status() for name, router in routers.items()}
+    
     def get_experiment_config(self) -> Dict[str, Any]:
         """获取实验配置"""
         return self.config.get('experiment', {})
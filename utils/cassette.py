@@ -0,0 +1,212 @@
+"""
+LLM交互录制/回放（cassette）
+录制模式：把每次请求/响应连同 (model, task, group, repeat, strategy, unit_key, round) 键写入压缩文件
+回放模式：从文件读取响应喂给策略A/B，无需网络即可离线重算实验
+unit_key 为单元内容键（utils.job_key），参数或提示词变化后旧录制不再命中，回放报缺失而不是喂入过期响应
+
+并发写入：每个写入方（分片）只追加自己的文件 <task>.<writer>.jsonl.gz，多个进程/机器不会写同一文件；
+每个单元压缩成一个完整的gzip member，以 O_APPEND 一次 write 写入，进程内另有线程锁。
+回放时读取该任务的全部写入方文件（含不带写入方后缀的旧文件）。
+"""
+import gzip
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class CassetteMiss(KeyError):
+    """回放时找不到对应的录制记录"""
+
+
+def make_response(content: Optional[str]) -> SimpleNamespace:
+    """构造与OpenAI响应结构兼容的最小对象（resp.choices[0].message.content）"""
+    message = SimpleNamespace(content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_stream(content: Optional[str]):
+    """构造与OpenAI流式响应兼容的最小迭代器（chunk.choices[0].delta.content）"""
+    delta = SimpleNamespace(content=content)
+    return iter([SimpleNamespace(choices=[SimpleNamespace(delta=delta)])])
+
+
+class _RecordingStream:
+    """录制流式响应：边迭代边累积内容；调用方提前关闭时只录下已收到的部分"""
+
+    def __init__(self, stream, entry: Dict[str, Any]):
+        self._stream = stream
+        self._entry = entry
+        self._entry["response"] = ""
+
+    def __iter__(self):
+        for chunk in self._stream:
+            if chunk.choices:
+                self._entry["response"] += chunk.choices[0].delta.content or ""
+            yield chunk
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+
+
+class _Completions:
+    def __init__(self, session: "CassetteSession"):
+        self._session = session
+
+    def create(self, **kwargs):
+        return self._session.create(**kwargs)
+
+
+class CassetteSession:
+    """
+    绑定到单个 (model, task, group, repeat, strategy, unit_key) 单元的客户端
+    接口兼容 client.chat.completions.create，每次调用轮次自增
+    """
+
+    def __init__(self, cassette: "Cassette", key: Dict[str, Any], client=None):
+        self.cassette = cassette
+        self.key = key
+        self.client = client
+        self.round = 0
+        # 回放缺失次数；策略A会吞掉异常走随机兜底，调用方需据此判定单元失败
+        self.misses = 0
+        self.entries: List[Dict[str, Any]] = []
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def create(self, **kwargs):
+        t = self.round
+        self.round += 1
+
+        if self.cassette.mode == "replay":
+            try:
+                resp = self.cassette.lookup(self.key, t)
+            except CassetteMiss:
+                self.misses += 1
+                raise
+            if kwargs.get("stream"):
+                return make_stream(resp.choices[0].message.content)
+            return resp
+
+        entry = dict(self.key, round=t, request={
+            "messages": kwargs.get("messages"),
+            "temperature": kwargs.get("temperature"),
+        })
+        try:
+            resp = self.client.chat.completions.create(**kwargs)
+        except Exception as e:
+            # 失败也要录下来，回放时原样抛出，保证兜底路径一致
+            entry["error"] = str(e)[:200]
+            self.entries.append(entry)
+            raise
+        self.entries.append(entry)
+        if kwargs.get("stream"):
+            return _RecordingStream(resp, entry)
+        entry["response"] = resp.choices[0].message.content
+        return resp
+
+    def flush(self):
+        """单元成功结束后整体写入（一个gzip member），重试时丢弃半截记录"""
+        if self.cassette.mode == "record" and self.entries:
+            self.cassette.write(self.key, self.entries)
+        self.entries = []
+
+
+def _safe(name: str) -> str:
+    return str(name).replace('/', '_').replace('\\', '_')
+
+
+def _tape_key(key: Dict[str, Any], t: int) -> Tuple:
+    # 旧录制没有 unit_key，只能被同样不带内容键的会话命中
+    return key["group"], key["repeat"], key["strategy"], key.get("unit_key"), t
+
+
+class Cassette:
+    """
+    cassette文件管理器
+    文件布局: <base_dir>/<model>/<task>.<writer>.jsonl.gz，每行一次请求/响应
+    """
+
+    def __init__(self, base_dir, mode: str = "record", writer: Optional[str] = None):
+        """
+        Args:
+            writer: 写入方标识（分片ID）；不给时按主机名和进程号生成，保证各进程写不同文件
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知cassette模式: {mode}")
+        self.base_dir = Path(base_dir)
+        self.mode = mode
+        self.writer = _safe(writer) if writer else f"{_safe(socket.gethostname())}-{os.getpid()}"
+        self._lock = threading.Lock()
+        # (model, task) -> {(group, repeat, strategy, unit_key, round): entry}
+        self._tapes: Dict[Tuple[str, str], Dict[Tuple, Dict[str, Any]]] = {}
+
+    def _dir(self, model: str) -> Path:
+        return self.base_dir / _safe(model)
+
+    def _path(self, model: str, task: str) -> Path:
+        return self._dir(model) / f"{task}.{self.writer}.jsonl.gz"
+
+    def _tape_paths(self, model: str, task: str) -> List[Path]:
+        """该任务所有写入方的文件，按修改时间排序，重复录制时以较新的为准"""
+        directory = self._dir(model)
+        paths = list(directory.glob(f"{task}.*.jsonl.gz"))
+        legacy = directory / f"{task}.jsonl.gz"
+        if legacy.exists():
+            paths.append(legacy)
+        return sorted(paths, key=lambda p: p.stat().st_mtime)
+
+    def session(self, client, model, task, group, repeat, strategy, unit_key=None) -> CassetteSession:
+        """为一个 (model, task, group, repeat, strategy) 单元创建会话；unit_key 为单元内容键"""
+        key = {
+            "model": model,
+            "task": task,
+            "group": group,
+            "repeat": repeat,
+            "strategy": strategy,
+            "unit_key": unit_key,
+        }
+        return CassetteSession(self, key, client=client)
+
+    def write(self, key: Dict[str, Any], entries: List[Dict[str, Any]]):
+        path = self._path(key["model"], key["task"])
+        payload = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+        # 整个单元压缩成一个gzip member；多member文件可被gzip整体顺序读出
+        member = gzip.compress(payload.encode("utf-8"))
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                view = memoryview(member)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+
+    def _load(self, model: str, task: str) -> Dict[Tuple, Dict[str, Any]]:
+        with self._lock:
+            tape = self._tapes.get((model, task))
+            if tape is not None:
+                return tape
+            tape = {}
+            for path in self._tape_paths(model, task):
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        e = json.loads(line)
+                        # 同一键重复录制时以最后一次为准
+                        tape[_tape_key(e, e["round"])] = e
+            self._tapes[(model, task)] = tape
+            return tape
+
+    def lookup(self, key: Dict[str, Any], t: int):
+        tape = self._load(key["model"], key["task"])
+        entry = tape.get(_tape_key(key, t))
+        if entry is None:
+            raise CassetteMiss(f"cassette缺失: {key} round={t}")
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return make_response(entry.get("response"))
@@ -0,0 +1,136 @@
+"""
+按模型endpoint的熔断器
+连续失败达到阈值后熔断：该模型的请求立即失败、作业被暂存（park），
+冷却后由调度循环发送探测请求（半开），探测成功即恢复并重新排队暂存作业
+"""
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间拒绝发出的请求"""
+
+
+class JobParked(Exception):
+    """作业因熔断或失败被暂存，repeats 为尚未成功的重复编号"""
+
+    def __init__(self, model_id: str, repeats: List[int], reason: str = ""):
+        super().__init__(f"{model_id} 暂存 {len(repeats)} 次重复: {reason}")
+        self.model_id = model_id
+        self.repeats = repeats
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """单个endpoint的熔断器（closed -> open -> half_open -> closed）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断后多久允许探测（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.failed_probes = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """是否处于熔断（含半开探测中），此时工作线程不应发请求"""
+        return self.state != self.CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.failed_probes = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def ready_for_probe(self) -> bool:
+        """冷却结束后进入半开状态，返回True表示调用方应发送一次探测"""
+        with self._lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def probe_failed(self):
+        with self._lock:
+            self.failed_probes += 1
+            self.state = self.OPEN
+            self.opened_at = time.time()
+
+
+class BreakerRegistry:
+    """按 model_id 管理熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_id: str) -> CircuitBreaker:
+        with self._lock:
+            if model_id not in self._breakers:
+                self._breakers[model_id] = CircuitBreaker(self.failure_threshold, self.cooldown)
+            return self._breakers[model_id]
+
+
+class _Completions:
+    def __init__(self, guarded: "GuardedClient"):
+        self._guarded = guarded
+
+    def create(self, **kwargs):
+        return self._guarded.create(**kwargs)
+
+
+class GuardedClient:
+    """
+    受熔断器保护的客户端，接口兼容 client.chat.completions.create
+    每次调用的成败都计入熔断器；熔断期间直接抛 CircuitOpenError，不占用网络
+    """
+
+    def __init__(self, client, breaker: CircuitBreaker):
+        self.client = client
+        self.breaker = breaker
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def create(self, **kwargs):
+        if self.breaker.is_open():
+            raise CircuitOpenError("endpoint熔断中")
+        try:
+            resp = self.client.chat.completions.create(**kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return resp
+
+
+def probe_endpoint(client, model_id: str) -> bool:
+    """半开探测：发送一个极小请求检查endpoint是否恢复"""
+    try:
+        client.chat.completions.create(
+            model=model_id,
+            messages=[{"role": "user", "content": "ping"}],
+            max_tokens=1
+        )
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,267 @@
+"""
+对冲请求与逐次调用截止时间
+策略A的120轮严格串行，单轮的尾延迟直接叠加到trial耗时上。
+一次调用超过该endpoint近期延迟的分位数（默认p95）仍未返回时，再发一份相同请求，取先返回者；
+对冲总量受预算限制（对冲次数 <= budget × 原始调用数 + burst）。
+每次调用都有截止时间，到期仍无结果则抛 TimeoutError（计入熔断器）。
+
+线程：无法对冲（延迟样本不足、预算用尽或原始请求线程池已满）时原始请求直接在调用方线程执行；
+可能对冲时原始请求进入有界的原始请求线程池，对冲请求进入另一个有界线程池。原始请求只在池中有空闲
+线程时才提交，落选请求占着线程直到返回或超时（同步客户端无法中途取消非流式请求），也不会让后续
+原始请求排队；落选的流在返回后立即关闭。
+落选请求的实际完成时间用于估计“不对冲时”每个trial的耗时，报告中与实际耗时的p99对比。
+
+流式请求（stream=True）按首个chunk到达计时：取到首个token才算返回，对冲触发与延迟分位数都针对
+首token时间，且与非流式请求分开统计。
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class _TrialClock:
+    """一个trial的实际耗时与因对冲节省的时间"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.seconds = None
+        self.saved = 0.0
+        self.lock = threading.Lock()
+
+
+class _PrefetchedStream:
+    """已取到首个chunk的流：迭代时先给出首个chunk，其余照常读取"""
+
+    _EMPTY = object()
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._iter = iter(stream)
+        self._first = next(self._iter, self._EMPTY)
+
+    def __iter__(self):
+        if self._first is not self._EMPTY:
+            first, self._first = self._first, self._EMPTY
+            yield first
+        yield from self._iter
+
+    def close(self):
+        close = getattr(self._stream, 'close', None)
+        if close is not None:
+            close()
+
+
+class _Completions:
+    def __init__(self, hedged: "HedgedClient"):
+        self._hedged = hedged
+
+    def create(self, **kwargs):
+        return self._hedged.create(**kwargs)
+
+
+class HedgedClient:
+    """单个endpoint的对冲包装，接口兼容 client.chat.completions.create；key 标识该endpoint"""
+
+    def __init__(self, client, hedger: "Hedger", key: str):
+        self.client = client
+        self.hedger = hedger
+        self.key = key
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def _call(self, kwargs):
+        start = time.monotonic()
+        resp = self.client.chat.completions.create(**kwargs)
+        if kwargs.get('stream'):
+            # 流式请求取到首个chunk才算返回
+            resp = _PrefetchedStream(resp)
+        return resp, start, time.monotonic()
+
+    def _primary(self, kwargs):
+        """原始请求线程池中的任务，结束时归还名额"""
+        try:
+            return self._call(kwargs)
+        finally:
+            self.hedger._primary_slots.release()
+
+    def create(self, **kwargs):
+        h = self.hedger
+        # 流式与非流式的延迟分布不同，分开统计
+        key = (self.key, bool(kwargs.get('stream')))
+        h._count('calls')
+        delay = h.hedge_delay(key)
+        if delay is None or not h._budget_left() or not h._acquire_primary():
+            # 不会对冲：在调用方线程直接执行，截止时间由客户端超时保证
+            resp, start, end = self._call(kwargs)
+            h.record(key, end - start)
+            return resp
+
+        deadline = time.monotonic() + h.deadline
+        clock = getattr(h._local, 'clock', None)
+        primary = h._primary_pool.submit(self._primary, kwargs)
+        futures = [primary]
+        done, _ = wait(futures, timeout=min(delay, h.deadline))
+        if not done and h._take_budget():
+            futures.append(h._pool.submit(self._call, kwargs))
+
+        pending = set(futures)
+        error = None
+        while pending:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    resp, start, end = fut.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                h.record(key, end - start)
+                for other in pending:
+                    other.add_done_callback(self._loser_callback(key, end, clock, other is primary))
+                if fut is not primary:
+                    h._count('wins')
+                return resp
+
+        for other in pending:
+            other.add_done_callback(self._loser_callback(key, None, clock, False))
+        if error is not None and not pending:
+            raise error
+        h._count('deadline_exceeded')
+        raise TimeoutError(f"{self.key} 调用超过 {h.deadline:g}s 截止时间")
+
+    def _loser_callback(self, key, winner_end: Optional[float], clock: Optional[_TrialClock], is_primary: bool):
+        """落选请求返回后：记录延迟、关闭流；原始请求落选时把晚到的时间计为节省"""
+        def callback(fut):
+            try:
+                resp, start, end = fut.result()
+            except Exception:
+                return
+            self.hedger.record(key, end - start)
+            close = getattr(resp, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+            if is_primary and winner_end is not None and clock is not None:
+                with clock.lock:
+                    clock.saved += max(0.0, end - winner_end)
+        return callback
+
+
+class Hedger:
+    """所有endpoint共享的延迟窗口、对冲预算、对冲线程池与统计；线程安全"""
+
+    def __init__(self, deadline: float = 60.0, quantile: float = 0.95, budget: float = 0.05,
+                 burst: int = 5, min_samples: int = 20, window: int = 500, max_workers: int = 64,
+                 primary_workers: int = 64):
+        """
+        Args:
+            deadline: 单次调用截止时间（秒）
+            quantile: 超过该延迟分位数仍未返回即对冲
+            budget: 对冲次数占原始调用数的上限比例
+            burst: 预算之外允许的少量突发对冲
+            min_samples: 延迟样本不足时不对冲
+            window: 每个endpoint保留的最近延迟样本数
+            max_workers: 对冲请求线程池大小
+            primary_workers: 可能对冲的原始请求线程池大小，应不小于并发调用方数；池满时原始请求
+                在调用方线程执行且不对冲
+        """
+        self.deadline = deadline
+        self.quantile = quantile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self._latency = defaultdict(lambda: deque(maxlen=window))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._primary_pool = ThreadPoolExecutor(max_workers=primary_workers, thread_name_prefix="hedge-primary")
+        # 名额与池大小相同：只在有空闲线程时提交，原始请求不在池中排队
+        self._primary_slots = threading.BoundedSemaphore(primary_workers)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trials = []
+        self.stats = {'calls': 0, 'hedged': 0, 'wins': 0, 'budget_denied': 0, 'deadline_exceeded': 0,
+                      'pool_full': 0}
+
+    def wrap(self, client, key: str) -> HedgedClient:
+        return HedgedClient(client, self, key)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _budget_left(self) -> bool:
+        """是否还有对冲预算（不占用）"""
+        with self._lock:
+            return self.stats['hedged'] < self.budget * self.stats['calls'] + self.burst
+
+    def _acquire_primary(self) -> bool:
+        """占一个原始请求线程名额；池满时返回False"""
+        if self._primary_slots.acquire(blocking=False):
+            return True
+        self._count('pool_full')
+        return False
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.stats['hedged'] < self.budget * self.stats['calls'] + self.burst:
+                self.stats['hedged'] += 1
+                return True
+            self.stats['budget_denied'] += 1
+            return False
+
+    def record(self, key, seconds: float):
+        with self._lock:
+            self._latency[key].append(seconds)
+
+    def hedge_delay(self, key) -> Optional[float]:
+        """该endpoint（区分是否流式）近期延迟的分位数；样本不足时返回None（不对冲）"""
+        with self._lock:
+            samples = list(self._latency[key])
+        if len(samples) < self.min_samples:
+            return None
+        return float(np.quantile(samples, self.quantile))
+
+    def trial(self):
+        """计时上下文：包住一个trial的全部调用，用于对比对冲前后的trial耗时"""
+        hedger = self
+
+        class _Scope:
+            def __enter__(self):
+                self.clock = _TrialClock()
+                hedger._local.clock = self.clock
+                return self.clock
+
+            def __exit__(self, *exc):
+                hedger._local.clock = None
+                self.clock.seconds = time.monotonic() - self.clock.start
+                with hedger._lock:
+                    hedger._trials.append(self.clock)
+
+        return _Scope()
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Returns:
+            stats 加上 trials、p50/p99（实际）与 p50_unhedged/p99_unhedged（实际 + 对冲节省）
+        """
+        with self._lock:
+            trials = [c for c in self._trials if c.seconds is not None]
+            out = dict(self.stats)
+        out['trials'] = len(trials)
+        if trials:
+            actual = np.array([c.seconds for c in trials])
+            unhedged = actual + np.array([c.saved for c in trials])
+            out['p50'], out['p99'] = np.percentile(actual, [50, 99]).tolist()
+            out['p50_unhedged'], out['p99_unhedged'] = np.percentile(unhedged, [50, 99]).tolist()
+        return out
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._primary_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,104 @@
+"""
+按内容寻址的单元键
+一个 (模型, 任务, 参数组) 单元的身份由全部有效输入的哈希决定：model_id、任务参数字典、轮数、
+根种子，以及策略A提示词与策略B代码生成提示词的版本。config.yaml 或提示词改动后，
+只有输入真正变化的单元得到新键、被视为过期而重跑；旧结果记录保留原键，仍可按键查询。
+
+执行设置只在偏离默认值时计入，默认配置下的键与之前一致：
+- 策略A置信门控、stream、max_tokens：改变调用与截断方式，影响策略A的选择
+- 沙箱 cpu_seconds、memory_mb：决定哪些策略代码超限而回退到 fallback_ucb
+- 策略库 mode、dry_rounds、max_attempts：决定策略B使用哪段代码（每trial生成或复用已验证代码）
+不计入的：沙箱 workers、max_sessions_per_worker（子进程按trial播种，与结果无关），
+策略库 path（存放位置），以及并发、重试、对冲、cassette 等只影响调度与耗时的设置。
+"""
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from utils.shared import FULL_STATS_MAX_ARMS
+
+# 进度文件中不含键的旧式单元ID（模型|任务|参数组）的段数
+LEGACY_PARTS = 3
+# 影响大K摘要提示词的配置项
+_SUMMARY_KEYS = ('top_k', 'tail_groups', 'unexplored_sample')
+
+
+def _digest(obj: Any, length: int = 12) -> str:
+    text = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:length]
+
+
+@lru_cache(maxsize=None)
+def _strategy_versions(n_arms: int, summary_json: str, sleeping: bool) -> Dict[str, str]:
+    # 延迟导入，避免 utils 与策略包循环依赖
+    from strategy_a_no_code.policy import SUMMARY_DEFAULTS, build_prompt
+    from strategy_b_with_interpreter.policy_store import prompt_version
+
+    summary_cfg = {**SUMMARY_DEFAULTS, **json.loads(summary_json)}
+    history = {i: [] for i in range(n_arms)}
+    zeros = np.zeros(n_arms)
+    # 休眠任务的提示词带本轮可用臂
+    available = np.ones(n_arms, dtype=bool) if sleeping else None
+    prompt_a = build_prompt(0, n_arms, history, zeros.astype(np.int64), zeros, summary_cfg, available)
+    # 首轮提示词体现不出摘要规模，大K时把摘要配置一并计入
+    version_a = _digest([prompt_a, summary_cfg if n_arms > FULL_STATS_MAX_ARMS else None])
+    return {'A': version_a, 'B': prompt_version(n_arms, sleeping)}
+
+
+def strategy_versions(n_arms: int, large_k: Optional[Dict[str, Any]] = None,
+                      sleeping: bool = False) -> Dict[str, str]:
+    """两种策略在该臂数下的提示词版本；sleeping 为休眠任务"""
+    summary = {k: v for k, v in (large_k or {}).items() if k in _SUMMARY_KEYS}
+    return _strategy_versions(int(n_arms), json.dumps(summary, sort_keys=True), bool(sleeping))
+
+
+def _settings(strategy_a: Optional[Dict[str, Any]], sandbox: Optional[Dict[str, Any]],
+              policy_store: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """影响结果的执行设置中偏离默认值的部分"""
+    out = {}
+    strategy_a = strategy_a or {}
+    gate = strategy_a.get('gate') or {}
+    if gate.get('enabled', False):
+        out['a_gate'] = gate
+    if strategy_a.get('stream', False):
+        out['a_stream'] = True
+    if strategy_a.get('max_tokens') is not None:
+        out['a_max_tokens'] = strategy_a['max_tokens']
+    if sandbox and sandbox.get('enabled', False):
+        out['sandbox'] = {'cpu_seconds': sandbox.get('cpu_seconds', 1.0),
+                          'memory_mb': sandbox.get('memory_mb', 512)}
+    if policy_store and policy_store.get('enabled', False):
+        out['policy_store'] = {'mode': policy_store.get('mode', 'per_trial'),
+                               'dry_rounds': policy_store.get('dry_rounds', 20),
+                               'max_attempts': policy_store.get('max_attempts', 3)}
+    return out
+
+
+def unit_key(model_id: str, task_id: str, params: Dict[str, Any], n_rounds: int, seed: int,
+             large_k: Optional[Dict[str, Any]] = None, strategy_a: Optional[Dict[str, Any]] = None,
+             sandbox: Optional[Dict[str, Any]] = None, policy_store: Optional[Dict[str, Any]] = None) -> str:
+    """
+    单元的内容键（16位十六进制）
+
+    Args:
+        strategy_a, sandbox, policy_store: config.yaml 中 experiment 下的同名配置；
+            其中影响结果的项只在偏离默认值时计入（见模块说明）
+    """
+    inputs = {
+        'model_id': model_id,
+        'task': task_id,
+        'params': params,
+        'n_rounds': n_rounds,
+        'seed': seed,
+        'prompts': strategy_versions(params['n_arms'], large_k, sleeping='sleep_prob' in params),
+    }
+    inputs.update(_settings(strategy_a, sandbox, policy_store))
+    return _digest(inputs, length=16)
+
+
+def is_legacy_id(uid: str) -> bool:
+    """是否为不含内容键的旧式单元ID"""
+    return uid.count('|') == LEGACY_PARTS - 1
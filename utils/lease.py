@@ -0,0 +1,212 @@
+"""
+基于文件租约的多进程/多机协调
+多个runner指向同一个共享结果目录，通过原子创建租约文件认领任务单元，
+持有期间定期心跳，超时未心跳的租约可被其他分片接管；
+被接管的单元在原分片上标记为丢失，原分片写结果前核对（lost），丢弃该单元而不是与新持有者重复运行
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Set
+
+
+def _unit_filename(unit_id: str) -> str:
+    """把 model|task|group 形式的单元ID转换为安全文件名"""
+    return unit_id.replace('|', '__').replace('/', '_').replace('\\', '_')
+
+
+def done_units(lease_dir) -> Set[str]:
+    """
+    租约目录中全部完成标记对应的单元ID（从标记内容读取，文件名无法还原含 / 的模型名）；
+    旧版标记没有记录单元ID，退回按文件名还原，其中的模型名为替换过 / 的形式
+    """
+    units = set()
+    for path in Path(lease_dir).glob("*.done"):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                units.add(json.load(f)['unit_id'])
+        except (OSError, ValueError, KeyError):
+            units.add(path.name[:-len(".done")].replace('__', '|'))
+    return units
+
+
+class LeaseLost(RuntimeError):
+    """租约已被其他分片接管，本分片不得再写入该单元的结果"""
+
+
+class LeaseManager:
+    """
+    租约管理器
+
+    目录布局:
+        <lease_dir>/<unit>.lease  当前持有者（mtime即最后心跳时间）
+        <lease_dir>/<unit>.done   单元已完成标记（内容含单元ID）
+    """
+
+    def __init__(self, lease_dir, shard_id: str, ttl: float = 300.0, heartbeat_interval: float = 30.0):
+        """
+        Args:
+            lease_dir: 共享租约目录
+            shard_id: 分片ID（同一时刻各runner需不同）
+            ttl: 租约过期时间（秒），超过该时间无心跳视为持有者已失联
+            heartbeat_interval: 心跳间隔（秒）
+        """
+        self.lease_dir = Path(lease_dir)
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_id = shard_id
+        self.owner = f"{shard_id}@{socket.gethostname()}:{os.getpid()}"
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._held: Set[str] = set()
+        self._lost: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _lease_path(self, unit_id: str) -> Path:
+        return self.lease_dir / f"{_unit_filename(unit_id)}.lease"
+
+    def _done_path(self, unit_id: str) -> Path:
+        return self.lease_dir / f"{_unit_filename(unit_id)}.done"
+
+    def is_done(self, unit_id: str) -> bool:
+        return self._done_path(unit_id).exists()
+
+    def is_alive(self, unit_id: str) -> bool:
+        """单元是否被某个分片以未过期租约持有"""
+        try:
+            return time.time() - self._lease_path(unit_id).stat().st_mtime < self.ttl
+        except FileNotFoundError:
+            return False
+
+    def _owner_of(self, unit_id: str) -> Optional[str]:
+        """租约文件记录的持有者；文件不存在或正被他人写入时返回None"""
+        try:
+            with open(self._lease_path(unit_id), 'r', encoding='utf-8') as f:
+                return json.load(f).get('owner')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _mark_lost(self, unit_id: str):
+        with self._lock:
+            if unit_id in self._held:
+                self._held.discard(unit_id)
+                self._lost.add(unit_id)
+
+    def lost(self, unit_id: str) -> bool:
+        """
+        本分片认领的单元是否已被其他分片接管
+        先看心跳线程的标记，再当场核对租约文件的持有者，写结果前调用
+        """
+        with self._lock:
+            if unit_id in self._lost:
+                return True
+            if unit_id not in self._held:
+                return False
+        if self._owner_of(unit_id) != self.owner:
+            self._mark_lost(unit_id)
+            return True
+        return False
+
+    def _create(self, path: Path) -> bool:
+        try:
+            fd = os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'owner': self.owner, 'claimed_at': time.time()}, f)
+        return True
+
+    def claim(self, unit_id: str) -> bool:
+        """尝试认领单元；已完成或被他人有效持有时返回False"""
+        if self.is_done(unit_id):
+            return False
+        path = self._lease_path(unit_id)
+        if not self._create(path):
+            if self.is_alive(unit_id):
+                return False
+            # 过期租约：先原子改名抢占，只有一个分片能改名成功
+            stale = path.with_name(f"{path.name}.stale.{uuid.uuid4().hex}")
+            try:
+                os.rename(path, stale)
+            except FileNotFoundError:
+                return False
+            if time.time() - stale.stat().st_mtime < self.ttl:
+                # 改名期间租约已被他人重新认领，原样放回
+                try:
+                    os.link(stale, path)
+                except FileExistsError:
+                    pass
+                os.remove(stale)
+                return False
+            os.remove(stale)
+            if not self._create(path):
+                return False
+        # 认领与完成之间可能有其他分片刚好完成
+        if self.is_done(unit_id):
+            self._remove(path)
+            return False
+        with self._lock:
+            self._held.add(unit_id)
+        return True
+
+    def _remove(self, path: Path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release(self, unit_id: str, done: bool = True):
+        """释放租约；done=True 时先写完成标记，已丢失的租约不写"""
+        with self._lock:
+            lost = unit_id in self._lost
+            self._lost.discard(unit_id)
+        if done and not lost:
+            done_path = self._done_path(unit_id)
+            tmp = done_path.with_name(f"{done_path.name}.{uuid.uuid4().hex}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'unit_id': unit_id, 'owner': self.owner, 'done_at': time.time()}, f)
+            os.replace(tmp, done_path)
+        with self._lock:
+            held = unit_id in self._held
+            self._held.discard(unit_id)
+        # 只删除自己持有的租约，不误删已被其他分片接管的
+        if held:
+            self._remove(self._lease_path(unit_id))
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                held = list(self._held)
+            for unit_id in held:
+                # 本分片心跳中断过久、租约已被他人接管：标记丢失，不再续期他人的租约
+                if self._owner_of(unit_id) != self.owner:
+                    self._mark_lost(unit_id)
+                    continue
+                try:
+                    os.utime(self._lease_path(unit_id))
+                except FileNotFoundError:
+                    self._mark_lost(unit_id)
+
+    def start(self):
+        """启动心跳线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止心跳并放弃所有未完成租约，便于其他分片立即接管"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            held = list(self._held)
+            self._held.clear()
+            self._lost.clear()
+        for unit_id in held:
+            self._remove(self._lease_path(unit_id))
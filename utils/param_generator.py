@@ -35,6 +35,10 @@ class ParamGenerator:
         bandit_cfg = self.config.get('bandit_params', {})
         
         n_arms_range = bandit_cfg.get('n_arms_range', [3, 10])
+        # 大K模式：臂数范围改取 large_k.n_arms_range（数百到数千臂）
+        large_k_cfg = self.config.get('large_k', {})
+        if large_k_cfg.get('enabled', False):
+            n_arms_range = large_k_cfg.get('n_arms_range', [100, 5000])
         mean_low_range = bandit_cfg.get('mean_low_range', [2.0, 5.0])
         mean_high_range = bandit_cfg.get('mean_high_range', [7.0, 9.0])
         sigma_range = bandit_cfg.get('sigma_range', [0.5, 2.0])
@@ -118,6 +122,23 @@ class ParamGenerator:
         }
 
 
+def compute_oracle(expected: np.ndarray, availability: np.ndarray = None) -> np.ndarray:
+    """
+    计算逐轮oracle：每轮可用臂中的最大期望奖励
+    
+    Args:
+        expected: 期望奖励表，shape=(..., n_rounds, n_arms)
+        availability: 可用掩码，与expected同形状；None表示所有臂均可用
+        
+    Returns:
+        shape=(..., n_rounds) 的oracle数组
+    """
+    expected = np.asarray(expected, dtype=float)
+    if availability is not None:
+        expected = np.where(availability, expected, -np.inf)
+    return expected.max(axis=-1)
+
+
 def create_trial_from_params(params: Dict[str, Any], n_rounds: int = 120) -> Dict[str, Any]:
     """
     从参数字典创建trial数据
@@ -127,7 +148,7 @@ def create_trial_from_params(params: Dict[str, Any], n_rounds: int = 120) -> Dic
         n_rounds: 轮数
         
     Returns:
-        trial字典，包含means和rewards
+        trial字典，包含means、rewards和逐轮oracle
     """
     rng = np.random.default_rng(params['seed'])
     
@@ -141,6 +162,9 @@ def create_trial_from_params(params: Dict[str, Any], n_rounds: int = 120) -> Dic
     # 生成奖励矩阵
     noise = rng.normal(0, params['sigma'], size=(n_rounds, params['n_arms']))
     
+    # 期望奖励表（不含观测噪声），用于逐轮oracle
+    expected = np.broadcast_to(means, (n_rounds, params['n_arms']))
+    
     # 处理非平稳情况
     if 'drift_rate' in params:
         drift = np.cumsum(
@@ -148,15 +172,24 @@ def create_trial_from_params(params: Dict[str, Any], n_rounds: int = 120) -> Dic
             axis=0
         )
         rewards = means + noise + drift
+        expected = means + drift
     else:
         rewards = means + noise
     
+    # 休眠掩码在奖励之后采样，保证既有奖励序列不变
+    availability = None
+    if 'sleep_prob' in params:
+        availability = rng.random((n_rounds, params['n_arms'])) > params['sleep_prob']
+        all_asleep = ~availability.any(axis=1)
+        availability[all_asleep, rng.integers(0, params['n_arms'], size=int(all_asleep.sum()))] = True
+    
     trial = {
         'means': means.tolist(),
         'rewards': rewards.tolist(),
         'n_arms': params['n_arms'],
         'best_arm': int(np.argmax(means)),
         'best_mean': float(np.max(means)),
+        'oracle': compute_oracle(expected, availability).tolist(),
         'params': params
     }
     
@@ -173,6 +206,7 @@ def create_trial_from_params(params: Dict[str, Any], n_rounds: int = 120) -> Dic
     
     if 'sleep_prob' in params:
         trial['sleep_prob'] = params['sleep_prob']
+        trial['availability'] = availability.tolist()
     
     return trial
 
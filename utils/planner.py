@@ -0,0 +1,221 @@
+"""
+运行前的干跑规划
+按 config.yaml 展开 模型×任务×参数组 网格并扣除已完成单元，结合历史数据预测：
+API调用次数、token用量、费用，以及在给定并发下各模型与整体的完成时间
+
+- 耗时: utils.scheduler.estimate_trial_seconds（结果JSONL相邻重复的时间戳差）
+- token: cassette录制的请求/响应字符数换算；没有录制时用 DEFAULT_TOKENS
+- 策略A置信门控与序贯早停/追加重复开启时，按已有结果记录中观测到的跳过率与每单元平均重复数折算
+  （feature_rates），否则会高估调用、费用与耗时
+"""
+import gzip
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+
+from utils.scheduler import iter_schedule
+
+# 没有cassette时每次调用的 (输入, 输出) token 估计
+DEFAULT_TOKENS = {
+    'A': (180.0, 4.0),     # 策略A每轮一次，提示词含各臂统计，只回复一个编号
+    'B': (220.0, 350.0),   # 策略B生成一次策略代码
+}
+# 中英混排文本的平均 字符/token
+CHARS_PER_TOKEN = 1.6
+
+
+def token_profile(cassette_dir, max_lines_per_file: int = 5000) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """
+    从cassette估计每次调用的平均 (输入token, 输出token)
+
+    Returns:
+        {(model, strategy): (prompt_tokens, completion_tokens)}，另含 ('*', strategy) 的全局平均
+    """
+    sums = defaultdict(lambda: [0, 0, 0])  # calls, prompt_chars, completion_chars
+    base = Path(cassette_dir) if cassette_dir else None
+    if base is None or not base.exists():
+        return {}
+    for path in base.glob("*/*.jsonl.gz"):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    if i >= max_lines_per_file:
+                        break
+                    e = json.loads(line)
+                    if "error" in e:
+                        continue
+                    prompt = sum(len(m.get("content") or "") for m in (e.get("request", {}).get("messages") or []))
+                    completion = len(e.get("response") or "")
+                    for key in ((e["model"], e["strategy"]), ("*", e["strategy"])):
+                        s = sums[key]
+                        s[0] += 1
+                        s[1] += prompt
+                        s[2] += completion
+        except (OSError, ValueError, KeyError, EOFError):
+            continue
+    return {
+        key: (p / n / CHARS_PER_TOKEN, c / n / CHARS_PER_TOKEN)
+        for key, (n, p, c) in sums.items() if n
+    }
+
+
+def feature_rates(results_dir, n_repeats: int, n_rounds: int) -> Dict[str, Dict[str, float]]:
+    """
+    从结果JSONL统计门控跳过率与每单元平均重复数
+
+    Returns:
+        {模型名: {'skip_rate': 策略A跳过的调用占比, 'repeats': 每单元平均重复数}}，另含 '*' 的全局值；
+        没有对应记录的项缺省
+    """
+    skipped = defaultdict(lambda: [0, 0])          # model -> [跳过调用数, 轮数]
+    unit_repeats = defaultdict(set)                 # (model, task, group, key) -> 重复编号
+    base = Path(results_dir)
+    if not base.exists():
+        return {}
+    for path in base.glob("*/*.jsonl"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        d = json.loads(line)
+                        model = d['model']
+                        unit_repeats[(model, d['task'], d['group'], d.get('key'))].add(d['repeat'])
+                    except (ValueError, KeyError):
+                        continue
+                    if 'a_skipped' in d:
+                        for key in (model, '*'):
+                            skipped[key][0] += d['a_skipped']
+                            skipped[key][1] += n_rounds
+        except OSError:
+            continue
+
+    repeats = defaultdict(list)
+    for (model, _, _, _), reps in unit_repeats.items():
+        repeats[model].append(len(reps))
+        repeats['*'].append(len(reps))
+    rates = defaultdict(dict)
+    for key, (n_skip, n_total) in skipped.items():
+        if n_total:
+            rates[key]['skip_rate'] = n_skip / n_total
+    for key, counts in repeats.items():
+        rates[key]['repeats'] = sum(counts) / len(counts)
+    return dict(rates)
+
+
+def _rate(rates, model_name: str, name: str, default: float) -> float:
+    for key in (model_name, '*'):
+        value = (rates or {}).get(key, {}).get(name)
+        if value is not None:
+            return value
+    return default
+
+
+def _tokens(profile, model_name: str, strategy: str) -> Tuple[float, float]:
+    return profile.get((model_name, strategy)) or profile.get(("*", strategy)) or DEFAULT_TOKENS[strategy]
+
+
+def plan_run(config: Dict[str, Any], tasks: Iterable[Tuple[str, str]], all_params: Dict[str, List[Dict[str, Any]]],
+             completed: Set[str], make_uid: Callable[[Dict[str, Any], str, int, Dict[str, Any]], str], latency, profile,
+             n_workers: int, retry_rate: float = 0.0, rates: Dict[str, Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    预测剩余工作量
+
+    Args:
+        completed: 已完成单元ID集合
+        make_uid: (模型信息, 任务, 参数组, 参数) -> 带内容键的单元ID，与进度文件一致
+        latency: estimate_trial_seconds 的输出
+        profile: token_profile 的输出
+        retry_rate: 预计因失败而重发的调用比例
+        rates: feature_rates 的输出；门控开启时策略A调用按跳过率折减，
+               序贯早停开启时每单元重复数取观测均值（不超过 max_repeats）
+
+    Returns:
+        {'models': {模型名: 行}, 'total': 行, 'makespan': 秒}
+    """
+    exp_cfg = config['experiment']
+    n_repeats = exp_cfg['n_repeats']
+    n_rounds = exp_cfg['n_rounds']
+    policy_cfg = exp_cfg.get('policy_store', {})
+    reuse_policy = policy_cfg.get('enabled', False) and policy_cfg.get('mode') == 'reuse'
+    models = [m for m in config['models'] if m.get('enabled', True)]
+    tasks = list(tasks)
+    gate_on = exp_cfg.get('strategy_a', {}).get('gate', {}).get('enabled', False)
+    adaptive_cfg = exp_cfg.get('adaptive', {})
+    adaptive_on = adaptive_cfg.get('enabled', False)
+    max_repeats = max(adaptive_cfg.get('max_repeats') or n_repeats, n_repeats)
+
+    def expected(name):
+        """(每单元预计重复数, 策略A实际发出的调用占比)"""
+        repeats = n_repeats
+        if adaptive_on:
+            repeats = min(_rate(rates, name, 'repeats', n_repeats), max_repeats)
+        keep = 1.0 - _rate(rates, name, 'skip_rate', 0.0) if gate_on else 1.0
+        return repeats, keep
+
+    rows = {}
+    arms_seen = defaultdict(set)
+
+    def jobs():
+        for task_id, task_key in tasks:
+            for model_info in models:
+                name = model_info['name']
+                row = rows.setdefault(name, defaultdict(float))
+                repeats, keep = expected(name)
+                for group_idx, params in enumerate(all_params[task_key]):
+                    if make_uid(model_info, task_id, group_idx, params) in completed:
+                        continue
+                    row['units'] += 1
+                    row['trials'] += repeats
+                    row['calls_a'] += repeats * n_rounds * keep
+                    if reuse_policy:
+                        # 复用模式每个 (模型, 臂数) 只生成一次
+                        if params['n_arms'] not in arms_seen[name]:
+                            arms_seen[name].add(params['n_arms'])
+                            row['calls_b'] += 1
+                    else:
+                        row['calls_b'] += repeats
+                    yield {'model_info': model_info, 'task_id': task_id, 'expected_repeats': repeats}
+
+    schedule = {}
+    for _ in iter_schedule(jobs(), latency, n_repeats, n_workers, schedule=schedule):
+        pass
+
+    total = defaultdict(float)
+    for model_info in models:
+        name = model_info['name']
+        row = rows.get(name, defaultdict(float))
+        a_in, a_out = _tokens(profile, name, 'A')
+        b_in, b_out = _tokens(profile, name, 'B')
+        factor = 1 + retry_rate
+        row['calls'] = (row['calls_a'] + row['calls_b']) * factor
+        row['tokens_in'] = (row['calls_a'] * a_in + row['calls_b'] * b_in) * factor
+        row['tokens_out'] = (row['calls_a'] * a_out + row['calls_b'] * b_out) * factor
+        # 价格按每百万token计，未配置则为0
+        row['cost'] = (row['tokens_in'] * model_info.get('price_input', 0.0)
+                       + row['tokens_out'] * model_info.get('price_output', 0.0)) / 1e6
+        row['finish'] = schedule.get('model_finish', {}).get(name, 0.0)
+        rows[name] = row
+        for key in ('units', 'trials', 'calls_a', 'calls_b', 'calls', 'tokens_in', 'tokens_out', 'cost'):
+            total[key] += row[key]
+    total['finish'] = schedule.get('makespan', 0.0)
+    return {'models': rows, 'total': total, 'makespan': total['finish']}
+
+
+def format_plan(plan: Dict[str, Any], n_workers: int, token_source: str) -> str:
+    """把规划结果排成文本表格"""
+    header = (f"{'模型':<24} {'单元':>6} {'trial':>7} {'A调用':>10} {'B调用':>8} "
+              f"{'输入token':>12} {'输出token':>11} {'费用':>9} {'完成(分钟)':>10}")
+    lines = [header, "-" * len(header)]
+
+    def fmt(name, row):
+        return (f"{name:<24} {int(row['units']):>6} {int(row['trials']):>7} {int(row['calls_a']):>10} "
+                f"{int(row['calls_b']):>8} {row['tokens_in']:>12,.0f} {row['tokens_out']:>11,.0f} "
+                f"{row['cost']:>9.2f} {row['finish'] / 60:>10.1f}")
+
+    for name, row in sorted(plan['models'].items(), key=lambda kv: -kv[1]['finish']):
+        lines.append(fmt(name, row))
+    lines.append("-" * len(header))
+    lines.append(fmt("合计", plan['total']))
+    lines.append(f"并发 {n_workers} | 总调用 {plan['total']['calls']:,.0f} | token来源: {token_source}")
+    return "\n".join(lines)
@@ -0,0 +1,185 @@
+"""
+画图流水线的公共部件
+- iter_json_arrays: 流式读取大JSON文件中指定顶层键的数组元素，不整体载入内存
+- CurveStats: 分块合并的均值/标准差曲线聚合器，不堆叠全部曲线
+- file_signature / is_fresh / write_stamp: 按输入文件大小与mtime跳过未变化的图
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, Iterator, Tuple
+
+_DECODER = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+class _JsonStream:
+    """按块读取文件的缓冲区，配合 raw_decode 逐个解析值"""
+
+    def __init__(self, f, chunk_size: int = 1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # 丢弃已消费部分，避免缓冲区无限增长
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白后返回下一个字符，文件结束返回空串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            raise ValueError(f"JSON格式错误: 期望 {ch!r}，实际 {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """解析一个完整的JSON值；值跨块时继续读入"""
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+                # 数字恰好落在缓冲区末尾时可能被截断，需读到后续字符再确认
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+                self.pos = end
+                return obj
+
+
+def iter_json_arrays(path, keys: Iterable[str]) -> Iterator[Tuple[str, object]]:
+    """
+    流式遍历顶层对象中指定键对应数组的元素
+
+    Yields:
+        (key, item)，按文件中的出现顺序；其他键的值被整体解析后丢弃
+    """
+    wanted = set(keys)
+    with open(path, "r", encoding="utf-8") as f:
+        s = _JsonStream(f)
+        s.expect("{")
+        if s.peek() == "}":
+            return
+        while True:
+            key = s.value()
+            s.expect(":")
+            if key in wanted and s.peek() == "[":
+                s.expect("[")
+                if s.peek() == "]":
+                    s.pos += 1
+                else:
+                    while True:
+                        yield key, s.value()
+                        if s.peek() == ",":
+                            s.pos += 1
+                            continue
+                        s.expect("]")
+                        break
+            else:
+                s.value()
+            if s.peek() == ",":
+                s.pos += 1
+                continue
+            s.expect("}")
+            return
+
+
+class CurveStats:
+    """
+    逐条累加曲线，按块合并均值与二阶矩（Chan等的并行方差合并公式）
+    内存占用为 chunk_size 条曲线，与总曲线数无关；std 与 np.std(ddof=0) 一致
+    """
+
+    def __init__(self, chunk_size: int = 256):
+        self.chunk_size = chunk_size
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self._pending = []
+
+    def add(self, curve):
+        self._pending.append(curve)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        import numpy as np
+        if not self._pending:
+            return
+        block = np.asarray(self._pending, dtype=float)
+        self._pending = []
+        nb = block.shape[0]
+        mb = block.mean(axis=0)
+        m2b = ((block - mb) ** 2).sum(axis=0)
+        if self.n == 0:
+            self.n, self.mean, self.m2 = nb, mb, m2b
+            return
+        if mb.shape != self.mean.shape:
+            raise ValueError(f"曲线长度不一致: {mb.shape} vs {self.mean.shape}")
+        n = self.n + nb
+        delta = mb - self.mean
+        self.mean = self.mean + delta * (nb / n)
+        self.m2 = self.m2 + m2b + delta ** 2 * (self.n * nb / n)
+        self.n = n
+
+    def result(self):
+        """返回 (mean, std)；没有数据时返回 (None, None)"""
+        import numpy as np
+        self._flush()
+        if self.n == 0:
+            return None, None
+        return self.mean, np.sqrt(self.m2 / self.n)
+
+
+def file_signature(path) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def source_digest(*paths) -> str:
+    """画图代码本身的摘要：改了画图逻辑也要重画"""
+    h = hashlib.sha256()
+    for p in paths:
+        with open(p, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def is_fresh(stamp_path, output_path, signature: Dict) -> bool:
+    """输出存在且记录的输入签名与当前一致"""
+    if not os.path.exists(output_path) or not os.path.exists(stamp_path):
+        return False
+    try:
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            return json.load(f) == signature
+    except (OSError, ValueError):
+        return False
+
+
+def write_stamp(stamp_path, signature: Dict):
+    tmp = f"{stamp_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(signature, f, sort_keys=True)
+    os.replace(tmp, stamp_path)
@@ -0,0 +1,204 @@
+"""
+结果查询层：把 results/**/*.jsonl 增量导入本地SQLite，供即席分析
+
+每个JSONL文件记录已导入的字节偏移、大小与mtime；再次导入时只读取新追加的完整行，
+文件变小或被改写时删除该文件的旧记录后整体重导。只依赖标准库。
+"""
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id          INTEGER PRIMARY KEY,
+    source      TEXT NOT NULL,
+    model       TEXT NOT NULL,
+    task        TEXT NOT NULL,
+    grp         INTEGER,
+    rep         INTEGER,
+    n_arms      INTEGER,
+    mean_low    REAL,
+    mean_high   REAL,
+    sigma       REAL,
+    a_reward    REAL,
+    b_reward    REAL,
+    improvement REAL,
+    a_regret    REAL,
+    b_regret    REAL,
+    timestamp   TEXT,
+    params      TEXT,
+    key         TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_unit ON records (model, task, grp);
+CREATE INDEX IF NOT EXISTS idx_records_task ON records (task, model);
+CREATE INDEX IF NOT EXISTS idx_records_params ON records (n_arms, sigma);
+CREATE INDEX IF NOT EXISTS idx_records_source ON records (source);
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    offset   INTEGER NOT NULL
+);
+"""
+
+# 可用于 --by 分组的列
+GROUP_COLUMNS = ('model', 'task', 'grp', 'rep', 'n_arms', 'mean_low', 'mean_high', 'sigma', 'key')
+
+_INSERT = """
+INSERT INTO records (source, model, task, grp, rep, n_arms, mean_low, mean_high, sigma,
+                     a_reward, b_reward, improvement, a_regret, b_regret, timestamp, params, key)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _row(source: str, data: Dict[str, Any]) -> Tuple:
+    params = data.get('params', {})
+    return (
+        source, data['model'], data['task'], data.get('group'), data.get('repeat'),
+        params.get('n_arms'), params.get('mean_low'), params.get('mean_high'), params.get('sigma'),
+        data['a_reward'], data['b_reward'], data.get('improvement'),
+        data.get('a_regret'), data.get('b_regret'), data.get('timestamp'),
+        json.dumps(params, ensure_ascii=False), data.get('key'),
+    )
+
+
+class ResultsDB:
+    """results.db 的读写封装"""
+
+    def __init__(self, path, readonly: bool = False):
+        self.path = Path(path)
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+            # 早期库没有 key 列（单元内容键，旧记录为NULL）
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(records)")}
+            if 'key' not in columns:
+                self.conn.execute("ALTER TABLE records ADD COLUMN key TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_records_key ON records (key)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def ingest_file(self, path, source: str) -> int:
+        """导入单个JSONL文件的新增行，返回新增记录数"""
+        st = os.stat(path)
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, offset FROM files WHERE path = ?", (source,)
+        ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return 0
+        offset = row[2] if row else 0
+        with self.conn:
+            if row and st.st_size <= row[0]:
+                # 没有变大却变了：被截断或改写，整体重导
+                self.conn.execute("DELETE FROM records WHERE source = ?", (source,))
+                offset = 0
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # 写入中的半行留到下次
+            end = data.rfind(b'\n') + 1
+            rows = []
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(_row(source, json.loads(line)))
+                except (ValueError, KeyError):
+                    continue
+            self.conn.executemany(_INSERT, rows)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, offset) VALUES (?, ?, ?, ?)",
+                (source, st.st_size, st.st_mtime_ns, offset + end)
+            )
+        return len(rows)
+
+    def ingest(self, results_dir) -> Tuple[int, int]:
+        """
+        增量导入结果目录下全部JSONL
+
+        Returns:
+            (新增记录数, 有变化的文件数)
+        """
+        results_dir = Path(results_dir)
+        added, changed = 0, 0
+        seen = set()
+        for path in sorted(results_dir.rglob('*.jsonl')):
+            source = str(path.relative_to(results_dir))
+            seen.add(source)
+            n = self.ingest_file(path, source)
+            added += n
+            changed += n > 0
+        # 已删除的文件连同记录一起移除
+        stale = [p for (p,) in self.conn.execute("SELECT path FROM files") if p not in seen]
+        with self.conn:
+            for source in stale:
+                self.conn.execute("DELETE FROM records WHERE source = ?", (source,))
+                self.conn.execute("DELETE FROM files WHERE path = ?", (source,))
+        return added, changed
+
+    def sql(self, query: str, params: Sequence = ()) -> Tuple[List[str], List[Tuple]]:
+        """执行任意SQL，返回 (列名, 行)"""
+        cur = self.conn.execute(query, params)
+        columns = [d[0] for d in cur.description] if cur.description else []
+        return columns, cur.fetchall()
+
+    def summary(self, where: Optional[str] = None, by: Iterable[str] = ('model',),
+                params: Sequence = ()) -> Tuple[List[str], List[Tuple]]:
+        """
+        按列分组汇总A/B奖励
+
+        Args:
+            where: SQL条件片段，如 "n_arms >= 8 AND sigma > 1.5"
+            by: 分组列，取自 GROUP_COLUMNS
+
+        提升按均值之比计算，与 final_summary.md 一致
+        """
+        by = list(by)
+        for col in by:
+            if col not in GROUP_COLUMNS:
+                raise ValueError(f"不支持的分组列: {col}（可选: {', '.join(GROUP_COLUMNS)}）")
+        keys = ", ".join(by)
+        query = (
+            f"SELECT {keys + ', ' if keys else ''}COUNT(*) AS n, "
+            "AVG(a_reward) AS a_mean, AVG(b_reward) AS b_mean, "
+            "(AVG(b_reward) - AVG(a_reward)) / MAX(ABS(AVG(a_reward)), 1e-9) * 100 AS improvement, "
+            "AVG(a_regret) AS a_regret, AVG(b_regret) AS b_regret "
+            "FROM records"
+        )
+        if where:
+            query += f" WHERE {where}"
+        if keys:
+            query += f" GROUP BY {keys} ORDER BY {keys}"
+        return self.sql(query, params)
+
+
+def format_table(columns: List[str], rows: List[Tuple]) -> str:
+    """把查询结果排成等宽文本表格"""
+    def fmt(v):
+        if v is None:
+            return "-"
+        if isinstance(v, float):
+            return f"{v:.2f}"
+        return str(v)
+
+    cells = [[fmt(v) for v in row] for row in rows]
+    widths = [max([len(c)] + [len(r[i]) for r in cells]) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    for r in cells:
+        lines.append("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+    return "\n".join(lines)
@@ -0,0 +1,32 @@
+"""
+按实验单元派生的独立随机数流
+每个 (模型, 任务, 参数组, 重复, 策略) 由根种子的 SeedSequence 按固定 spawn_key 派生出自己的生成器，
+与线程调度、执行顺序、分片方式无关：重排、分片或并行后结果逐位一致，可与基准运行对比验证
+
+spawn_key 中的字符串按 sha256 映射为整数，不使用 Python 内置 hash（每个进程加盐不同）
+"""
+import hashlib
+from typing import Union
+
+import numpy as np
+
+
+def _key(part: Union[str, int]) -> int:
+    if isinstance(part, (int, np.integer)):
+        return int(part)
+    return int.from_bytes(hashlib.sha256(str(part).encode("utf-8")).digest()[:4], "little")
+
+
+def unit_seed_sequence(root_seed: int, model_name: str, task_id: str, group_idx: int, repeat: int,
+                       strategy: str) -> np.random.SeedSequence:
+    """单元的 SeedSequence；同一组参数总是得到同一个序列"""
+    return np.random.SeedSequence(
+        entropy=root_seed,
+        spawn_key=tuple(_key(p) for p in (model_name, task_id, group_idx, repeat, strategy))
+    )
+
+
+def unit_rng(root_seed: int, model_name: str, task_id: str, group_idx: int, repeat: int,
+             strategy: str) -> np.random.Generator:
+    """单元专属的随机数生成器"""
+    return np.random.default_rng(unit_seed_sequence(root_seed, model_name, task_id, group_idx, repeat, strategy))
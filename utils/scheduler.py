@@ -0,0 +1,117 @@
+"""
+基于历史耗时的作业调度器
+从已有JSONL时间戳估计每个模型单次trial耗时，按最长处理时间优先（LPT）
+并兼顾模型间公平性排序作业，同时预测整体及各模型的完成时间
+"""
+import heapq
+import itertools
+import json
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+# 没有任何历史数据时的单次trial耗时估计（秒）
+DEFAULT_TRIAL_SECONDS = 300.0
+
+
+def estimate_trial_seconds(results_dir) -> Dict[Tuple[str, str], float]:
+    """
+    从结果JSONL估计单次trial耗时
+
+    同一 (模型, 任务, 参数组) 的重复是串行执行的，相邻重复的时间戳差即一次trial耗时
+
+    Returns:
+        {(model, task): 中位耗时秒数}，另含 (model, '*') 的模型级汇总
+    """
+    samples = defaultdict(list)
+    for jsonl_file in Path(results_dir).glob("*/*.jsonl"):
+        stamps = defaultdict(list)
+        with open(jsonl_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                    stamps[(data['model'], data['task'], data['group'])].append(
+                        (data['repeat'], datetime.fromisoformat(data['timestamp']))
+                    )
+                except (ValueError, KeyError):
+                    continue
+        for (model, task, _), seq in stamps.items():
+            seq.sort()
+            for (r0, t0), (r1, t1) in zip(seq, seq[1:]):
+                dt = (t1 - t0).total_seconds()
+                # 只取相邻重复，跨越断点续传的间隔不计
+                if r1 == r0 + 1 and dt > 0:
+                    samples[(model, task)].append(dt)
+                    samples[(model, '*')].append(dt)
+    return {key: float(np.median(vals)) for key, vals in samples.items()}
+
+
+def predict_job_seconds(latency: Dict[Tuple[str, str], float], model_name: str, task_id: str, n_repeats: int) -> float:
+    """预测一个参数组作业（n_repeats 次trial）的耗时"""
+    per_trial = latency.get((model_name, task_id))
+    if per_trial is None:
+        per_trial = latency.get((model_name, '*'))
+    if per_trial is None:
+        model_level = [v for (m, t), v in latency.items() if t == '*']
+        per_trial = float(np.median(model_level)) if model_level else DEFAULT_TRIAL_SECONDS
+    return per_trial * n_repeats
+
+
+def iter_schedule(jobs: Iterable[Dict[str, Any]], latency, n_repeats: int, n_workers: int,
+                  lookahead: int = 2000, schedule: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    流式 LPT + 模型公平排序
+
+    每次从剩余预测总负载最大的模型中取出其最长作业，使慢模型尽早开工、各模型交替派发，
+    避免慢模型作业堆积在队尾拖长整体完成时间。排序只在缓冲窗口内进行，内存与总作业数无关：
+    窗口从 n_workers 起步，每派发一个作业扩大一格直到 lookahead，读入 n_workers+1 个作业即派发首个，
+    不必先缓冲整个前瞻窗口；窗口覆盖全部作业时与一次性排序结果一致
+
+    Args:
+        schedule: 传入的字典随派发就地更新 makespan / model_finish 预测（按派发顺序模拟线程池），
+                  同一字典可跨多次调用累积
+    """
+    if schedule is None:
+        schedule = {}
+    schedule.setdefault('makespan', 0.0)
+    schedule.setdefault('model_finish', {})
+    workers = [0.0] * max(1, n_workers)
+    queues = {}  # model -> 堆 (-预测耗时, -入队序号, job)，同耗时取后入队的，与稳定排序后pop一致
+    remaining = {}
+    seq = itertools.count()
+    buffered = 0
+    window = min(max(1, n_workers), lookahead)
+
+    def emit():
+        model_name = max(queues, key=lambda m: remaining[m])
+        _, _, job = heapq.heappop(queues[model_name])
+        remaining[model_name] -= job['predicted_seconds']
+        if not queues[model_name]:
+            del queues[model_name]
+            del remaining[model_name]
+        start = heapq.heappop(workers)
+        end = start + job['predicted_seconds']
+        heapq.heappush(workers, end)
+        finish = schedule['model_finish']
+        finish[model_name] = max(finish.get(model_name, 0.0), end)
+        schedule['makespan'] = max(schedule['makespan'], end)
+        return job
+
+    for job in jobs:
+        model_name = job['model_info']['name']
+        # 规划时可按观测到的早停/追加重复给出每个作业的预计重复数
+        job['predicted_seconds'] = predict_job_seconds(latency, model_name, job['task_id'],
+                                                       job.get('expected_repeats', n_repeats))
+        heapq.heappush(queues.setdefault(model_name, []), (-job['predicted_seconds'], -next(seq), job))
+        remaining[model_name] = remaining.get(model_name, 0.0) + job['predicted_seconds']
+        buffered += 1
+        if buffered > window:
+            buffered -= 1
+            window = min(window + 1, lookahead)
+            yield emit()
+    while queues:
+        yield emit()
+
@@ -0,0 +1,119 @@
+"""
+重复实验的序贯早停与重复次数再分配
+基于配对差值（b_reward - a_reward）的95%置信区间宽度判断A/B差异是否已估计得足够精确；
+已解决单元提前停止省下的重复存入 RepeatBudget，再分给跑满 n_repeats 仍未解决的单元
+"""
+import math
+import threading
+from typing import Any, Dict, List
+
+# t分布0.975分位数，自由度1-30；更大自由度使用正态近似
+_T975 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def t975(df: int) -> float:
+    """t分布0.975分位数"""
+    if df < 1:
+        return float("inf")
+    return _T975[df - 1] if df <= len(_T975) else 1.96
+
+
+def paired_ci(diffs: List[float]):
+    """
+    配对差值的均值与95%置信区间半宽
+
+    Returns:
+        (mean, half_width)；样本不足2个时半宽为inf
+    """
+    n = len(diffs)
+    if n == 0:
+        return 0.0, float("inf")
+    mean = sum(diffs) / n
+    if n < 2:
+        return mean, float("inf")
+    var = sum((d - mean) ** 2 for d in diffs) / (n - 1)
+    return mean, t975(n - 1) * math.sqrt(var / n)
+
+
+def is_resolved(diffs: List[float], adaptive_cfg: Dict[str, Any]) -> bool:
+    """
+    单元是否已可停止
+
+    至少 min_repeats（不少于2）次后，置信区间半宽不超过 max(rel_precision × |均值|, abs_precision) 即视为已解决。
+    abs_precision 默认0：差异接近0的单元不会被判定解决，会一直跑到重复上限；
+    差值完全相同（方差为0）时半宽为0，即使均值为0也视为已解决
+    """
+    if len(diffs) < max(adaptive_cfg.get('min_repeats', 3), 2):
+        return False
+    mean, half_width = paired_ci(diffs)
+    tolerance = max(adaptive_cfg.get('rel_precision', 0.5) * abs(mean), adaptive_cfg.get('abs_precision', 0.0))
+    return half_width <= tolerance
+
+
+def uncertainty(diffs: List[float]) -> float:
+    """相对不确定性：置信区间半宽 / |均值|，越大越需要追加重复"""
+    mean, half_width = paired_ci(diffs)
+    if half_width == 0:
+        return 0.0
+    return half_width / abs(mean) if mean else float("inf")
+
+
+class RepeatBudget:
+    """
+    早停省下的重复次数池（本次运行内有效，线程安全）
+
+    已解决单元提前停止时存入未跑的重复；跑满 n_repeats 仍未解决的单元登记等待，
+    池中有余额时按相对不确定性从大到小分配追加重复，每个单元总重复数不超过 max_repeats。
+    追加的重复只来自池中余额，全网格的重复总数不超过不开启自适应时的 单元数 × n_repeats
+    """
+
+    def __init__(self, max_repeats: int):
+        self.max_repeats = max_repeats
+        self.available = 0
+        self.granted = 0
+        self._waiting: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def credit(self, n: int):
+        """存入未跑的重复"""
+        if n > 0:
+            with self._lock:
+                self.available += n
+
+    def wait(self, job: Dict[str, Any], diffs: List[float], next_repeat: int):
+        """登记一个未解决的单元；已达 max_repeats 的不登记"""
+        if len(diffs) >= self.max_repeats:
+            return
+        with self._lock:
+            self._waiting[job['uid']] = {'job': job, 'diffs': list(diffs), 'next': next_repeat}
+
+    def grant(self) -> List[Dict[str, Any]]:
+        """
+        按余额分配追加重复
+
+        Returns:
+            追加作业列表：原作业加上 repeats（追加的重复编号）与 extend（已有配对差值）
+        """
+        jobs = []
+        with self._lock:
+            if not self.available or not self._waiting:
+                return jobs
+            order = sorted(self._waiting, key=lambda uid: -uncertainty(self._waiting[uid]['diffs']))
+            for uid in order:
+                if not self.available:
+                    break
+                entry = self._waiting.pop(uid)
+                n = min(self.available, self.max_repeats - len(entry['diffs']))
+                self.available -= n
+                self.granted += n
+                jobs.append(dict(entry['job'], repeats=list(range(entry['next'], entry['next'] + n)),
+                                 extend=entry['diffs']))
+        return jobs
+
+    def waiting(self) -> int:
+        with self._lock:
+            return len(self._waiting)
@@ -1,22 +1,15 @@
 # shared.py
 import numpy as np
-from openai import OpenAI
 from typing import List, Dict, Any
-import os
-import sys
 
-# 添加当前目录到路径以支持相对导入
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-if parent_dir not in sys.path:
-    sys.path.insert(0, parent_dir)
+from utils.bandit_env import BanditEnv, BanditConfig
 
-try:
-    from utils.bandit_env import BanditEnv, BanditConfig
-except ImportError:
-    from bandit_env import BanditEnv, BanditConfig
+# 臂数超过该值即进入大K模式：提示词改用有界摘要，策略B提示词引导使用数组统计
+FULL_STATS_MAX_ARMS = 20
 
 def get_client_and_model(base_url="http://localhost:8000/v1", api_key="EMPTY", model_override=None):
+    # openai 较重，只在真正需要客户端时导入
+    from openai import OpenAI
     client = OpenAI(api_key=api_key, base_url=base_url)
     if model_override:
         return client, model_override
@@ -69,10 +62,22 @@ def make_trials(n_trials=10, n_arms=3, n_rounds=120, mean_low=2.0, mean_high=9.0
         })
     return trials
 
-def calc_curves(actions, rewards, best_mean):
+def calc_curves(actions, rewards, best_mean, oracle=None):
+    """
+    计算累积奖励与累积遗憾
+    
+    Args:
+        actions: 每轮动作
+        rewards: 每轮奖励
+        best_mean: 静态最优期望（无oracle时使用）
+        oracle: 逐轮oracle（可用臂中的最大期望），给出时按动态遗憾计算
+    """
     rewards = np.array(rewards, dtype=float)
     cum_reward = np.cumsum(rewards)
-    regret = best_mean - rewards
+    if oracle is not None:
+        regret = np.asarray(oracle, dtype=float)[:len(rewards)] - rewards
+    else:
+        regret = best_mean - rewards
     cum_regret = np.cumsum(regret)
     return {
         "actions": [int(x) for x in actions],
@@ -80,3 +85,46 @@ def calc_curves(actions, rewards, best_mean):
         "cum_reward": cum_reward.tolist(),
         "cum_regret": cum_regret.tolist()
     }
+
+def calc_curves_batch(rewards, oracle):
+    """
+    批量计算累积奖励与累积遗憾，适用于成千上万个trial；逐trial结果与 calc_curves 一致
+
+    Args:
+        rewards: shape=(n_trials, n_rounds) 的奖励矩阵
+        oracle: shape=(n_trials, n_rounds) 的逐轮oracle，或 shape=(n_trials,) 的静态best_mean（也可为标量）
+
+    Returns:
+        字典，cum_reward/cum_regret 均为 shape=(n_trials, n_rounds) 的数组
+    """
+    rewards = np.asarray(rewards, dtype=float)
+    oracle = np.asarray(oracle, dtype=float)
+    if oracle.ndim < 2:
+        oracle = np.broadcast_to(oracle.reshape(-1, 1), (rewards.shape[0], 1))
+    return {
+        "cum_reward": np.cumsum(rewards, axis=1),
+        "cum_regret": np.cumsum(oracle[:, :rewards.shape[1]] - rewards, axis=1)
+    }
+
+def trial_best_mean(trial):
+    """trial的静态最优期望：优先取 means 的最大值，其次 trial 自带的 best_mean，最后用奖励表逐轮最大值的均值"""
+    means = np.array(trial.get("means", [0] * trial.get("n_arms", 3)), dtype=float)
+    if means.size > 0 and np.max(means) > 0:
+        return float(np.max(means))
+    return float(trial.get("best_mean", np.asarray(trial["rewards"], dtype=float).max(axis=1).mean()))
+
+def trial_oracle(trial, n_rounds):
+    """calc_curves_batch 用的oracle：有逐轮oracle时取前 n_rounds 轮，否则为静态best_mean"""
+    if trial.get("oracle") is not None:
+        return np.asarray(trial["oracle"], dtype=float)[:n_rounds]
+    return np.full(n_rounds, trial_best_mean(trial))
+
+def availability_table(trial):
+    """
+    休眠任务的逐轮可用掩码 [T, K]（bool）；非休眠任务返回None
+    两种策略都只能拉动当轮可用的臂，与只在可用臂中取最大值的oracle口径一致
+    """
+    availability = trial.get("availability")
+    if availability is None:
+        return None
+    return np.asarray(availability, dtype=bool)
@@ -0,0 +1,234 @@
+"""
+A/B报告的统计引擎
+所有 模型×任务 单元一次打包成填充数组，bootstrap、Wilcoxon符号秩检验、符号翻转置换检验
+都在整个单元维度上向量化计算（resample数 × 单元数 一次数组运算，按块控制内存）
+
+配对差值定义为 b_reward - a_reward；相对提升采用均值之比 (mean_b - mean_a) / mean_a，
+不对逐条 improvement 取平均，避免 a_reward 接近0时被个别记录放大
+"""
+import math
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def pack_cells(cells: Sequence[Sequence[Tuple[int, float, float]]]) -> Dict[str, np.ndarray]:
+    """
+    把各单元的 (group, a_reward, b_reward) 记录打包成填充数组
+
+    Returns:
+        a, b: [C, G, R]，G/R为各单元参数组数/组内重复数的最大值，空位填0
+        n_rep: [C, G] 每组有效重复数（空组为0）
+        n_grp: [C] 每个单元的参数组数
+    """
+    grouped = []
+    for records in cells:
+        by_group = {}
+        for group, a, b in records:
+            by_group.setdefault(group, []).append((a, b))
+        grouped.append(list(by_group.values()))
+
+    C = len(grouped)
+    G = max((len(g) for g in grouped), default=0) or 1
+    R = max((len(r) for g in grouped for r in g), default=0) or 1
+    a = np.zeros((C, G, R))
+    b = np.zeros((C, G, R))
+    n_rep = np.zeros((C, G), dtype=np.int64)
+    n_grp = np.zeros(C, dtype=np.int64)
+    for c, groups in enumerate(grouped):
+        n_grp[c] = len(groups)
+        for g, pairs in enumerate(groups):
+            n_rep[c, g] = len(pairs)
+            a[c, g, :len(pairs)] = [p[0] for p in pairs]
+            b[c, g, :len(pairs)] = [p[1] for p in pairs]
+    return {'a': a, 'b': b, 'n_rep': n_rep, 'n_grp': n_grp}
+
+
+def _flat(packed):
+    """[C, G*R] 的配对差值与有效掩码"""
+    C = packed['a'].shape[0]
+    d = (packed['b'] - packed['a']).reshape(C, -1)
+    R = packed['a'].shape[2]
+    mask = (np.arange(R) < packed['n_rep'][:, :, None]).reshape(C, -1)
+    return d, mask
+
+
+def bootstrap_ci(packed, n_resamples: int = 10000, level: float = 0.95, unit: str = 'group',
+                 seed: int = 0, chunk: int = 1000) -> Dict[str, np.ndarray]:
+    """
+    配对bootstrap置信区间
+
+    Args:
+        unit: 'group' 两阶段重采样（先有放回抽参数组，再在组内有放回抽重复）；
+              'repeat' 把单元内全部记录视为独立样本直接重采样
+        chunk: 每次数组运算处理的resample数
+
+    Returns:
+        diff_lo/diff_hi: 平均配对差值的CI，rel_lo/rel_hi: 相对提升(%)的CI，均为 [C]
+    """
+    rng = np.random.default_rng(seed)
+    a, b = packed['a'], packed['b']
+    n_rep, n_grp = packed['n_rep'], packed['n_grp']
+    C, G, R = a.shape
+    if unit == 'repeat':
+        # 展平成一个“组”，组内重复数为单元总记录数
+        _, mask = _flat(packed)
+        order = np.argsort(~mask, axis=1, kind='stable')
+        a = np.take_along_axis(a.reshape(C, -1), order, axis=1)[:, None, :]
+        b = np.take_along_axis(b.reshape(C, -1), order, axis=1)[:, None, :]
+        n_rep = mask.sum(axis=1)[:, None]
+        n_grp = np.ones(C, dtype=np.int64)
+        G, R = 1, a.shape[2]
+    elif unit != 'group':
+        raise ValueError(f"未知的重采样单位: {unit}")
+
+    cidx = np.arange(C)[None, :, None]
+    gmask = np.arange(G)[None, :] < n_grp[:, None]  # [C, G]
+    diffs, rels = [], []
+    for start in range(0, n_resamples, chunk):
+        B = min(chunk, n_resamples - start)
+        gi = (rng.random((B, C, G)) * n_grp[None, :, None]).astype(np.int64)
+        nr = n_rep[cidx, gi]  # [B, C, G]
+        ri = (rng.random((B, C, G, R)) * nr[..., None]).astype(np.int64)
+        w = (np.arange(R) < nr[..., None]) & gmask[None, :, :, None]
+        av = a[cidx[..., None], gi[..., None], ri]
+        bv = b[cidx[..., None], gi[..., None], ri]
+        sum_a = (av * w).sum(axis=(2, 3))
+        sum_b = (bv * w).sum(axis=(2, 3))
+        cnt = np.maximum(w.sum(axis=(2, 3)), 1)
+        diffs.append((sum_b - sum_a) / cnt)
+        rels.append((sum_b - sum_a) / np.maximum(np.abs(sum_a), 1e-9) * 100)
+
+    alpha = (1 - level) / 2 * 100
+    diffs = np.concatenate(diffs)
+    rels = np.concatenate(rels)
+    diff_lo, diff_hi = np.percentile(diffs, [alpha, 100 - alpha], axis=0)
+    rel_lo, rel_hi = np.percentile(rels, [alpha, 100 - alpha], axis=0)
+    return {'diff_lo': diff_lo, 'diff_hi': diff_hi, 'rel_lo': rel_lo, 'rel_hi': rel_hi}
+
+
+_EXACT_MAX_N = 50
+_signed_rank_cdf = {}
+
+
+def _signed_rank_null(n: int) -> np.ndarray:
+    """无结时 W+ 的精确零分布累积概率（按n缓存）"""
+    if n not in _signed_rank_cdf:
+        counts = np.zeros(n * (n + 1) // 2 + 1)
+        counts[0] = 1
+        for k in range(1, n + 1):
+            counts[k:] = counts[k:] + counts[:-k]
+        _signed_rank_cdf[n] = np.cumsum(counts) / 2 ** n
+    return _signed_rank_cdf[n]
+
+
+def wilcoxon(packed) -> Dict[str, np.ndarray]:
+    """
+    双侧Wilcoxon符号秩检验（剔除零差值）
+
+    秩在所有单元上一次排序计算（结取平均秩）；无结且 n<=50 用精确分布，
+    否则用带结校正的正态近似
+
+    Returns:
+        statistic: W+，p: 双侧p值，n: 非零差值个数，均为 [C]
+    """
+    d, mask = _flat(packed)
+    valid = mask & (d != 0)
+    absd = np.where(valid, np.abs(d), np.inf)
+    order = np.argsort(absd, axis=1, kind='stable')
+    s = np.take_along_axis(absd, order, axis=1)
+    pos_sorted = np.take_along_axis(d > 0, order, axis=1)
+    valid_sorted = np.take_along_axis(valid, order, axis=1)
+
+    # 结的首末位置：值变化处开始新的一段
+    L = s.shape[1]
+    idx = np.broadcast_to(np.arange(L), s.shape)
+    new_run = np.ones_like(s, dtype=bool)
+    new_run[:, 1:] = s[:, 1:] != s[:, :-1]
+    end_run = np.ones_like(s, dtype=bool)
+    end_run[:, :-1] = s[:, :-1] != s[:, 1:]
+    first = np.maximum.accumulate(np.where(new_run, idx, 0), axis=1)
+    last = np.minimum.accumulate(np.where(end_run, idx, L)[:, ::-1], axis=1)[:, ::-1]
+    ranks = (first + last) / 2 + 1
+    t = last - first + 1
+
+    n = valid.sum(axis=1)
+    w_plus = (ranks * (pos_sorted & valid_sorted)).sum(axis=1)
+    tie_term = ((t ** 2 - 1) * valid_sorted).sum(axis=1)
+
+    mean = n * (n + 1) / 4
+    var = n * (n + 1) * (2 * n + 1) / 24 - tie_term / 48
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(var > 0, (w_plus - mean) / np.sqrt(var), 0.0)
+    p = np.array([math.erfc(abs(v) / math.sqrt(2)) for v in z])
+
+    exact = (tie_term == 0) & (n > 0) & (n <= _EXACT_MAX_N)
+    for c in np.nonzero(exact)[0]:
+        cdf = _signed_rank_null(int(n[c]))
+        w = int(round(w_plus[c]))
+        lower = cdf[w]
+        upper = 1 - (cdf[w - 1] if w > 0 else 0.0)
+        p[c] = min(1.0, 2 * min(lower, upper))
+    p[n == 0] = 1.0
+    return {'statistic': w_plus, 'p': p, 'n': n}
+
+
+def permutation_test(packed, n_permutations: int = 10000, seed: int = 0,
+                     chunk: int = 1000) -> np.ndarray:
+    """
+    符号翻转置换检验：H0 下配对差值关于0对称，统计量为平均差值
+
+    Returns:
+        双侧p值 [C]，(1 + 极端次数) / (1 + 置换次数)
+    """
+    rng = np.random.default_rng(seed)
+    d, mask = _flat(packed)
+    d = np.where(mask, d, 0.0)
+    n = np.maximum(mask.sum(axis=1), 1)
+    observed = np.abs(d.sum(axis=1) / n)
+    # 浮点误差容限，避免与观测值相等的置换被误判为不极端
+    tol = 1e-12 * np.maximum(np.abs(d).sum(axis=1) / n, 1.0)
+    extreme = np.zeros(d.shape[0], dtype=np.int64)
+    for start in range(0, n_permutations, chunk):
+        P = min(chunk, n_permutations - start)
+        signs = rng.integers(0, 2, size=(P,) + d.shape, dtype=np.int8) * 2 - 1
+        stat = np.abs((signs * d).sum(axis=2) / n)
+        extreme += (stat >= observed - tol).sum(axis=0)
+    return (1 + extreme) / (1 + n_permutations)
+
+
+def summarize_cells(cells: Sequence[Sequence[Tuple[int, float, float]]], n_resamples: int = 10000,
+                    unit: str = 'group', seed: int = 0) -> List[Dict[str, float]]:
+    """
+    报告用的一站式汇总
+
+    Args:
+        cells: 每个单元的 (group, a_reward, b_reward) 记录列表，不能为空
+
+    Returns:
+        每个单元一个字典：diff、diff_lo/diff_hi、rel、rel_lo/rel_hi、p_wilcoxon、p_perm
+    """
+    if not cells:
+        return []
+    packed = pack_cells(cells)
+    ci = bootstrap_ci(packed, n_resamples=n_resamples, unit=unit, seed=seed)
+    wil = wilcoxon(packed)
+    perm = permutation_test(packed, n_permutations=n_resamples, seed=seed + 1)
+
+    d, mask = _flat(packed)
+    n = np.maximum(mask.sum(axis=1), 1)
+    sum_a = np.where(mask, packed['a'].reshape(d.shape), 0).sum(axis=1)
+    sum_b = np.where(mask, packed['b'].reshape(d.shape), 0).sum(axis=1)
+    out = []
+    for c in range(len(cells)):
+        out.append({
+            'diff': float((sum_b[c] - sum_a[c]) / n[c]),
+            'diff_lo': float(ci['diff_lo'][c]),
+            'diff_hi': float(ci['diff_hi'][c]),
+            'rel': float((sum_b[c] - sum_a[c]) / max(abs(sum_a[c]), 1e-9) * 100),
+            'rel_lo': float(ci['rel_lo'][c]),
+            'rel_hi': float(ci['rel_hi'][c]),
+            'p_wilcoxon': float(wil['p'][c]),
+            'p_perm': float(perm[c]),
+        })
+    return out
@@ -0,0 +1,152 @@
+"""
+预生成的内存映射trial库
+把所有 (task, group, repeat) 的奖励表、期望值、oracle、可用掩码一次性写入单个二进制文件，
+各模型、各工作线程/进程通过 np.memmap 共享同一份页缓存零拷贝读取，不再各自重复生成
+
+文件布局: [8字节对齐的数组区][索引JSON][索引偏移 uint64][魔数 8字节]
+指纹包含文件格式版本与trial生成代码的摘要，改了生成逻辑后旧文件自动失效
+"""
+import hashlib
+import json
+import os
+import struct
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from utils import param_generator
+from utils.param_generator import create_trial_from_params
+
+MAGIC = b"BANDITTS"
+# 文件布局或存储字段变化时递增
+FORMAT_VERSION = 2
+_FOOTER = struct.Struct("<Q8s")
+
+# 以数组形式存储的trial字段
+ARRAY_FIELDS = {
+    'rewards': np.float64,
+    'means': np.float64,
+    'oracle': np.float64,
+    'availability': np.bool_,
+}
+
+
+def trial_key(task_id: str, group_idx: int, r_idx: int) -> str:
+    return f"{task_id}|{group_idx}|{r_idx}"
+
+
+@lru_cache(maxsize=None)
+def _generator_digest() -> str:
+    """trial生成代码（utils/param_generator.py）的摘要"""
+    with open(param_generator.__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def fingerprint(all_params: Dict[str, List[Dict[str, Any]]], tasks, n_repeats: int, n_rounds: int) -> str:
+    """参数、任务、重复次数、轮数、文件格式与生成代码共同决定trial内容；任何一项变化都需要重新生成"""
+    payload = json.dumps({
+        'format': FORMAT_VERSION,
+        'generator': _generator_digest(),
+        'params': all_params,
+        'tasks': [list(t) for t in tasks],
+        'n_repeats': n_repeats,
+        'n_rounds': n_rounds,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def materialise(path, all_params, tasks, n_repeats: int, n_rounds: int) -> Path:
+    """
+    生成全部trial并写入 path（先写临时文件再原子替换）
+
+    Args:
+        all_params: ParamGenerator.generate_all_params 的输出
+        tasks: [(task_id, task_key), ...]
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    index = {
+        'fingerprint': fingerprint(all_params, tasks, n_repeats, n_rounds),
+        'n_rounds': n_rounds,
+        'trials': {},
+    }
+    offset = 0
+    with open(tmp, 'wb') as f:
+        for task_id, task_key in tasks:
+            for group_idx, params in enumerate(all_params[task_key]):
+                for r_idx in range(n_repeats):
+                    trial_params = params.copy()
+                    trial_params['seed'] = params['seed'] + r_idx
+                    trial = create_trial_from_params(trial_params, n_rounds)
+                    arrays, meta = {}, {}
+                    for name, value in trial.items():
+                        if name in ARRAY_FIELDS:
+                            arr = np.ascontiguousarray(value, dtype=ARRAY_FIELDS[name])
+                            pad = (-offset) % 8
+                            f.write(b"\0" * pad)
+                            offset += pad
+                            arrays[name] = [offset, list(arr.shape)]
+                            f.write(arr.tobytes())
+                            offset += arr.nbytes
+                        elif name != 'contexts':
+                            # contexts 可由 n_contexts 还原，不写入索引
+                            meta[name] = value
+                    index['trials'][trial_key(task_id, group_idx, r_idx)] = {'arrays': arrays, 'meta': meta}
+        index_bytes = json.dumps(index, ensure_ascii=False).encode('utf-8')
+        f.write(index_bytes)
+        f.write(_FOOTER.pack(offset, MAGIC))
+    os.replace(tmp, path)
+    return path
+
+
+class TrialStore:
+    """只读trial库；get 返回的数组是共享映射上的只读视图"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            index_offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"不是trial库文件: {self.path}")
+            end = f.seek(0, os.SEEK_END) - _FOOTER.size
+            f.seek(index_offset)
+            index = json.loads(f.read(end - index_offset).decode('utf-8'))
+        self.fingerprint = index['fingerprint']
+        self.n_rounds = index['n_rounds']
+        self._trials = index['trials']
+        self._raw = np.memmap(self.path, dtype=np.uint8, mode='r')
+
+    def __contains__(self, key: Tuple[str, int, int]) -> bool:
+        return trial_key(*key) in self._trials
+
+    def get(self, task_id: str, group_idx: int, r_idx: int) -> Dict[str, Any]:
+        """按 (task, group, repeat) 取trial，结构与 create_trial_from_params 一致"""
+        entry = self._trials[trial_key(task_id, group_idx, r_idx)]
+        trial = dict(entry['meta'])
+        for name, (offset, shape) in entry['arrays'].items():
+            dtype = np.dtype(ARRAY_FIELDS[name])
+            count = int(np.prod(shape))
+            trial[name] = np.frombuffer(self._raw, dtype=dtype, count=count, offset=offset).reshape(shape)
+        params = trial.get('params', {})
+        if 'n_contexts' in params:
+            trial['contexts'] = [f"context_{i % params['n_contexts']}" for i in range(self.n_rounds)]
+        return trial
+
+
+def open_or_materialise(path, all_params, tasks, n_repeats: int, n_rounds: int) -> TrialStore:
+    """已有且指纹一致则直接映射，否则重新生成"""
+    expected = fingerprint(all_params, tasks, n_repeats, n_rounds)
+    path = Path(path)
+    if path.exists():
+        try:
+            store = TrialStore(path)
+            if store.fingerprint == expected:
+                return store
+        except (ValueError, OSError, KeyError, json.JSONDecodeError):
+            pass
+    materialise(path, all_params, tasks, n_repeats, n_rounds)
+    return TrialStore(path)